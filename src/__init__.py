@@ -1,9 +1,145 @@
 # PE Rollup Synthetic Data Generators
 # Causal mechanism-based data generation for GNN training
+#
+# Generator modules are imported lazily on first attribute access so that
+# `import src` (and subprocess workers that only need one stage) does not
+# pay for pandas/dateutil until a generator is actually used.
 
-from .generate_sites import *
-from .generate_vendors import *
-from .generate_integration_matrix import *
-from .generate_initial_state import *
-from .simulate_switches import *
-from .generate_kpis import *
+import importlib
+import sys
+import types
+
+
+# public names exported by each generator module
+_MODULE_EXPORTS = {
+    'generate_sites': [
+        'ONBOARDING_SCENARIOS', 'generate_sites', 'save_sites',
+    ],
+    'generate_vendors': [
+        'PRICING_RULES', 'get_vendor_catalog', 'calculate_price',
+        'generate_vendors', 'save_vendors',
+    ],
+    'generate_integration_matrix': [
+        'EHR_SCORES', 'get_fixed_integration', 'get_it_msp_integration',
+        'get_rcm_integration', 'get_clearinghouse_integration',
+        'assign_integration_quality', 'generate_integration_matrix',
+        'save_integration_matrix',
+    ],
+    'generate_initial_state': [
+        'calculate_selection_score', 'select_vendor_for_category',
+        'generate_initial_state', 'save_initial_state',
+    ],
+    'simulate_switches': [
+        'INTEGRATION_MULTIPLIERS', 'FATIGUE_MULTIPLIERS', 'CONTAGION_WINDOW', 'get_fatigue_bucket',
+        'calculate_switch_probability', 'recent_neighbour_share',
+        'get_integration_quality', 'select_new_vendor', 'simulate_switches',
+        'save_contracts',
+    ],
+    'generate_kpis': [
+        'assign_vendor_effects', 'assign_site_baselines', 'get_active_vendor',
+        'calculate_integration_bonus', 'INTEGRATION_BONUS_FACTORS', 'INTEGRATION_GAIN_FACTORS',
+        'KPI_REGISTRY', 'LEGACY_KPIS', 'tier_effect', 'register_kpi',
+        'contributions_from_quality', 'pair_quality', 'quality_checksum', 'upgrades_checksum',
+        'build_kpi_contributions',
+        'contribution_stack',
+        'save_kpi_contributions',
+        'load_kpi_contributions', 'generate_kpis', 'save_kpis',
+    ],
+    'encode_tables': [
+        'get_months', 'encode_tables', 'encode_assignments', 'selection_weights',
+        'onboarding_dates', 'join_months',
+    ],
+    'portfolio_spend': [
+        'SPEND_LEVELS', 'contract_intervals', 'interval_totals', 'generate_portfolio_spend',
+        'consolidation_savings', 'save_portfolio_spend', 'save_consolidation_savings',
+    ],
+    'integration_upgrades': [
+        'UPGRADE_EVENTS', 'load_upgrade_events', 'upgrade_events_arg', 'generate_integration_upgrades',
+        'save_integration_upgrades', 'encode_upgrades', 'upgrade_rows', 'quality_as_of',
+        'quality_at', 'quality_snapshots',
+    ],
+    'switch_samples': [
+        'NEGATIVES_PER_POSITIVE', 'SAMPLE_KINDS', 'SPLIT_DATES', 'switch_events',
+        'hard_negatives', 'random_negatives', 'generate_switch_samples',
+        'save_switch_samples', 'load_switch_samples',
+    ],
+    'vectorized_engine': [
+        'default_mechanism', 'draw_switch_uniforms', 'simulate_switch_batch',
+        'kpi_contribution_matrices', 'site_baseline_matrix', 'draw_kpi_noise',
+        'vendor_slots', 'contribution_upgrades', 'generate_kpi_batch', 'contracts_from_history',
+        'active_vendor_history', 'kpi_frame', 'select_initial_vendors',
+        'generate_initial_state_vectorized', 'simulate_switches_vectorized',
+        'generate_kpis_vectorized',
+    ],
+    'pipeline_dag': [
+        'stage_dependencies', 'run_dag', 'critical_path', 'print_timings',
+    ],
+    'cost_model': [
+        'ESTIMATE_LIMITS', 'STAGE_WORK', 'benchmark_pipeline', 'calibrate_cost_model',
+        'save_cost_model', 'load_cost_model', 'estimate_run', 'check_limits', 'print_estimate',
+    ],
+    'spatial_contagion': [
+        'REGION_CENTERS', 'site_coordinates', 'neighbour_graph',
+    ],
+    'sweep_parameters': [
+        'SWEEP_PARAMETERS', 'build_grid', 'sample_configs', 'run_sweep', 'save_sweep',
+    ],
+    'shared_tables': [
+        'static_tables', 'publish_tables', 'attach_tables', 'detach_tables', 'release_blocks', 'share_tables',
+    ],
+    'markov_switches': [
+        'build_switch_chains', 'expected_switches', 'calibrate_base_annual',
+        'vendor_share_frame', 'save_vendor_shares',
+    ],
+    'site_rng': [
+        'RNG_STAGES', 'site_generator', 'site_number', 'generate_sites_keyed',
+        'generate_integration_keyed', 'generate_initial_state_keyed',
+        'simulate_switches_keyed', 'generate_kpis_keyed', 'generate_sites_history',
+        'generate_site_history', 'append_sites',
+    ],
+    'check_equivalence': [
+        'compare_engines', 'print_report',
+    ],
+}
+
+_EXPORTS = {
+    name: module_name
+    for module_name, names in _MODULE_EXPORTS.items()
+    for name in names
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    """Import the owning generator module on first access."""
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+    module = importlib.import_module(f'.{module_name}', __name__)
+
+    # cache every export of the module (this also replaces the submodule
+    # attribute set by the import system, e.g. src.generate_sites)
+    for export in _MODULE_EXPORTS[module_name]:
+        globals()[export] = getattr(module, export)
+
+    return globals()[name]
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+class _Package(types.ModuleType):
+    """Package module whose exports win over submodules of the same name."""
+
+    def __setattr__(self, name, value):
+        # importing src.generate_sites binds the submodule onto the package;
+        # keep the generate_sites function there, as the star imports did
+        if isinstance(value, types.ModuleType) and _EXPORTS.get(name) == name:
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
@@ -0,0 +1,5 @@
+# allow `python -m src <stage> ...`
+
+from .cli import main
+
+main()
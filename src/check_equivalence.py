@@ -0,0 +1,366 @@
+"""
+check_equivalence.py -- statistical equivalence of the vectorized and per-site engines to the loops
+
+Author: Gregory Schwartz
+Date: December 2025
+
+The vectorized engine draws its randomness in a different order, and the
+per-site engine from each site's own stream, so neither output can be
+bit-identical to the loop implementations. Instead every engine is run
+over many seeds on the same worlds and each one's distributions are
+compared with the reference loops':
+
+- initial vendor share by (EHR, category)       chi-square homogeneity
+- switch rate by (integration quality, fatigue)  chi-square on 2x2 tables
+- switch rate by recent neighbour switch         chi-square on 2x2 tables
+- final vendor share by (EHR, category)          chi-square homogeneity
+- KPI mean / variance / seasonality per seed     paired t-tests
+
+Each seed uses one world (sites, vendors, integration matrix) for all
+engines. Switch simulation starts every engine from the reference initial
+state and KPIs use the reference contracts, so each comparison isolates
+one mechanism. p-values are Bonferroni corrected over all tests of both
+comparisons.
+
+With upgrade events all engines get the same integration upgrades delta
+log, and switch rates are binned by the quality in effect each month.
+With contagion all get the same neighbour graph, so the loop's
+recent_neighbour_share and the sparse products in the other engines
+are compared through the switch rate of sites whose neighbours switched
+the category in the last CONTAGION_WINDOW months.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from .encode_tables import encode_tables, encode_assignments, get_months, join_months
+from .generate_sites import generate_sites
+from .generate_vendors import generate_vendors
+from .generate_integration_matrix import generate_integration_matrix
+from .generate_initial_state import generate_initial_state
+from .simulate_switches import CONTAGION_WINDOW, simulate_switches
+from .spatial_contagion import neighbour_graph
+from .generate_kpis import KPI_REGISTRY, generate_kpis
+from .integration_upgrades import generate_integration_upgrades, encode_upgrades, quality_as_of
+from .site_rng import generate_initial_state_keyed, simulate_switches_keyed, generate_kpis_keyed
+from .vectorized_engine import (
+    FATIGUE_EDGES, active_vendor_history, generate_initial_state_vectorized,
+    simulate_switches_vectorized, generate_kpis_vectorized,
+)
+
+
+ENGINES = ['reference', 'vectorized', 'per_site']
+# engines tested against the reference loops
+COMPARED_ENGINES = ENGINES[1:]
+
+
+def share_counts(assignments, tables, ehr_codes, n_ehrs):
+    """Count vendor choices per EHR: (EHR, vendor) matrix from a site x category array.
+
+    Sites without a vendor (-1, not joined yet) are skipped.
+    """
+    n_vendors = len(tables['vendor_ids'])
+    ehr = np.repeat(ehr_codes, assignments.shape[1])
+    held = assignments.ravel() >= 0
+    flat = ehr[held] * n_vendors + assignments.ravel()[held]
+    return np.bincount(flat, minlength=n_ehrs * n_vendors).reshape(n_ehrs, n_vendors)
+
+
+def hazard_counts(history, quality, join_month, upgrades=None, adjacency=None):
+    """Exposures and switches by (current quality, fatigue bucket) from a vendor history.
+
+    A site is exposed from the month after it joined. upgrades (an encoded
+    delta log) changes the quality in effect from each row's month. Also
+    returns exposures and switches by whether any neighbour in adjacency
+    switched the category within CONTAGION_WINDOW months (all 0 without one).
+    """
+    n_months = history.shape[0]
+    site_idx = np.arange(history.shape[1])[:, None]
+
+    exposures = np.zeros((3, 3), dtype=np.int64)
+    switches = np.zeros((3, 3), dtype=np.int64)
+    neighbour_exposures = np.zeros(2, dtype=np.int64)
+    neighbour_switches = np.zeros(2, dtype=np.int64)
+    last_change = np.broadcast_to(join_month[:, None], history.shape[1:]).copy()
+    # month of each (site, category)'s latest switch, far in the past until it has one
+    last_switch = np.full(history.shape[1:], -CONTAGION_WINDOW - 1)
+
+    for t in range(1, n_months):
+        current = history[t - 1]
+        active = np.broadcast_to((join_month < t)[:, None], current.shape)
+        month_quality = quality if upgrades is None else quality_as_of(quality, upgrades, t)
+        q = month_quality[site_idx, current]
+        bucket = np.digitize(t - last_change, FATIGUE_EDGES)
+        switched = (history[t] != current) & active
+
+        neighbour_switched = np.zeros(current.shape, dtype=np.int64)
+        if adjacency is not None:
+            recent = (t - last_switch <= CONTAGION_WINDOW).astype(np.float64)
+            neighbour_switched = (adjacency @ recent > 0).astype(np.int64)
+
+        np.add.at(exposures, (q[active], bucket[active]), 1)
+        np.add.at(switches, (q[switched], bucket[switched]), 1)
+        np.add.at(neighbour_exposures, neighbour_switched[active], 1)
+        np.add.at(neighbour_switches, neighbour_switched[switched], 1)
+        last_change[switched] = t
+        last_switch[switched] = t
+
+    return exposures, switches, neighbour_exposures, neighbour_switches
+
+
+def kpi_summary(kpis_df):
+    """Mean, variance and calendar-month profile of each registered KPI."""
+    month_num = pd.to_datetime(kpis_df['month']).dt.month
+    summary = {}
+    for kpi in KPI_REGISTRY:
+        values = kpis_df[kpi]
+        summary[f'{kpi}_mean'] = values.mean()
+        summary[f'{kpi}_var'] = values.var()
+        # seasonality: deviation from each site's own mean
+        centered = values - values.groupby(kpis_df['site_id']).transform('mean')
+        summary[f'{kpi}_season'] = centered.groupby(month_num).mean().reindex(range(1, 13)).to_numpy()
+    return summary
+
+
+def run_seed(seed, n_sites=30, start_date='2019-01-01', end_date='2024-12-31', onboarding='baseline',
+             upgrade_events=None, contagion=0.0):
+    """Run every engine on one world and return their summary statistics.
+
+    upgrade_events (see integration_upgrades.UPGRADE_EVENTS) gives all
+    engines the same dated integration upgrades; None keeps quality fixed.
+    contagion > 0 runs all on the world's neighbour graph.
+    """
+    sites = generate_sites(n_sites=n_sites, seed=seed, onboarding=onboarding)
+    vendors = generate_vendors(seed=seed)
+    integration = generate_integration_matrix(sites, vendors, seed=seed)
+
+    tables = encode_tables(sites, vendors, integration)
+    months = get_months(start_date, end_date)
+
+    upgrades_df, upgrades = None, None
+    if upgrade_events is not None:
+        upgrades_df = generate_integration_upgrades(sites, vendors, integration, upgrade_events)
+        upgrades = encode_upgrades(upgrades_df, tables, months)
+
+    adjacency = neighbour_graph(sites, seed) if contagion else None
+    ehr_names = sorted(sites['ehr_system'].unique())
+    ehr_codes = pd.Index(ehr_names).get_indexer(sites['ehr_system'])
+
+    initial_fns = {
+        'reference': generate_initial_state,
+        'vectorized': generate_initial_state_vectorized,
+        'per_site': generate_initial_state_keyed,
+    }
+    switch_fns = {
+        'reference': simulate_switches,
+        'vectorized': simulate_switches_vectorized,
+        'per_site': simulate_switches_keyed,
+    }
+    kpi_fns = {
+        'reference': generate_kpis,
+        'vectorized': generate_kpis_vectorized,
+        'per_site': generate_kpis_keyed,
+    }
+
+    reference_initial = generate_initial_state(sites, vendors, integration, seed=seed, start_date=start_date)
+    reference_contracts = None
+
+    result = {'ehr_names': ehr_names}
+    for engine in ENGINES:
+        initial = initial_fns[engine](sites, vendors, integration, seed=seed, start_date=start_date)
+
+        contracts = switch_fns[engine](
+            sites, vendors, integration, reference_initial,
+            start_date=start_date, end_date=end_date, seed=seed,
+            contagion=contagion, adjacency=adjacency, integration_upgrades=upgrades_df
+        )
+        if engine == 'reference':
+            reference_contracts = contracts
+        history = active_vendor_history(contracts, tables, months, lag_switch_month=False)
+
+        kpis = kpi_fns[engine](
+            sites, vendors, integration, reference_contracts,
+            start_date=start_date, end_date=end_date, seed=seed, integration_upgrades=upgrades_df
+        )
+
+        exposures, switches, neighbour_exposures, neighbour_switches = hazard_counts(
+            history, tables['quality'], join_months(sites, months), upgrades, adjacency)
+        result[engine] = {
+            'initial_share': pd.DataFrame(
+                share_counts(encode_assignments(initial, tables), tables, ehr_codes, len(ehr_names)),
+                index=ehr_names, columns=tables['vendor_ids']),
+            'final_share': pd.DataFrame(
+                share_counts(history[-1], tables, ehr_codes, len(ehr_names)),
+                index=ehr_names, columns=tables['vendor_ids']),
+            'exposures': exposures,
+            'switches': switches,
+            'neighbour_exposures': neighbour_exposures,
+            'neighbour_switches': neighbour_switches,
+            'kpis': kpi_summary(kpis),
+        }
+
+    result['vendor_category'] = dict(zip(vendors['vendor_id'], vendors['category']))
+    return result
+
+
+def share_tests(name, reference, compared, vendor_category):
+    """Chi-square homogeneity test per (EHR, category) of vendor counts."""
+    rows = []
+    for ehr in reference.index:
+        for category in sorted(set(vendor_category.values())):
+            vendors = [v for v, c in vendor_category.items() if c == category]
+            table = np.array([reference.loc[ehr, vendors], compared.loc[ehr, vendors]])
+            table = table[:, table.sum(axis=0) > 0]
+            if table.shape[1] < 2 or table.sum() < 20:
+                continue
+
+            chi2, p_value, _, _ = stats.chi2_contingency(table)
+            rows.append({
+                'check': f'{name}[{ehr}, {category}]',
+                'statistic': chi2,
+                'p_value': p_value,
+                'reference': np.round(table[0] / table[0].sum(), 3).tolist(),
+                'compared': np.round(table[1] / table[1].sum(), 3).tolist(),
+            })
+    return rows
+
+
+def rate_test(check, ref_k, ref_n, cmp_k, cmp_n):
+    """Chi-square test that two switch counts come from the same monthly rate."""
+    table = np.array([[ref_k, ref_n - ref_k], [cmp_k, cmp_n - cmp_k]])
+    chi2, p_value, _, _ = stats.chi2_contingency(table)
+    return {
+        'check': check,
+        'statistic': chi2,
+        'p_value': p_value,
+        'reference': ref_k / ref_n,
+        'compared': cmp_k / cmp_n,
+    }
+
+
+def hazard_tests(reference, compared):
+    """Switch rate overall, per quality, per (quality, fatigue bucket) cell and by recent neighbour switch."""
+    ref_n, ref_k = reference['exposures'], reference['switches']
+    cmp_n, cmp_k = compared['exposures'], compared['switches']
+
+    rows = [rate_test('switch_rate[all]', ref_k.sum(), ref_n.sum(), cmp_k.sum(), cmp_n.sum())]
+
+    for q in range(3):
+        if ref_k[q].sum() + cmp_k[q].sum() >= 10:
+            rows.append(rate_test(f'switch_rate[quality={q}]',
+                                  ref_k[q].sum(), ref_n[q].sum(), cmp_k[q].sum(), cmp_n[q].sum()))
+
+    for q in range(3):
+        for b in range(3):
+            if ref_k[q, b] + cmp_k[q, b] >= 10:
+                rows.append(rate_test(f'switch_rate[quality={q}, fatigue={b}]',
+                                      ref_k[q, b], ref_n[q, b], cmp_k[q, b], cmp_n[q, b]))
+
+    # only sites with a recent neighbour switch feel contagion (none without a graph)
+    ref_n, ref_k = reference['neighbour_exposures'], reference['neighbour_switches']
+    cmp_n, cmp_k = compared['neighbour_exposures'], compared['neighbour_switches']
+    if ref_n[1] + cmp_n[1] == 0:
+        return rows
+    for n in range(2):
+        if ref_k[n] + cmp_k[n] >= 10 and ref_n[n] and cmp_n[n]:
+            rows.append(rate_test(f'switch_rate[neighbour_switched={n}]', ref_k[n], ref_n[n], cmp_k[n], cmp_n[n]))
+    return rows
+
+
+def kpi_tests(per_seed, engine):
+    """Paired t-tests over seeds of one engine's KPI mean, variance and seasonal profile."""
+    rows = []
+    for kpi in KPI_REGISTRY:
+        for stat in ['mean', 'var']:
+            ref = np.array([r['reference']['kpis'][f'{kpi}_{stat}'] for r in per_seed])
+            cmp = np.array([r[engine]['kpis'][f'{kpi}_{stat}'] for r in per_seed])
+            t_stat, p_value = stats.ttest_rel(ref, cmp)
+            rows.append({
+                'check': f'{kpi}_{stat}',
+                'statistic': t_stat,
+                'p_value': p_value,
+                'reference': ref.mean(),
+                'compared': cmp.mean(),
+            })
+
+        ref = np.array([r['reference']['kpis'][f'{kpi}_season'] for r in per_seed])
+        cmp = np.array([r[engine]['kpis'][f'{kpi}_season'] for r in per_seed])
+        for m in range(12):
+            t_stat, p_value = stats.ttest_rel(ref[:, m], cmp[:, m])
+            rows.append({
+                'check': f'{kpi}_season[month={m + 1}]',
+                'statistic': t_stat,
+                'p_value': p_value,
+                'reference': ref[:, m].mean(),
+                'compared': cmp[:, m].mean(),
+            })
+    return rows
+
+
+def compare_engines(n_seeds=20, n_sites=30, start_date='2019-01-01', end_date='2024-12-31',
+                    alpha=0.01, first_seed=0, n_workers=1, onboarding='baseline', upgrade_events=None,
+                    contagion=0.0):
+    """Run every engine over many seeds and test each one's distributions against the loops.
+
+    Returns one row per (compared engine, test); a test fails when its
+    p-value is below alpha Bonferroni corrected over all rows.
+    """
+    seeds = list(range(first_seed, first_seed + n_seeds))
+    args = [(seed, n_sites, start_date, end_date, onboarding, upgrade_events, contagion) for seed in seeds]
+
+    if n_workers <= 1:
+        per_seed = [run_seed(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            per_seed = list(pool.map(run_seed, *zip(*args)))
+
+    # pool counts across seeds (EHR sets can differ per world)
+    pooled = {}
+    for engine in ENGINES:
+        pooled[engine] = {
+            'initial_share': reduce(lambda a, b: a.add(b, fill_value=0),
+                                    [r[engine]['initial_share'] for r in per_seed]),
+            'final_share': reduce(lambda a, b: a.add(b, fill_value=0),
+                                  [r[engine]['final_share'] for r in per_seed]),
+            'exposures': sum(r[engine]['exposures'] for r in per_seed),
+            'switches': sum(r[engine]['switches'] for r in per_seed),
+            'neighbour_exposures': sum(r[engine]['neighbour_exposures'] for r in per_seed),
+            'neighbour_switches': sum(r[engine]['neighbour_switches'] for r in per_seed),
+        }
+    vendor_category = per_seed[0]['vendor_category']
+
+    rows = []
+    for engine in COMPARED_ENGINES:
+        engine_rows = []
+        engine_rows += share_tests('initial_share', pooled['reference']['initial_share'],
+                                   pooled[engine]['initial_share'], vendor_category)
+        engine_rows += hazard_tests(pooled['reference'], pooled[engine])
+        engine_rows += share_tests('final_share', pooled['reference']['final_share'],
+                                   pooled[engine]['final_share'], vendor_category)
+        engine_rows += kpi_tests(per_seed, engine)
+        rows += [{'engine': engine, **row} for row in engine_rows]
+
+    report = pd.DataFrame(rows)
+    report['threshold'] = alpha / len(report)
+    report['passed'] = report['p_value'] >= report['threshold']
+    return report
+
+
+def print_report(report):
+    """Print the test table, failures per compared engine and an overall verdict."""
+    with pd.option_context('display.width', 160, 'display.max_colwidth', 50, 'display.max_rows', None):
+        print(report[['engine', 'check', 'p_value', 'reference', 'compared', 'passed']].to_string(index=False))
+
+    n_failed = (~report['passed']).sum()
+    print(f'\n{len(report)} tests, {n_failed} failed '
+          f'(Bonferroni threshold p < {report["threshold"].iloc[0]:.2e})')
+    for engine, passed in report.groupby('engine', sort=False)['passed']:
+        print(f'  {engine} vs reference: {len(passed)} tests, {(~passed).sum()} failed')
+    if n_failed:
+        print('ENGINES DIVERGE')
+    else:
+        print('ENGINES EQUIVALENT')
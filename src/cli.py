@@ -0,0 +1,473 @@
+"""
+cli.py -- single entry point for running pipeline stages
+
+Author: Gregory Schwartz
+Date: December 2025
+
+Usage:
+    python3 cli.py sites --seed 42 --n_sites 100 --output data/generated
+    python3 cli.py integration --seed 42 --output data/generated
+    python3 cli.py simulate --seed 42 --output data/generated
+    python3 cli.py kpis --seed 42 --output data/generated
+    python3 cli.py simulate --upgrades --output data/generated
+    python3 cli.py samples --hard_negatives 2 --random_negatives 3
+    python3 cli.py spend --output data/generated
+    python3 cli.py all --seed 42 --n_sites 100 --output data/generated
+    python3 cli.py sweep --grid base_annual=0.03,0.05,0.08 --workers 4
+    python3 cli.py sweep --sample 200 --range integration_mult_0=1.5:3.0
+    python3 cli.py analytic --n_sites 10000 --target_rate 0.05
+    python3 cli.py all --engine per_site --n_sites 100
+    python3 cli.py all --engine vectorized --workers 4
+    python3 cli.py all --engine vectorized --contagion 3.0
+    python3 cli.py all --engine vectorized --upgrades
+    python3 cli.py all --engine vectorized --onboarding growth
+    python3 cli.py all --estimate --n_sites 100000 --engine vectorized
+    python3 cli.py grow --n_new 10
+    python3 cli.py site --site_id S057
+    python3 cli.py equivalence --n_seeds 20 --workers 4
+
+Each subcommand imports only the generator modules its stage needs, so
+short jobs and subprocess workers skip loading the rest of the pipeline.
+Stages read their inputs from (and write their outputs to) --output.
+"""
+
+import time
+
+_CLI_START = time.perf_counter()
+
+import argparse
+import importlib
+import os
+import sys
+from pathlib import Path
+
+# run as a script: import the rest of src as a package, not as top-level modules
+if not __package__:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    __package__ = Path(__file__).resolve().parent.name
+
+
+# generator modules needed by each stage
+STAGE_MODULES = {
+    'sites': ['generate_sites', 'generate_vendors'],
+    'integration': ['generate_integration_matrix', 'generate_kpis'],
+    'simulate': ['generate_initial_state', 'simulate_switches', 'integration_upgrades'],
+    'kpis': ['generate_kpis', 'integration_upgrades'],
+    'samples': ['switch_samples', 'integration_upgrades'],
+    'spend': ['portfolio_spend'],
+    'all': ['generate_all_data'],
+    'sweep': ['sweep_parameters'],
+    'analytic': ['markov_switches'],
+    'grow': ['site_rng', 'generate_all_data'],
+    'site': ['site_rng'],
+    'equivalence': ['check_equivalence'],
+}
+
+
+def stage_upgrades(args, sites, vendors, integration_matrix):
+    """Integration upgrade delta log for --upgrades (None when off)."""
+    from .integration_upgrades import upgrade_events_arg, generate_integration_upgrades
+
+    upgrade_events = upgrade_events_arg(args.upgrades)
+    if upgrade_events is None:
+        return None
+    return generate_integration_upgrades(sites, vendors, integration_matrix, upgrade_events)
+
+
+def run_sites(args):
+    """Steps 1-2: sites and vendor catalog."""
+    from .generate_sites import generate_sites, save_sites
+    from .generate_vendors import generate_vendors, save_vendors
+
+    sites = generate_sites(n_sites=args.n_sites, seed=args.seed, onboarding=args.onboarding)
+    save_sites(sites, f'{args.output}/sites.csv')
+
+    vendors = generate_vendors(seed=args.seed)
+    save_vendors(vendors, f'{args.output}/vendors.csv')
+
+
+def run_integration(args):
+    """Step 3: site x vendor integration matrix."""
+    import pandas as pd
+    from .generate_integration_matrix import generate_integration_matrix, save_integration_matrix
+    from .generate_kpis import assign_vendor_effects, build_kpi_contributions, save_kpi_contributions
+
+    sites = pd.read_csv(f'{args.output}/sites.csv')
+    vendors = pd.read_csv(f'{args.output}/vendors.csv')
+
+    integration_matrix = generate_integration_matrix(sites, vendors, seed=args.seed)
+    save_integration_matrix(integration_matrix, f'{args.output}/integration_matrix.csv')
+
+    contributions = build_kpi_contributions(
+        sites, vendors, integration_matrix, assign_vendor_effects(vendors, args.seed), seed=args.seed
+    )
+    save_kpi_contributions(contributions, f'{args.output}/kpi_contributions.npz')
+
+
+def run_simulate(args):
+    """Steps 4-5: initial contracts and switch simulation."""
+    import pandas as pd
+    from .generate_initial_state import generate_initial_state, save_initial_state
+    from .simulate_switches import simulate_switches, save_contracts
+
+    sites = pd.read_csv(f'{args.output}/sites.csv')
+    vendors = pd.read_csv(f'{args.output}/vendors.csv')
+    integration_matrix = pd.read_csv(f'{args.output}/integration_matrix.csv')
+
+    initial_state = generate_initial_state(sites, vendors, integration_matrix, seed=args.seed)
+    save_initial_state(initial_state, f'{args.output}/initial_state_2019.csv')
+
+    upgrades = stage_upgrades(args, sites, vendors, integration_matrix)
+    if upgrades is not None:
+        from .integration_upgrades import save_integration_upgrades
+
+        save_integration_upgrades(upgrades, f'{args.output}/integration_upgrades.csv')
+
+    base_annual = 0.05
+    if args.target_switch_rate is not None:
+        from .encode_tables import encode_tables, get_months, join_months
+        from .integration_upgrades import encode_upgrades
+        from .markov_switches import build_switch_chains, calibrate_base_annual
+
+        tables = encode_tables(sites, vendors, integration_matrix)
+        months = get_months('2019-01-01', '2024-12-31')
+        chains = build_switch_chains(
+            tables, join_month=join_months(sites, months),
+            upgrades=None if upgrades is None else encode_upgrades(upgrades, tables, months)
+        )
+        base_annual = calibrate_base_annual(chains, len(months), args.target_switch_rate)
+        print(f'Calibrated base_annual={base_annual:.4f} for {args.target_switch_rate:.1%} annual switches')
+
+    adjacency = None
+    if args.contagion:
+        from .spatial_contagion import neighbour_graph
+
+        adjacency = neighbour_graph(sites, args.seed)
+
+    contracts = simulate_switches(
+        sites, vendors, integration_matrix, initial_state,
+        start_date='2019-01-01', end_date='2024-12-31', seed=args.seed,
+        base_annual=base_annual, contagion=args.contagion, adjacency=adjacency, integration_upgrades=upgrades
+    )
+    save_contracts(contracts, f'{args.output}/contracts_2019_2024.csv')
+
+
+def run_kpis(args):
+    """Step 6: monthly KPI time series."""
+    import pandas as pd
+    from .generate_kpis import (
+        KPI_REGISTRY, generate_kpis, save_kpis, load_kpi_contributions, pair_quality, quality_checksum,
+        upgrades_checksum,
+    )
+
+    sites = pd.read_csv(f'{args.output}/sites.csv')
+    vendors = pd.read_csv(f'{args.output}/vendors.csv')
+    integration_matrix = pd.read_csv(f'{args.output}/integration_matrix.csv')
+    contracts = pd.read_csv(f'{args.output}/contracts_2019_2024.csv')
+    upgrades = stage_upgrades(args, sites, vendors, integration_matrix)
+
+    # reuse cached contribution matrices built from these tables, seed and upgrades, for every kpi
+    contributions = None
+    cache_path = f'{args.output}/kpi_contributions.npz'
+    if os.path.exists(cache_path):
+        cached = load_kpi_contributions(cache_path)
+        checksum = quality_checksum(pair_quality(integration_matrix, sites['site_id'], vendors['vendor_id']))
+        if (list(cached['site_ids']) == list(sites['site_id']) and
+                list(cached['vendor_ids']) == list(vendors['vendor_id']) and
+                'seed' in cached and int(cached['seed']) == args.seed and
+                'quality_checksum' in cached and int(cached['quality_checksum']) == checksum and
+                'upgrades_checksum' in cached and int(cached['upgrades_checksum']) == upgrades_checksum(upgrades) and
+                all(kpi in cached for kpi in KPI_REGISTRY)):
+            contributions = cached
+            print(f'Using cached KPI contributions from {cache_path}')
+
+    kpis = generate_kpis(
+        sites, vendors, integration_matrix, contracts,
+        start_date='2019-01-01', end_date='2024-12-31', seed=args.seed,
+        contributions=contributions, integration_upgrades=upgrades
+    )
+    save_kpis(kpis, f'{args.output}/kpis.csv')
+
+
+def run_samples(args):
+    """Labelled switch links with negatives for link prediction."""
+    import pandas as pd
+    from .switch_samples import generate_switch_samples, save_switch_samples
+
+    sites = pd.read_csv(f'{args.output}/sites.csv')
+    vendors = pd.read_csv(f'{args.output}/vendors.csv')
+    integration_matrix = pd.read_csv(f'{args.output}/integration_matrix.csv')
+    contracts = pd.read_csv(f'{args.output}/contracts_2019_2024.csv')
+
+    samples = generate_switch_samples(
+        sites, vendors, integration_matrix, contracts,
+        start_date='2019-01-01', end_date='2024-12-31', seed=args.seed,
+        n_hard=args.hard_negatives, n_random=args.random_negatives,
+        integration_upgrades=stage_upgrades(args, sites, vendors, integration_matrix)
+    )
+    save_switch_samples(samples, f'{args.output}/switch_samples.npz')
+
+
+def run_spend(args):
+    """Monthly portfolio spend and single-vendor consolidation savings."""
+    import pandas as pd
+    from .portfolio_spend import (generate_portfolio_spend, consolidation_savings, save_portfolio_spend,
+                                 save_consolidation_savings)
+
+    sites = pd.read_csv(f'{args.output}/sites.csv')
+    vendors = pd.read_csv(f'{args.output}/vendors.csv')
+    contracts = pd.read_csv(f'{args.output}/contracts_2019_2024.csv')
+
+    spend = generate_portfolio_spend(sites, vendors, contracts, start_date='2019-01-01', end_date='2024-12-31')
+    save_portfolio_spend(spend, f'{args.output}/portfolio_spend.csv')
+    save_consolidation_savings(consolidation_savings(spend, vendors), f'{args.output}/consolidation_savings.csv')
+
+
+def run_all(args):
+    """Steps 1-6 via the master pipeline (or --estimate its cost)."""
+    from .generate_all_data import run_pipeline, estimate_pipeline
+    from .integration_upgrades import upgrade_events_arg
+
+    if args.estimate:
+        estimate_pipeline(
+            n_sites=args.n_sites, engine=args.engine, start_date=args.start_date, end_date=args.end_date,
+            n_vendors=args.n_vendors, target_switch_rate=args.target_switch_rate,
+            cost_model_path=args.cost_model,
+            limits={'runtime_minutes': args.max_minutes, 'memory_gb': args.max_memory_gb,
+                    'disk_gb': args.max_disk_gb},
+            n_hard=args.hard_negatives, n_random=args.random_negatives, onboarding=args.onboarding
+        )
+        return
+
+    run_pipeline(seed=args.seed, n_sites=args.n_sites, output_dir=args.output,
+                 target_switch_rate=args.target_switch_rate, engine=args.engine,
+                 n_workers=args.workers, contagion=args.contagion,
+                 start_date=args.start_date, end_date=args.end_date,
+                 upgrade_events=upgrade_events_arg(args.upgrades),
+                 n_hard=args.hard_negatives, n_random=args.random_negatives,
+                 onboarding=args.onboarding)
+
+
+def run_sweep(args):
+    """Parameter sweep of the switching mechanism."""
+    import pandas as pd
+    from .sweep_parameters import build_grid, sample_configs, save_sweep
+    from .sweep_parameters import run_sweep as run_parameter_sweep
+
+    sites = pd.read_csv(f'{args.output}/sites.csv')
+    vendors = pd.read_csv(f'{args.output}/vendors.csv')
+    integration_matrix = pd.read_csv(f'{args.output}/integration_matrix.csv')
+    initial_state = pd.read_csv(f'{args.output}/initial_state_2019.csv')
+
+    if args.sample:
+        ranges = {}
+        for spec in args.range or []:
+            name, bounds = spec.split('=')
+            low, high = bounds.split(':')
+            ranges[name] = (float(low), float(high))
+        configs = sample_configs(ranges, args.sample, seed=args.seed)
+    else:
+        grid = {}
+        for spec in args.grid or []:
+            name, values = spec.split('=')
+            grid[name] = [float(v) for v in values.split(',')]
+        configs = build_grid(grid)
+
+    print(f'Evaluating {len(configs)} configurations on {args.workers} worker(s)...')
+    results = run_parameter_sweep(
+        sites, vendors, integration_matrix, initial_state, configs,
+        start_date='2019-01-01', end_date='2024-12-31', seed=args.seed,
+        n_workers=args.workers, chunk_size=args.chunk_size
+    )
+    save_sweep(results, f'{args.output}/sweep_results.csv')
+
+
+def run_analytic(args):
+    """Expected switches and vendor shares from the Markov chains."""
+    import pandas as pd
+    from .encode_tables import encode_tables, get_months, join_months
+    from .markov_switches import (
+        build_switch_chains, expected_switches, calibrate_base_annual,
+        vendor_share_frame, save_vendor_shares,
+    )
+
+    sites = pd.read_csv(f'{args.output}/sites.csv')
+    vendors = pd.read_csv(f'{args.output}/vendors.csv')
+    integration_matrix = pd.read_csv(f'{args.output}/integration_matrix.csv')
+
+    tables = encode_tables(sites, vendors, integration_matrix)
+    months = get_months('2019-01-01', '2024-12-31')
+    chains = build_switch_chains(tables, join_month=join_months(sites, months))
+
+    base_annual = args.base_annual
+    if args.target_rate is not None:
+        base_annual = calibrate_base_annual(chains, len(months), args.target_rate)
+        print(f'Calibrated base_annual: {base_annual:.4f} (target {args.target_rate:.1%})')
+
+    result = expected_switches(chains, len(months), base_annual, n_sites=args.n_sites)
+
+    print(f'Site types (chains): {len(chains["count"])}')
+    print(f'Sites: {result["n_sites"]}')
+    print(f'Expected switches (2019-2024): {result["expected_switches"]:.1f}')
+    print(f'Annual switch rate: {result["annual_switch_rate"] * 100:.2f}%')
+    for q in range(3):
+        print(f'  from quality {q}: {result["switches_by_quality"][q]:.1f}')
+
+    save_vendor_shares(vendor_share_frame(result, tables, months),
+                       f'{args.output}/expected_vendor_shares.csv')
+
+
+def run_grow(args):
+    """Append sites to a per-site-stream dataset, replaying its generation options."""
+    from .site_rng import append_sites
+
+    append_sites(args.output, args.n_new, seed=args.seed, onboarding=args.onboarding)
+
+
+def run_site(args):
+    """Generate one site's full history from its own streams."""
+    from .site_rng import generate_site_history
+
+    history = generate_site_history(args.site_id, seed=args.seed, onboarding=args.onboarding)
+
+    site_dir = f'{args.output}/site_{args.site_id}'
+    os.makedirs(site_dir, exist_ok=True)
+    for name, df in history.items():
+        df.to_csv(f'{site_dir}/{name}.csv', index=False)
+
+    print(history['sites'].to_string(index=False))
+    print(f'\nContracts: {len(history["contracts_2019_2024"])}')
+    print(f'Saved site history to {site_dir}')
+
+
+def run_equivalence(args):
+    """Statistical equivalence check of the vectorized and per-site engines vs the loops."""
+    from .check_equivalence import ENGINES, compare_engines, print_report
+    from .integration_upgrades import upgrade_events_arg
+
+    print(f'Running {len(ENGINES)} engines on {args.n_seeds} seeds x {args.n_sites} sites...')
+    report = compare_engines(
+        n_seeds=args.n_seeds, n_sites=args.n_sites, alpha=args.alpha,
+        first_seed=args.seed, n_workers=args.workers, onboarding=args.onboarding,
+        upgrade_events=upgrade_events_arg(args.upgrades), contagion=args.contagion
+    )
+    report.to_csv(f'{args.output}/equivalence_report.csv', index=False)
+    print_report(report)
+
+    if not report['passed'].all():
+        sys.exit(1)
+
+
+STAGE_RUNNERS = {
+    'sites': run_sites,
+    'integration': run_integration,
+    'simulate': run_simulate,
+    'kpis': run_kpis,
+    'samples': run_samples,
+    'spend': run_spend,
+    'all': run_all,
+    'sweep': run_sweep,
+    'analytic': run_analytic,
+    'grow': run_grow,
+    'site': run_site,
+    'equivalence': run_equivalence,
+}
+
+
+def build_parser():
+    """Build the argument parser with one subcommand per stage."""
+    parser = argparse.ArgumentParser(description='Run synthetic data pipeline stages')
+    subparsers = parser.add_subparsers(dest='stage', required=True)
+
+    for stage, runner in STAGE_RUNNERS.items():
+        sub = subparsers.add_parser(stage, help=runner.__doc__)
+        sub.add_argument('--seed', type=int, default=42, help='Random seed')
+        sub.add_argument('--output', type=str, default='data/generated', help='Data directory')
+        if stage in ('sites', 'all'):
+            sub.add_argument('--n_sites', type=int, default=100, help='Number of sites')
+        if stage in ('sites', 'all', 'equivalence', 'grow', 'site'):
+            sub.add_argument('--onboarding', type=str, default='baseline', choices=['baseline', 'growth'],
+                             help='When sites join: during 2019 or an acquisition roll-up over all years')
+        if stage in ('simulate', 'kpis', 'samples', 'all', 'equivalence'):
+            sub.add_argument('--upgrades', nargs='?', const='default', default=None, metavar='EVENTS_CSV',
+                             help='Apply dated integration upgrades (built-in events, or a csv of them)')
+        if stage == 'all':
+            sub.add_argument('--engine', type=str, default='reference',
+                             choices=['reference', 'vectorized', 'per_site'],
+                             help='Reference loops, vectorized arrays or per-site random streams')
+            sub.add_argument('--workers', type=int, default=4,
+                             help='Threads running independent stages (1 = one stage at a time)')
+            sub.add_argument('--start_date', type=str, default='2019-01-01', help='First simulated month')
+            sub.add_argument('--end_date', type=str, default='2024-12-31', help='Last simulated month')
+            sub.add_argument('--estimate', action='store_true',
+                             help='Predict runtime, peak memory and output sizes instead of generating')
+            sub.add_argument('--n_vendors', type=int, default=None, help='Catalog size to assume for --estimate')
+            sub.add_argument('--cost_model', type=str, default=None,
+                             help='Fitted cost model json (default: the one shipped in src/)')
+            sub.add_argument('--max_minutes', type=float, default=None,
+                             help='Runtime limit for --estimate (default 60)')
+            sub.add_argument('--max_memory_gb', type=float, default=None,
+                             help='Memory limit for --estimate (default 16)')
+            sub.add_argument('--max_disk_gb', type=float, default=None,
+                             help='Output size limit for --estimate (default 20)')
+        if stage in ('samples', 'all'):
+            sub.add_argument('--hard_negatives', type=int, default=2,
+                             help='Same-site negatives per switch in switch_samples.npz')
+            sub.add_argument('--random_negatives', type=int, default=3,
+                             help='Random-site negatives per switch in switch_samples.npz')
+        if stage == 'grow':
+            sub.add_argument('--n_new', type=int, required=True, help='Number of sites to append')
+            # seed and onboarding come from the dataset; given, they must match it
+            sub.set_defaults(seed=None, onboarding=None)
+        if stage == 'site':
+            sub.add_argument('--site_id', type=str, required=True, help='Site to generate, e.g. S057')
+        if stage in ('simulate', 'all'):
+            sub.add_argument('--target_switch_rate', type=float, default=None,
+                             help='Calibrate base_annual analytically to this annual switch rate')
+        if stage in ('simulate', 'all', 'equivalence'):
+            sub.add_argument('--contagion', type=float, default=0.0,
+                             help="Hazard boost from neighbouring sites' recent switches (0 = off)")
+        if stage == 'analytic':
+            sub.add_argument('--n_sites', type=int, default=None,
+                             help='Scale expectations to this many sites (same site mix)')
+            sub.add_argument('--base_annual', type=float, default=0.05, help='Base annual switch rate')
+            sub.add_argument('--target_rate', type=float, default=None,
+                             help='Solve for base_annual hitting this annual switch rate')
+        if stage == 'equivalence':
+            sub.add_argument('--n_seeds', type=int, default=20, help='Seeds per engine')
+            sub.add_argument('--n_sites', type=int, default=30, help='Sites per seed')
+            sub.add_argument('--alpha', type=float, default=0.01, help='Family-wise significance level')
+            sub.add_argument('--workers', type=int, default=4, help='Worker processes')
+        if stage == 'sweep':
+            sub.add_argument('--grid', action='append', metavar='NAME=V1,V2,...',
+                             help='Grid values for one parameter (repeatable)')
+            sub.add_argument('--sample', type=int, default=0,
+                             help='Number of random configurations instead of a grid')
+            sub.add_argument('--range', action='append', metavar='NAME=LOW:HIGH',
+                             help='Sampling range for one parameter (repeatable)')
+            sub.add_argument('--workers', type=int, default=1, help='Worker processes')
+            sub.add_argument('--chunk_size', type=int, default=16, help='Configurations per batch')
+
+    return parser
+
+
+def main(argv=None):
+    """Parse arguments, import the stage's modules and run it."""
+    args = build_parser().parse_args(argv)
+    os.makedirs(args.output, exist_ok=True)
+
+    # import only what the stage needs, timing the cold start
+    for module_name in STAGE_MODULES[args.stage]:
+        importlib.import_module(f'.{module_name}', __package__)
+    imports_done = time.perf_counter()
+
+    STAGE_RUNNERS[args.stage](args)
+    stage_done = time.perf_counter()
+
+    print(f'\n[{args.stage}] startup: {imports_done - _CLI_START:.3f}s  '
+          f'stage: {stage_done - imports_done:.3f}s  '
+          f'total: {stage_done - _CLI_START:.3f}s')
+
+
+if __name__ == '__main__':
+    main()
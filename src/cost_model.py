@@ -0,0 +1,556 @@
+"""
+cost_model.py -- runtime, memory and output size estimates for pipeline runs
+
+Author: Gregory Schwartz
+Date: December 2025
+
+Each stage's cost is modelled as a + b * work, where work counts the
+dominant loop of that stage in that engine. In the reference engine the
+lookups filter whole dataframes, so some stages grow with n_sites^2. The
+coefficients are fitted to timings (run_dag) and allocation peaks
+(tracemalloc) from benchmark runs of the real pipeline.
+Output sizes use bytes per row measured on the files those runs wrote.
+
+The reference loops visit a site only from the month it joins (baseline
+sites join during 2019), so their terms count expected active months (A)
+rather than the horizon. Their benchmarks go up to a few hundred sites:
+below that a dataframe filter costs about the same whatever its length,
+and the n_sites^2 terms come out too small. Each engine is then run
+once more at a larger, held-out size and the prediction error is stored
+with the model (and printed) so a bad extrapolation shows before the
+json is shipped.
+
+Usage:
+    python3 cost_model.py --calibrate --output cost_model.json
+    python3 cost_model.py --validate
+    python3 generate_all_data.py --estimate --n_sites 5000 --engine vectorized
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# run as a script: import the rest of src as a package, not as top-level modules
+if not __package__:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    __package__ = Path(__file__).resolve().parent.name
+
+from .encode_tables import get_months
+from .generate_kpis import KPI_REGISTRY
+from .generate_sites import ONBOARDING_SCENARIOS
+from .generate_vendors import get_vendor_catalog
+from .pipeline_dag import stage_dependencies
+from .switch_samples import NEGATIVES_PER_POSITIVE
+
+
+# limits a planned run is checked against
+ESTIMATE_LIMITS = {
+    'runtime_minutes': 60.0,
+    'memory_gb': 16.0,
+    'disk_gb': 20.0,
+}
+
+# work terms in run dimensions: S sites, T months, A expected months a site is
+# active (after onboarding), V vendors, C categories, K kpis, N negatives per
+# switch, R regions
+WORK_TERMS = {
+    'sites': lambda d: d['S'],
+    'vendors': lambda d: d['V'],
+    'pairs': lambda d: d['S'] * d['V'],
+    'site_categories': lambda d: d['S'] * d['C'],
+    'vendor_kpis': lambda d: d['V'] * d['K'],
+    'pair_kpis': lambda d: d['S'] * d['V'] * d['K'],
+    'site_months': lambda d: d['T'] * d['S'],
+    'cells': lambda d: d['T'] * d['S'] * d['C'],
+    'cell_kpis': lambda d: d['T'] * d['S'] * d['C'] * d['K'],
+    # the reference loops visit a site only from the month it joins
+    'active_site_months': lambda d: d['A'] * d['S'],
+    'active_cells': lambda d: d['A'] * d['S'] * d['C'],
+    'samples': lambda d: d['S'] * d['C'] * d['rate'] * d['A'] / 12 * (1 + d['N']),
+    'contracts': lambda d: d['S'] * d['C'] * (1 + d['rate'] * d['A'] / 12),
+    'spend_series': lambda d: (d['V'] + d['C'] + d['R']) * d['T'],
+    # reference lookups filter the whole integration matrix / contracts table
+    'pair_scans': lambda d: d['S'] * d['C'] * d['S'] * d['V'],
+    'cell_pair_scans': lambda d: d['A'] * d['S'] * d['C'] * d['S'] * d['V'],
+    'cell_contract_scans': lambda d: d['A'] * d['S'] * d['C'] * d['S'] * d['C'],
+}
+
+# (seconds terms, memory terms) per stage and engine; each stage costs
+# intercept + sum(coefficient * term)
+_SHARED_STAGES = {
+    'sites': (['sites'], ['sites']),
+    'vendors': (['vendors'], ['vendors']),
+    'integration': (['pairs'], ['pairs']),
+    'vendor_effects': (['vendor_kpis'], ['vendor_kpis']),
+    'kpi_contributions': (['pair_kpis'], ['pair_kpis']),
+    'switch_samples': (['pairs', 'samples'], ['pairs', 'samples']),
+    'spend': (['contracts', 'spend_series'], ['contracts', 'spend_series']),
+    'consolidation': (['spend_series'], ['spend_series']),
+}
+
+STAGE_WORK = {
+    'reference': dict(_SHARED_STAGES, **{
+        'initial_state': (['site_categories', 'pair_scans'], ['pairs']),
+        'switches': (['active_cells', 'cell_pair_scans'], ['pairs', 'cells']),
+        'kpis': (['active_cells', 'cell_contract_scans'], ['pairs', 'active_site_months']),
+    }),
+    'vectorized': dict(_SHARED_STAGES, **{
+        'initial_state': (['pairs'], ['pairs']),
+        'switches': (['cells'], ['cells']),
+        'kpis': (['cells', 'cell_kpis'], ['cell_kpis']),
+    }),
+    'per_site': dict(_SHARED_STAGES, **{
+        'initial_state': (['site_categories'], ['pairs']),
+        'switches': (['sites', 'cells'], ['cells']),
+        'kpis': (['sites', 'cell_kpis'], ['cell_kpis']),
+    }),
+}
+
+# files written by the pipeline: (stage, output, row count)
+OUTPUT_FILES = {
+    'sites.csv': ('sites', 'sites', lambda d: d['S']),
+    'vendors.csv': ('vendors', 'vendors', lambda d: d['V']),
+    'integration_matrix.csv': ('integration', 'integration_matrix', lambda d: d['S'] * d['V']),
+    'kpi_contributions.npz': ('kpi_contributions', 'kpi_contributions', lambda d: d['S'] * d['V'] * d['K']),
+    'initial_state_2019.csv': ('initial_state', 'initial_state', lambda d: d['S'] * d['C']),
+    'contracts_2019_2024.csv': ('switches', 'contracts', WORK_TERMS['contracts']),
+    'kpis.csv': ('kpis', 'kpis', WORK_TERMS['active_site_months']),
+    'switch_samples.npz': ('switch_samples', 'switch_samples', WORK_TERMS['samples']),
+    'portfolio_spend.csv': ('spend', 'portfolio_spend', WORK_TERMS['spend_series']),
+    'consolidation_savings.csv': ('consolidation', 'consolidation_savings', lambda d: d['C']),
+}
+
+# regions sites are drawn from (generate_sites)
+N_REGIONS = 4
+
+# benchmark sizes (n_sites, end_date) per engine; reference horizons are
+# short so its n_sites^2 scans can be reached in minutes
+BENCHMARK_SIZES = {
+    'reference': [(50, '2020-12-31'), (100, '2020-06-30'), (150, '2019-12-31'), (200, '2020-06-30'),
+                  (300, '2019-12-31'), (400, '2019-12-31')],
+    'vectorized': [(250, '2020-12-31'), (1000, '2022-12-31'), (2000, '2024-12-31'), (4000, '2021-12-31'),
+                   (4000, '2024-12-31')],
+    'per_site': [(250, '2020-12-31'), (1000, '2022-12-31'), (2000, '2024-12-31'), (4000, '2021-12-31'),
+                 (4000, '2024-12-31')],
+}
+
+# larger runs kept out of the fit to check its extrapolation
+HOLDOUT_SIZES = {
+    'reference': [(600, '2019-12-31')],
+    'vectorized': [(10000, '2024-12-31')],
+    'per_site': [(10000, '2024-12-31')],
+}
+
+# coefficients fitted with calibrate_cost_model() on the development machine
+DEFAULT_COST_MODEL_PATH = Path(__file__).parent / 'cost_model.json'
+
+
+def expected_active_months(start_date='2019-01-01', end_date='2024-12-31', onboarding='baseline'):
+    """Mean number of horizon months a site is active for under an onboarding scenario.
+
+    Join dates are uniform over the first 364 days of each scenario year
+    (generate_sites) and a site is active from the month it joined.
+    """
+    n_months = len(get_months(start_date, end_date))
+    first_month = np.datetime64(start_date, 'M')
+
+    active = 0.0
+    for year, share in ONBOARDING_SCENARIOS[onboarding].items():
+        join = (np.datetime64(f'{year}-01-01') + np.arange(364)).astype('datetime64[M]')
+        join_month = np.maximum((join - first_month).astype(np.int64), 0)
+        active += share * np.clip(n_months - join_month, 0, n_months).mean()
+    return float(active)
+
+
+def run_dimensions(n_sites, start_date='2019-01-01', end_date='2024-12-31', n_vendors=None,
+                   switch_rate=0.05, n_negatives=None, onboarding='baseline'):
+    """Return the sizes the cost terms depend on."""
+    catalog = get_vendor_catalog()
+    n_categories = len({vendor['category'] for vendor in catalog})
+    dims = {
+        'S': n_sites,
+        'T': len(get_months(start_date, end_date)),
+        'A': expected_active_months(start_date, end_date, onboarding),
+        'V': len(catalog) if n_vendors is None else n_vendors,
+        'C': n_categories,
+        'K': len(KPI_REGISTRY),
+        'rate': switch_rate,
+        'N': sum(NEGATIVES_PER_POSITIVE.values()) if n_negatives is None else n_negatives,
+        'R': N_REGIONS,
+    }
+    return dims
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _measure_stages(stages):
+    """Wrap each stage so it records its tracemalloc peak above the current level."""
+    peaks = {}
+
+    def measured(stage):
+        run = stage['run']
+
+        def wrapper(*args):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            values = run(*args)
+            peaks[stage['name']] = tracemalloc.get_traced_memory()[1] - current
+            return values
+
+        # writes are measured separately (file sizes)
+        return dict(stage, run=wrapper, writes={})
+
+    return [measured(stage) for stage in stages], peaks
+
+
+def benchmark_pipeline(engine, sizes=None, seed=42, measure_memory=True):
+    """Run the pipeline at benchmark sizes and record per-stage and per-file costs.
+
+    Timings come from a plain run, memory peaks from a second run under
+    tracemalloc (which slows allocation-heavy code); without measure_memory
+    the peaks are left as NaN.
+    """
+    from .generate_all_data import pipeline_generators, pipeline_stages
+    from .pipeline_dag import run_dag
+
+    sizes = BENCHMARK_SIZES[engine] if sizes is None else sizes
+    stage_rows = []
+    file_rows = []
+
+    for n_sites, end_date in sizes:
+        dims = run_dimensions(n_sites, end_date=end_date)
+
+        with tempfile.TemporaryDirectory() as output_dir, open(os.devnull, 'w') as quiet, redirect_stdout(quiet):
+            stages = pipeline_stages(pipeline_generators(engine), seed, n_sites, output_dir, end_date=end_date)
+            results, timings = run_dag(stages, n_workers=1, n_writers=1)
+
+            peaks = {}
+            if measure_memory:
+                tracemalloc.start()
+                measured, peaks = _measure_stages(stages)
+                run_dag(measured, n_workers=1, n_writers=1)
+                tracemalloc.stop()
+
+            # fit on what the run did: its switch rate and active site-months
+            realized = dict(dims, A=len(results['kpis']) / n_sites)
+            realized['rate'] = _realized_rate(results, realized)
+            for name, (_, output, n_rows) in OUTPUT_FILES.items():
+                path = f'{output_dir}/{name}'
+                write = timings[timings['node'] == f'write:{output}']
+                file_rows.append({
+                    'file': name,
+                    'rows': n_rows(realized),
+                    'bytes': os.path.getsize(path),
+                    'write_seconds': write['duration'].sum(),
+                })
+
+        durations = dict(zip(timings['node'], timings['duration']))
+        for stage in STAGE_WORK[engine]:
+            stage_rows.append({
+                'engine': engine, 'stage': stage, 'n_sites': n_sites, 'n_months': dims['T'],
+                'dims': realized, 'seconds': durations[stage], 'peak_bytes': peaks.get(stage, np.nan),
+            })
+
+        # tables held for the rest of the run
+        for name, value in results.items():
+            if isinstance(value, pd.DataFrame):
+                file_rows.append({'file': f'memory:{name}', 'rows': len(value),
+                                  'bytes': value.memory_usage(deep=True).sum(), 'write_seconds': 0.0})
+
+    return pd.DataFrame(stage_rows), pd.DataFrame(file_rows)
+
+
+def _realized_rate(results, dims):
+    """Annual switch rate of a finished run, per active contract-year."""
+    switches = len(results['contracts']) - len(results['initial_state'])
+    return switches / (dims['S'] * dims['C']) / (dims['A'] / 12)
+
+
+def fit_terms(terms, dims_list, y):
+    """Least-squares intercept + terms with non-negative coefficients.
+
+    Negative coefficients are dropped one at a time and the rest refitted.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    design = np.column_stack([np.ones(len(y))] + [[WORK_TERMS[term](d) for d in dims_list] for term in terms])
+    design = design.astype(np.float64)
+
+    active = list(range(design.shape[1]))
+    while True:
+        coef, *_ = np.linalg.lstsq(design[:, active], y, rcond=None)
+        if (coef >= 0).all() or len(active) == 1:
+            break
+        del active[int(np.argmin(coef))]
+
+    full = np.zeros(design.shape[1])
+    full[active] = np.maximum(coef, 0)
+    return dict(zip(['intercept'] + list(terms), full.tolist()))
+
+
+def term_cost(coefficients, dims):
+    """Evaluate intercept + sum(coefficient * term) for one run."""
+    return sum(c if term == 'intercept' else c * WORK_TERMS[term](dims) for term, c in coefficients.items())
+
+
+def startup_seconds(repeats=3):
+    """Fastest time for a fresh interpreter to import the pipeline."""
+    command = [sys.executable, '-c', f'import {__package__}.generate_all_data']
+    root = Path(__file__).resolve().parent.parent
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=root, check=True)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def validate_cost_model(model, engines=None, sizes=None, seed=42):
+    """Run held-out sizes and compare measured with predicted seconds.
+
+    Returns one row per (run, stage) plus a 'total' row per run covering
+    stages and writes; ratio is measured / predicted.
+    """
+    engines = list(model['engines']) if engines is None else engines
+
+    rows = []
+    for engine in engines:
+        for n_sites, end_date in (HOLDOUT_SIZES[engine] if sizes is None else sizes):
+            stage_df, file_df = benchmark_pipeline(engine, [(n_sites, end_date)], seed, measure_memory=False)
+            estimate = estimate_run(n_sites, end_date=end_date, engine=engine, model=model)
+
+            predicted = dict(zip(estimate['stages']['stage'], estimate['stages']['seconds']))
+            measured = dict(zip(stage_df['stage'], stage_df['seconds']))
+            predicted['total'] = sum(predicted.values()) + estimate['files']['write_seconds'].sum()
+            measured['total'] = sum(measured.values()) + file_df['write_seconds'].sum()
+
+            for stage in measured:
+                rows.append({
+                    'engine': engine, 'n_sites': n_sites, 'end_date': end_date, 'stage': stage,
+                    'measured_seconds': measured[stage], 'predicted_seconds': predicted[stage],
+                })
+
+    validation_df = pd.DataFrame(rows)
+    validation_df['ratio'] = validation_df['measured_seconds'] / validation_df['predicted_seconds']
+    return validation_df
+
+
+def print_validation(validation_df):
+    """Print measured vs predicted seconds of the held-out runs."""
+    print(f'\n{"engine":<12} {"sites":>6} {"end":>11} {"stage":<18} {"measured":>10} {"predicted":>10} {"ratio":>7}')
+    for row in validation_df.itertuples(index=False):
+        print(f'{row.engine:<12} {row.n_sites:>6} {row.end_date:>11} {row.stage:<18} '
+              f'{row.measured_seconds:10.2f} {row.predicted_seconds:10.2f} {row.ratio:7.2f}')
+
+
+def calibrate_cost_model(engines=None, seed=42, validate=True):
+    """Benchmark each engine, fit the cost model and check it on held-out sizes."""
+    # baseline memory includes the pipeline imports
+    from . import generate_all_data
+
+    engines = list(STAGE_WORK) if engines is None else engines
+    base_bytes = peak_rss_bytes()
+
+    model = {'engines': {}, 'files': {}, 'tables': {}, 'base_bytes': base_bytes,
+             'startup_seconds': startup_seconds()}
+    file_stats = []
+    for engine in engines:
+        start = time.perf_counter()
+        stage_df, file_df = benchmark_pipeline(engine, seed=seed)
+        print(f'Benchmarked {engine} in {time.perf_counter() - start:.1f}s')
+        file_stats.append(file_df)
+
+        model['engines'][engine] = {}
+        for stage, group in stage_df.groupby('stage'):
+            time_terms, memory_terms = STAGE_WORK[engine][stage]
+            model['engines'][engine][stage] = {
+                'seconds': fit_terms(time_terms, group['dims'], group['seconds']),
+                'bytes': fit_terms(memory_terms, group['dims'], group['peak_bytes']),
+            }
+
+    file_df = pd.concat(file_stats, ignore_index=True)
+    for name, group in file_df.groupby('file'):
+        bytes_per_row = float(group['bytes'].sum() / group['rows'].sum())
+        if name.startswith('memory:'):
+            model['tables'][name.split(':', 1)[1]] = bytes_per_row
+        else:
+            model['files'][name] = {
+                'bytes_per_row': bytes_per_row,
+                'write_seconds_per_byte': float(group['write_seconds'].sum() / group['bytes'].sum()),
+            }
+
+    if validate:
+        validation_df = validate_cost_model(model, engines, seed=seed)
+        print_validation(validation_df)
+        model['validation'] = validation_df[validation_df['stage'] == 'total'].to_dict('records')
+    return model
+
+
+def save_cost_model(model, output_path=DEFAULT_COST_MODEL_PATH):
+    """Save fitted coefficients as json."""
+    with open(output_path, 'w') as f:
+        json.dump(model, f, indent=2)
+    print(f'Saved cost model for {", ".join(model["engines"])} to {output_path}')
+
+
+def load_cost_model(input_path=None):
+    """Load fitted coefficients (the shipped model without a path)."""
+    input_path = DEFAULT_COST_MODEL_PATH if input_path is None else input_path
+    with open(input_path) as f:
+        return json.load(f)
+
+
+def critical_path_seconds(stage_seconds, dependencies):
+    """Longest chain of estimated stage durations through the stage graph."""
+    finish = {}
+
+    def finish_time(stage):
+        if stage not in finish:
+            finish[stage] = stage_seconds.get(stage, 0.0) + max(
+                (finish_time(d) for d in dependencies[stage]), default=0.0)
+        return finish[stage]
+
+    return max(finish_time(stage) for stage in dependencies)
+
+
+def estimate_run(n_sites, start_date='2019-01-01', end_date='2024-12-31', engine='reference',
+                 n_vendors=None, switch_rate=0.05, model=None, n_negatives=None, onboarding='baseline'):
+    """Predict per-stage seconds and memory, output file sizes and run totals."""
+    from .generate_all_data import pipeline_generators, pipeline_stages
+
+    model = load_cost_model() if model is None else model
+    if engine not in model['engines']:
+        raise ValueError(f'Cost model has no coefficients for engine {engine}')
+
+    dims = run_dimensions(n_sites, start_date, end_date, n_vendors, switch_rate, n_negatives, onboarding)
+    coefficients = model['engines'][engine]
+
+    # bytes held by finished tables, in pipeline order
+    table_rows = {
+        'sites': dims['S'], 'vendors': dims['V'], 'integration_matrix': dims['S'] * dims['V'],
+        'initial_state': dims['S'] * dims['C'],
+        'contracts': WORK_TERMS['contracts'](dims), 'kpis': WORK_TERMS['active_site_months'](dims),
+    }
+    stage_tables = {'sites': 'sites', 'vendors': 'vendors', 'integration': 'integration_matrix',
+                    'initial_state': 'initial_state', 'switches': 'contracts', 'kpis': 'kpis'}
+
+    rows = []
+    resident = 0.0
+    for stage in STAGE_WORK[engine]:
+        transient = term_cost(coefficients[stage]['bytes'], dims)
+        rows.append({
+            'stage': stage,
+            'seconds': term_cost(coefficients[stage]['seconds'], dims),
+            'transient_bytes': transient,
+            'peak_bytes': model['base_bytes'] + resident + transient,
+        })
+        if stage in stage_tables:
+            table = stage_tables[stage]
+            resident += model['tables'].get(table, 0.0) * table_rows[table]
+
+    stages_df = pd.DataFrame(rows)
+
+    files = []
+    for name, (stage, _, n_rows) in OUTPUT_FILES.items():
+        size = model['files'][name]['bytes_per_row'] * n_rows(dims)
+        files.append({
+            'file': name, 'stage': stage, 'rows': int(n_rows(dims)), 'bytes': size,
+            'write_seconds': size * model['files'][name]['write_seconds_per_byte'],
+        })
+    files_df = pd.DataFrame(files)
+
+    # wall time: stages overlap where the graph allows, writes run behind
+    stages = pipeline_stages(pipeline_generators(engine), n_sites=n_sites)
+    seconds = dict(zip(stages_df['stage'], stages_df['seconds']))
+    writes = files_df.groupby('stage')['write_seconds'].sum()
+    with_writes = {s: seconds.get(s, 0.0) + writes.get(s, 0.0) for s in seconds}
+    dependencies = stage_dependencies(stages)
+
+    # interpreter start and pipeline imports come before the first stage
+    startup = model.get('startup_seconds', 0.0)
+    summary = {
+        'engine': engine,
+        'dims': dims,
+        'sequential_seconds': startup + stages_df['seconds'].sum() + files_df['write_seconds'].sum(),
+        'critical_path_seconds': startup + critical_path_seconds(with_writes, dependencies),
+        'peak_bytes': stages_df['peak_bytes'].max(),
+        'disk_bytes': files_df['bytes'].sum(),
+    }
+    return {'stages': stages_df, 'files': files_df, 'summary': summary}
+
+
+def check_limits(estimate, limits=None):
+    """Return a warning string for every limit the estimated run exceeds.
+
+    limits overrides ESTIMATE_LIMITS; None values keep the default.
+    """
+    limits = dict(ESTIMATE_LIMITS, **{k: v for k, v in (limits or {}).items() if v is not None})
+    summary = estimate['summary']
+
+    warnings = []
+    minutes = summary['sequential_seconds'] / 60
+    if minutes > limits['runtime_minutes']:
+        warnings.append(f'runtime {minutes:,.1f} min exceeds limit of {limits["runtime_minutes"]:,.1f} min')
+    memory_gb = summary['peak_bytes'] / 1e9
+    if memory_gb > limits['memory_gb']:
+        warnings.append(f'peak memory {memory_gb:,.2f} GB exceeds limit of {limits["memory_gb"]:,.2f} GB')
+    disk_gb = summary['disk_bytes'] / 1e9
+    if disk_gb > limits['disk_gb']:
+        warnings.append(f'output {disk_gb:,.2f} GB exceeds limit of {limits["disk_gb"]:,.2f} GB')
+    return warnings
+
+
+def print_estimate(estimate, limits=None):
+    """Print the per-stage and per-file estimates, then any limit warnings."""
+    summary = estimate['summary']
+    dims = summary['dims']
+    print(f'Estimate for {dims["S"]} sites x {dims["T"]} months x {dims["V"]} vendors '
+          f'({summary["engine"]} engine)')
+
+    print(f'\n{"stage":<20} {"seconds":>12} {"peak MB":>12}')
+    for row in estimate['stages'].itertuples(index=False):
+        print(f'{row.stage:<20} {row.seconds:12.2f} {row.peak_bytes / 1e6:12.1f}')
+
+    print(f'\n{"file":<26} {"rows":>14} {"MB":>12}')
+    for row in estimate['files'].itertuples(index=False):
+        print(f'{row.file:<26} {row.rows:14,d} {row.bytes / 1e6:12.1f}')
+
+    print(f'\nRuntime: {summary["sequential_seconds"] / 60:,.1f} min sequential, '
+          f'{summary["critical_path_seconds"] / 60:,.1f} min on the critical path (lower bound)')
+    print(f'Peak memory: {summary["peak_bytes"] / 1e9:,.2f} GB')
+    print(f'Output size: {summary["disk_bytes"] / 1e9:,.2f} GB')
+
+    warnings = check_limits(estimate, limits)
+    for warning in warnings:
+        print(f'WARNING: {warning}')
+    return warnings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Calibrate the pipeline cost model')
+    parser.add_argument('--calibrate', action='store_true', help='Benchmark the engines and fit coefficients')
+    parser.add_argument('--validate', action='store_true',
+                        help='Compare a fitted model with held-out runs (no refit)')
+    parser.add_argument('--engines', type=str, default=','.join(STAGE_WORK), help='Comma-separated engines')
+    parser.add_argument('--output', type=str, default=str(DEFAULT_COST_MODEL_PATH),
+                        help='Where to save the fitted model (--validate reads it)')
+    args = parser.parse_args()
+
+    if args.calibrate:
+        save_cost_model(calibrate_cost_model(args.engines.split(',')), args.output)
+    elif args.validate:
+        print_validation(validate_cost_model(load_cost_model(args.output), args.engines.split(',')))
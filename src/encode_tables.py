@@ -0,0 +1,107 @@
+"""
+encode_tables.py -- integer-coded array views of the generated tables
+
+Author: Gregory Schwartz
+Date: December 2025
+
+The reference generators look things up by filtering dataframes on
+site_id / vendor_id strings. The vectorized engines work on integer
+indices instead: sites and vendors keep their dataframe order, categories
+keep vendors_df['category'].unique() order.
+"""
+
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
+
+
+def get_months(start_date='2019-01-01', end_date='2024-12-31'):
+    """Return monthly timesteps between two dates (inclusive)."""
+    sim_start = datetime.strptime(start_date, '%Y-%m-%d')
+    sim_end = datetime.strptime(end_date, '%Y-%m-%d')
+
+    months = []
+    current = sim_start
+    while current <= sim_end:
+        months.append(current)
+        current = current + relativedelta(months=1)
+
+    return months
+
+
+def onboarding_dates(sites_df, start_date='2019-01-01'):
+    """Return each site's first contract date: the start of the month it joined.
+
+    Sites that joined before start_date start on start_date.
+    """
+    month_start = sites_df['date_joined'].astype(str).str.slice(0, 8) + '01'
+    return np.where(month_start < start_date, start_date, month_start).astype(str)
+
+
+def join_months(sites_df, months):
+    """Return the month index each site becomes active (len(months) if after the horizon)."""
+    month_strs = np.array([m.strftime('%Y-%m-%d') for m in months])
+    return np.searchsorted(month_strs, onboarding_dates(sites_df, month_strs[0]), side='left')
+
+
+def encode_tables(sites_df, vendors_df, integration_df):
+    """Encode sites, vendors and integration matrix as numpy arrays."""
+
+    site_ids = sites_df['site_id'].to_numpy()
+    vendor_ids = vendors_df['vendor_id'].to_numpy()
+    categories = vendors_df['category'].unique()
+
+    site_index = pd.Index(site_ids)
+    vendor_index = pd.Index(vendor_ids)
+    category_index = pd.Index(categories)
+
+    vendor_category = category_index.get_indexer(vendors_df['category'])
+    vendor_tier = vendors_df['tier'].to_numpy().astype(np.int64)
+
+    # site x vendor quality, missing pairs default to 0 like the lookups
+    quality = np.zeros((len(site_ids), len(vendor_ids)), dtype=np.int8)
+    rows = site_index.get_indexer(integration_df['site_id'])
+    cols = vendor_index.get_indexer(integration_df['vendor_id'])
+    known = (rows >= 0) & (cols >= 0)
+    quality[rows[known], cols[known]] = integration_df['integration_quality'].to_numpy()[known]
+
+    # category x slot vendor index, padded with -1
+    max_vendors = np.bincount(vendor_category).max()
+    category_vendors = np.full((len(categories), max_vendors), -1, dtype=np.int64)
+    for c in range(len(categories)):
+        members = np.flatnonzero(vendor_category == c)
+        category_vendors[c, :len(members)] = members
+
+    tables = {
+        'site_ids': site_ids,
+        'vendor_ids': vendor_ids,
+        'categories': categories,
+        'vendor_category': vendor_category,
+        'vendor_tier': vendor_tier,
+        'quality': quality,
+        'category_vendors': category_vendors,
+    }
+    return tables
+
+
+def encode_assignments(assignments_df, tables):
+    """Encode one vendor per (site, category) as a site x category array."""
+
+    site_index = pd.Index(tables['site_ids'])
+    vendor_index = pd.Index(tables['vendor_ids'])
+    category_index = pd.Index(tables['categories'])
+
+    vendors = np.full((len(site_index), len(category_index)), -1, dtype=np.int64)
+    rows = site_index.get_indexer(assignments_df['site_id'])
+    cols = category_index.get_indexer(assignments_df['category'])
+    vendors[rows, cols] = vendor_index.get_indexer(assignments_df['vendor_id'])
+
+    return vendors
+
+
+def selection_weights(tables):
+    """Return site x vendor softmax weights used for vendor selection."""
+    quality = tables['quality'].astype(np.float64)
+    tier = tables['vendor_tier'][None, :]
+    return np.exp(0.5 * quality + 0.3 * tier)
@@ -6,100 +6,419 @@ Date: December 2025
 
 Usage:
     python3 generate_all_data.py --seed 42 --n_sites 100
+
+The steps form a dependency graph (see pipeline_dag.py): independent
+stages run concurrently and csv writes overlap the stages after them.
 """
 
 import argparse
+import importlib
+import json
 import os
 import sys
 from pathlib import Path
 
-# add src to path
-sys.path.insert(0, str(Path(__file__).parent))
+# run as a script: import the rest of src as a package, not as top-level modules
+if not __package__:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    __package__ = Path(__file__).resolve().parent.name
+
+from .generate_sites import ONBOARDING_SCENARIOS, save_sites
+from .generate_vendors import generate_vendors, save_vendors
+from .generate_integration_matrix import save_integration_matrix
+from .generate_initial_state import save_initial_state
+from .simulate_switches import save_contracts
+from .generate_kpis import save_kpis, assign_vendor_effects, build_kpi_contributions, save_kpi_contributions
+from .integration_upgrades import (
+    upgrade_events_arg, generate_integration_upgrades, save_integration_upgrades, encode_upgrades,
+)
+from .switch_samples import NEGATIVES_PER_POSITIVE, generate_switch_samples, save_switch_samples
+from .portfolio_spend import (generate_portfolio_spend, consolidation_savings, save_portfolio_spend,
+                             save_consolidation_savings)
+from .pipeline_dag import run_dag, print_timings
+
+
+# generator (module, function) per engine and stage: reference loops, array
+# engine (checked against the loops by check_equivalence.py) or per-site
+# counter-based streams (prefix-stable, see site_rng.py). Only the chosen
+# engine's modules are imported (pipeline_generators).
+PIPELINE_GENERATORS = {
+    'reference': {
+        'sites': ('generate_sites', 'generate_sites'),
+        'integration': ('generate_integration_matrix', 'generate_integration_matrix'),
+        'initial_state': ('generate_initial_state', 'generate_initial_state'),
+        'switches': ('simulate_switches', 'simulate_switches'),
+        'kpis': ('generate_kpis', 'generate_kpis'),
+    },
+    'vectorized': {
+        'sites': ('generate_sites', 'generate_sites'),
+        'integration': ('generate_integration_matrix', 'generate_integration_matrix'),
+        'initial_state': ('vectorized_engine', 'generate_initial_state_vectorized'),
+        'switches': ('vectorized_engine', 'simulate_switches_vectorized'),
+        'kpis': ('vectorized_engine', 'generate_kpis_vectorized'),
+    },
+    'per_site': {
+        'sites': ('site_rng', 'generate_sites_keyed'),
+        'integration': ('site_rng', 'generate_integration_keyed'),
+        'initial_state': ('site_rng', 'generate_initial_state_keyed'),
+        'switches': ('site_rng', 'simulate_switches_keyed'),
+        'kpis': ('site_rng', 'generate_kpis_keyed'),
+    },
+}
+
+# generators drawing from the global np.random state (reseeded on entry)
+GLOBAL_RNG_GENERATORS = {
+    'generate_sites', 'generate_integration_matrix', 'generate_initial_state', 'simulate_switches',
+    'generate_kpis', 'generate_kpis_vectorized',
+}
+
+
+# options of a pipeline run, replayed when a dataset grows (site_rng.append_sites)
+GENERATION_FILE = 'generation.json'
+
+
+def pipeline_generators(engine):
+    """Import one engine's generator modules and return its stage functions."""
+    return {
+        stage: getattr(importlib.import_module(f'.{module_name}', __package__), function_name)
+        for stage, (module_name, function_name) in PIPELINE_GENERATORS[engine].items()
+    }
+
+
+def calibrated_base_annual(sites, vendors, integration_matrix, target_switch_rate, contagion=0.0,
+                           start_date='2019-01-01', end_date='2024-12-31', integration_upgrades=None):
+    """Tune base_annual to a target annual switch rate (0.05 without a target).
+
+    Chains start at each site's join month, so the target is per active
+    contract-year like the realized rate in the summary. Integration
+    upgrades change each chain's hazard from the month they take effect.
+    """
+    if target_switch_rate is None:
+        return 0.05
+    if contagion:
+        print('Note: calibration ignores contagion, realized switch rate will be higher')
+
+    from .encode_tables import encode_tables, get_months, join_months
+    from .markov_switches import build_switch_chains, calibrate_base_annual
+
+    months = get_months(start_date, end_date)
+    tables = encode_tables(sites, vendors, integration_matrix)
+    upgrades = None
+    if integration_upgrades is not None:
+        upgrades = encode_upgrades(integration_upgrades, tables, months)
+    chains = build_switch_chains(tables, join_month=join_months(sites, months), upgrades=upgrades)
+    base_annual = calibrate_base_annual(chains, len(months), target_switch_rate)
+    print(f'Calibrated base_annual={base_annual:.4f} for {target_switch_rate:.1%} annual switches')
+    return base_annual
+
+
+def site_neighbours(sites, seed=42, contagion=0.0):
+    """Sparse neighbour graph when contagion is on (scipy only needed then)."""
+    if not contagion:
+        return None
+
+    from .spatial_contagion import neighbour_graph
+
+    adjacency = neighbour_graph(sites, seed)
+    print(f'Built neighbour graph: {adjacency.nnz} edges over {adjacency.shape[0]} sites')
+    return adjacency
 
-from generate_sites import generate_sites, save_sites
-from generate_vendors import generate_vendors, save_vendors
-from generate_integration_matrix import generate_integration_matrix, save_integration_matrix
-from generate_initial_state import generate_initial_state, save_initial_state
-from simulate_switches import simulate_switches, save_contracts
-from generate_kpis import generate_kpis, save_kpis
 
+def integration_upgrades(sites, vendors, integration_matrix, upgrade_events=None):
+    """Delta log of dated integration upgrades (None when upgrades are off)."""
+    if upgrade_events is None:
+        return None
+    return generate_integration_upgrades(sites, vendors, integration_matrix, upgrade_events)
 
-def run_pipeline(seed=42, n_sites=100, output_dir='../data/generated'):
-    """Run the full synthetic data generation pipeline."""
+
+def pipeline_stages(generators, seed=42, n_sites=100, output_dir='../data/generated',
+                    target_switch_rate=None, contagion=0.0,
+                    start_date='2019-01-01', end_date='2024-12-31', upgrade_events=None,
+                    n_hard=NEGATIVES_PER_POSITIVE['hard'], n_random=NEGATIVES_PER_POSITIVE['random'],
+                    onboarding='baseline'):
+    """Return the pipeline as stages with declared inputs and outputs."""
+    # stages drawing from the global np.random state (reseeded on entry)
+    global_rng = {stage for stage, generator in generators.items() if generator.__name__ in GLOBAL_RNG_GENERATORS}
+    dates = {'start_date': start_date, 'end_date': end_date, 'seed': seed}
+
+    stages = [
+        {
+            'name': 'sites', 'inputs': [], 'outputs': ['sites'],
+            'run': lambda: generators['sites'](n_sites=n_sites, seed=seed, onboarding=onboarding),
+            'global_rng': 'sites' in global_rng,
+            'writes': {'sites': lambda df: save_sites(df, f'{output_dir}/sites.csv')},
+        },
+        {
+            'name': 'vendors', 'inputs': [], 'outputs': ['vendors'],
+            'run': lambda: generate_vendors(seed=seed),
+            'global_rng': True,
+            'writes': {'vendors': lambda df: save_vendors(df, f'{output_dir}/vendors.csv')},
+        },
+        {
+            'name': 'integration', 'inputs': ['sites', 'vendors'], 'outputs': ['integration_matrix'],
+            'run': lambda sites, vendors: generators['integration'](sites, vendors, seed=seed),
+            'global_rng': 'integration' in global_rng,
+            'writes': {'integration_matrix': lambda df: save_integration_matrix(
+                df, f'{output_dir}/integration_matrix.csv')},
+        },
+        {
+            'name': 'upgrades', 'inputs': ['sites', 'vendors', 'integration_matrix'],
+            'outputs': ['integration_upgrades'],
+            'run': lambda sites, vendors, matrix: integration_upgrades(sites, vendors, matrix, upgrade_events),
+            'writes': {} if upgrade_events is None else {
+                'integration_upgrades': lambda df: save_integration_upgrades(
+                    df, f'{output_dir}/integration_upgrades.csv')},
+        },
+        {
+            'name': 'vendor_effects', 'inputs': ['vendors'], 'outputs': ['vendor_effects'],
+            'run': lambda vendors: assign_vendor_effects(vendors, seed),
+            'global_rng': True,
+        },
+        # kpi contributions depend only on (site, vendor): cache them with the matrix
+        {
+            'name': 'kpi_contributions',
+            'inputs': ['sites', 'vendors', 'integration_matrix', 'vendor_effects', 'integration_upgrades'],
+            'outputs': ['kpi_contributions'],
+            'run': lambda sites, vendors, matrix, effects, upgrades: build_kpi_contributions(
+                sites, vendors, matrix, effects, upgrades_df=upgrades, seed=seed),
+            'writes': {'kpi_contributions': lambda c: save_kpi_contributions(
+                c, f'{output_dir}/kpi_contributions.npz')},
+        },
+        {
+            'name': 'initial_state', 'inputs': ['sites', 'vendors', 'integration_matrix'],
+            'outputs': ['initial_state'],
+            'run': lambda sites, vendors, matrix: generators['initial_state'](
+                sites, vendors, matrix, seed=seed, start_date=start_date),
+            'global_rng': 'initial_state' in global_rng,
+            'writes': {'initial_state': lambda df: save_initial_state(
+                df, f'{output_dir}/initial_state_2019.csv')},
+        },
+        {
+            'name': 'calibration', 'inputs': ['sites', 'vendors', 'integration_matrix', 'integration_upgrades'],
+            'outputs': ['base_annual'],
+            'run': lambda sites, vendors, matrix, upgrades: calibrated_base_annual(
+                sites, vendors, matrix, target_switch_rate, contagion, start_date, end_date, upgrades),
+        },
+        {
+            'name': 'neighbours', 'inputs': ['sites'], 'outputs': ['adjacency'],
+            'run': lambda sites: site_neighbours(sites, seed, contagion),
+        },
+        {
+            'name': 'switches',
+            'inputs': ['sites', 'vendors', 'integration_matrix', 'initial_state', 'base_annual', 'adjacency',
+                       'integration_upgrades'],
+            'outputs': ['contracts'],
+            'run': lambda sites, vendors, matrix, initial, base_annual, adjacency, upgrades: generators['switches'](
+                sites, vendors, matrix, initial, base_annual=base_annual,
+                contagion=contagion, adjacency=adjacency, integration_upgrades=upgrades, **dates),
+            'global_rng': 'switches' in global_rng,
+            'writes': {'contracts': lambda df: save_contracts(df, f'{output_dir}/contracts_2019_2024.csv')},
+        },
+        # labelled (site, vendor, month) switch links for the link-prediction model
+        {
+            'name': 'switch_samples',
+            'inputs': ['sites', 'vendors', 'integration_matrix', 'contracts', 'integration_upgrades'],
+            'outputs': ['switch_samples'],
+            'run': lambda sites, vendors, matrix, contracts, upgrades: generate_switch_samples(
+                sites, vendors, matrix, contracts, n_hard=n_hard, n_random=n_random,
+                integration_upgrades=upgrades, **dates),
+            'writes': {'switch_samples': lambda samples: save_switch_samples(
+                samples, f'{output_dir}/switch_samples.npz')},
+        },
+        # monthly spend from contract intervals, and what one vendor per category would save
+        {
+            'name': 'spend', 'inputs': ['sites', 'vendors', 'contracts'], 'outputs': ['portfolio_spend'],
+            'run': lambda sites, vendors, contracts: generate_portfolio_spend(
+                sites, vendors, contracts, start_date=start_date, end_date=end_date),
+            'writes': {'portfolio_spend': lambda df: save_portfolio_spend(df, f'{output_dir}/portfolio_spend.csv')},
+        },
+        {
+            'name': 'consolidation', 'inputs': ['portfolio_spend', 'vendors'], 'outputs': ['consolidation_savings'],
+            'run': consolidation_savings,
+            'writes': {'consolidation_savings': lambda df: save_consolidation_savings(
+                df, f'{output_dir}/consolidation_savings.csv')},
+        },
+        {
+            'name': 'kpis',
+            'inputs': ['sites', 'vendors', 'integration_matrix', 'contracts', 'kpi_contributions'],
+            'outputs': ['kpis'],
+            'run': lambda sites, vendors, matrix, contracts, contributions: generators['kpis'](
+                sites, vendors, matrix, contracts, contributions=contributions, **dates),
+            'global_rng': 'kpis' in global_rng,
+            'writes': {'kpis': lambda df: save_kpis(df, f'{output_dir}/kpis.csv')},
+        },
+    ]
+    return stages
+
+
+def save_generation_options(options, output_path):
+    """Save the options a dataset was generated with as json."""
+    with open(output_path, 'w') as f:
+        json.dump(options, f, indent=2)
+    print(f'Saved generation options to {output_path}')
+
+
+def load_generation_options(input_path):
+    """Load the options a dataset was generated with."""
+    with open(input_path) as f:
+        return json.load(f)
+
+
+def run_pipeline(seed=42, n_sites=100, output_dir='../data/generated', target_switch_rate=None,
+                 engine='reference', n_workers=4, contagion=0.0,
+                 start_date='2019-01-01', end_date='2024-12-31', upgrade_events=None,
+                 n_hard=NEGATIVES_PER_POSITIVE['hard'], n_random=NEGATIVES_PER_POSITIVE['random'],
+                 onboarding='baseline'):
+    """Run the full synthetic data generation pipeline.
+
+    upgrade_events (see integration_upgrades.UPGRADE_EVENTS) turns on dated
+    integration upgrades; None keeps quality fixed over the horizon. n_hard
+    and n_random set the negatives per positive in switch_samples.npz.
+    onboarding names a generate_sites.ONBOARDING_SCENARIOS entry; sites
+    have contracts, switches and KPIs only from the month they join. The
+    options and the base_annual used are saved to GENERATION_FILE.
+    """
+    generators = pipeline_generators(engine)
 
     print('=' * 70)
     print('SYNTHETIC DATA GENERATION PIPELINE')
     print('=' * 70)
     print(f'Seed: {seed}')
     print(f'Sites: {n_sites}')
+    print(f'Onboarding: {onboarding}')
+    print(f'Engine: {engine}')
+    print(f'Workers: {n_workers}')
+    if contagion:
+        print(f'Contagion: {contagion}')
+    if upgrade_events is not None:
+        print(f'Upgrade events: {len(upgrade_events)}')
+    print(f'Horizon: {start_date} to {end_date}')
     print(f'Output: {output_dir}')
     print('=' * 70)
 
     os.makedirs(output_dir, exist_ok=True)
 
-    # step 1: sites
-    print('\n[Step 1/6] Generating sites...')
-    sites = generate_sites(n_sites=n_sites, seed=seed)
-    save_sites(sites, f'{output_dir}/sites.csv')
-
-    # step 2: vendors
-    print('\n[Step 2/6] Generating vendors...')
-    vendors = generate_vendors(seed=seed)
-    save_vendors(vendors, f'{output_dir}/vendors.csv')
-
-    # step 3: integration matrix
-    print('\n[Step 3/6] Generating integration matrix...')
-    integration_matrix = generate_integration_matrix(sites, vendors, seed=seed)
-    save_integration_matrix(integration_matrix, f'{output_dir}/integration_matrix.csv')
-
-    # step 4: initial state
-    print('\n[Step 4/6] Generating initial state (2019-01-01)...')
-    initial_state = generate_initial_state(sites, vendors, integration_matrix, seed=seed)
-    save_initial_state(initial_state, f'{output_dir}/initial_state_2019.csv')
-
-    # step 5: simulate switches
-    print('\n[Step 5/6] Simulating vendor switches (2019-2024)...')
-    contracts = simulate_switches(
-        sites, vendors, integration_matrix, initial_state,
-        start_date='2019-01-01', end_date='2024-12-31', seed=seed
-    )
-    save_contracts(contracts, f'{output_dir}/contracts_2019_2024.csv')
+    stages = pipeline_stages(generators, seed, n_sites, output_dir, target_switch_rate, contagion,
+                             start_date, end_date, upgrade_events, n_hard, n_random, onboarding)
+    results, timings = run_dag(stages, n_workers=n_workers)
 
-    # step 6: generate kpis
-    print('\n[Step 6/6] Generating KPIs...')
-    kpis = generate_kpis(
-        sites, vendors, integration_matrix, contracts,
-        start_date='2019-01-01', end_date='2024-12-31', seed=seed
-    )
-    save_kpis(kpis, f'{output_dir}/kpis.csv')
+    save_generation_options({
+        'engine': engine, 'seed': seed, 'n_sites': n_sites, 'onboarding': onboarding,
+        'start_date': start_date, 'end_date': end_date, 'contagion': contagion,
+        'target_switch_rate': target_switch_rate, 'base_annual': results['base_annual'],
+        'upgrade_events': upgrade_events, 'n_hard': n_hard, 'n_random': n_random,
+    }, f'{output_dir}/{GENERATION_FILE}')
+
+    sites, vendors = results['sites'], results['vendors']
+    integration_matrix, initial_state = results['integration_matrix'], results['initial_state']
+    contracts, kpis = results['contracts'], results['kpis']
 
     # summary
     print('\n' + '=' * 70)
     print('PIPELINE COMPLETE')
     print('=' * 70)
+    print_timings(timings)
     print(f'\nGenerated datasets:')
     print(f'  sites.csv:               {len(sites):5d} rows')
     print(f'  vendors.csv:             {len(vendors):5d} rows')
     print(f'  integration_matrix.csv:  {len(integration_matrix):5d} rows')
+    if results['integration_upgrades'] is not None:
+        print(f'  integration_upgrades.csv:{len(results["integration_upgrades"]):5d} rows')
     print(f'  initial_state_2019.csv:  {len(initial_state):5d} rows')
     print(f'  contracts_2019_2024.csv: {len(contracts):5d} rows')
     print(f'  kpis.csv:                {len(kpis):5d} rows')
+    samples = results['switch_samples']
+    print(f'  switch_samples.npz:      {sum(len(samples[s]["label"]) for s in ("train", "val", "test")):5d} rows')
+    print(f'  portfolio_spend.csv:     {len(results["portfolio_spend"]):5d} rows')
+    print(f'  consolidation_savings.csv:{len(results["consolidation_savings"]):4d} rows')
 
-    switches = len(contracts) - len(initial_state)
+    # sites joining after end_date hold initial contracts but never simulate;
+    # exposure in contract-years: kpis has one row per active site-month
+    started = (initial_state['contract_start_date'] <= end_date).sum()
+    switches = len(contracts) - started
+    contract_years = len(initial_state) / len(sites) * len(kpis) / 12
     print(f'\nKey Statistics:')
-    print(f'  Total switches (2019-2024): {switches}')
-    print(f'  Annual switch rate: {switches / len(initial_state) / 6 * 100:.1f}%')
+    print(f'  Total switches: {switches}')
+    print(f'  Annual switch rate: {switches / contract_years * 100:.1f}%')
     print(f'  Days A/R mean: {kpis["days_ar"].mean():.2f} days')
     print(f'  Denial Rate mean: {kpis["denial_rate"].mean():.2f}%')
+    for kpi in kpis.columns[4:]:
+        print(f'  {kpi} mean: {kpis[kpi].mean():.2f}')
+    savings = results['consolidation_savings']
+    print(f'  Portfolio spend: ${savings["current_spend"].sum():,.0f}')
+    print(f'  Consolidation savings: ${savings["savings"].sum():,.0f} '
+          f'({100 * savings["savings"].sum() / savings["current_spend"].sum():.1f}%)')
     print('=' * 70)
 
+    return timings
+
+
+def estimate_pipeline(n_sites=100, engine='reference', start_date='2019-01-01', end_date='2024-12-31',
+                      n_vendors=None, target_switch_rate=None, cost_model_path=None, limits=None,
+                      n_hard=NEGATIVES_PER_POSITIVE['hard'], n_random=NEGATIVES_PER_POSITIVE['random'],
+                      onboarding='baseline'):
+    """Print predicted runtime, memory and output sizes without generating anything."""
+    from .cost_model import estimate_run, load_cost_model, print_estimate
+
+    estimate = estimate_run(
+        n_sites, start_date, end_date, engine, n_vendors,
+        switch_rate=0.05 if target_switch_rate is None else target_switch_rate,
+        model=load_cost_model(cost_model_path), n_negatives=n_hard + n_random, onboarding=onboarding
+    )
+    return print_estimate(estimate, limits)
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Generate synthetic data')
     parser.add_argument('--seed', type=int, default=42, help='Random seed')
     parser.add_argument('--n_sites', type=int, default=100, help='Number of sites')
+    parser.add_argument('--onboarding', type=str, default='baseline', choices=list(ONBOARDING_SCENARIOS),
+                        help='When sites join: during 2019 or an acquisition roll-up over all years')
     parser.add_argument('--output', type=str, default='../data/generated', help='Output directory')
+    parser.add_argument('--target_switch_rate', type=float, default=None,
+                        help='Calibrate base_annual analytically to this annual switch rate')
+    parser.add_argument('--engine', type=str, default='reference', choices=list(PIPELINE_GENERATORS),
+                        help='Reference loops, vectorized arrays or per-site random streams')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Threads running independent stages (1 = one stage at a time)')
+    parser.add_argument('--contagion', type=float, default=0.0,
+                        help='Hazard boost from neighbouring sites\' recent switches (0 = off)')
+    parser.add_argument('--upgrades', nargs='?', const='default', default=None, metavar='EVENTS_CSV',
+                        help='Apply dated integration upgrades (built-in events, or a csv of them)')
+    parser.add_argument('--hard_negatives', type=int, default=NEGATIVES_PER_POSITIVE['hard'],
+                        help='Same-site negatives per switch in switch_samples.npz')
+    parser.add_argument('--random_negatives', type=int, default=NEGATIVES_PER_POSITIVE['random'],
+                        help='Random-site negatives per switch in switch_samples.npz')
+    parser.add_argument('--start_date', type=str, default='2019-01-01', help='First simulated month')
+    parser.add_argument('--end_date', type=str, default='2024-12-31', help='Last simulated month')
+    parser.add_argument('--estimate', action='store_true',
+                        help='Predict runtime, peak memory and output sizes instead of generating')
+    parser.add_argument('--n_vendors', type=int, default=None, help='Catalog size to assume for --estimate')
+    parser.add_argument('--cost_model', type=str, default=None,
+                        help='Fitted cost model json (default: the one shipped in src/)')
+    parser.add_argument('--max_minutes', type=float, default=None,
+                        help='Runtime limit for --estimate (default 60)')
+    parser.add_argument('--max_memory_gb', type=float, default=None,
+                        help='Memory limit for --estimate (default 16)')
+    parser.add_argument('--max_disk_gb', type=float, default=None,
+                        help='Output size limit for --estimate (default 20)')
 
     args = parser.parse_args()
 
-    run_pipeline(seed=args.seed, n_sites=args.n_sites, output_dir=args.output)
+    if args.estimate:
+        estimate_pipeline(
+            n_sites=args.n_sites, engine=args.engine, start_date=args.start_date, end_date=args.end_date,
+            n_vendors=args.n_vendors, target_switch_rate=args.target_switch_rate,
+            cost_model_path=args.cost_model,
+            limits={'runtime_minutes': args.max_minutes, 'memory_gb': args.max_memory_gb,
+                    'disk_gb': args.max_disk_gb},
+            n_hard=args.hard_negatives, n_random=args.random_negatives, onboarding=args.onboarding
+        )
+    else:
+        run_pipeline(seed=args.seed, n_sites=args.n_sites, output_dir=args.output,
+                     target_switch_rate=args.target_switch_rate, engine=args.engine,
+                     n_workers=args.workers, contagion=args.contagion,
+                     start_date=args.start_date, end_date=args.end_date,
+                     upgrade_events=upgrade_events_arg(args.upgrades),
+                     n_hard=args.hard_negatives, n_random=args.random_negatives,
+                     onboarding=args.onboarding)
@@ -1,5 +1,5 @@
 """
-generate_initial_state.py -- create baseline contracts for 2019-01-01
+generate_initial_state.py -- create each site's first contracts
 
 Author: Gregory Schwartz
 Date: December 2025
@@ -51,8 +51,11 @@ def select_vendor_for_category(site_id, category, vendors_df, integration_df):
     return vendor_ids[selected_idx]
 
 
-def generate_initial_state(sites_df, vendors_df, integration_df, seed=42):
-    """Generate initial contracts as of 2019-01-01."""
+def generate_initial_state(sites_df, vendors_df, integration_df, seed=42, start_date='2019-01-01'):
+    """Generate initial contracts, starting the month each site joined.
+
+    Sites that joined before start_date start on start_date.
+    """
     np.random.seed(seed)
 
     categories = vendors_df['category'].unique()
@@ -60,6 +63,7 @@ def generate_initial_state(sites_df, vendors_df, integration_df, seed=42):
 
     for site_idx, site in sites_df.iterrows():
         site_id = site['site_id']
+        joined = max(start_date, site['date_joined'][:8] + '01')
 
         for category in categories:
             vendor_id = select_vendor_for_category(
@@ -70,7 +74,7 @@ def generate_initial_state(sites_df, vendors_df, integration_df, seed=42):
                 'site_id': site_id,
                 'category': category,
                 'vendor_id': vendor_id,
-                'contract_start_date': '2019-01-01'
+                'contract_start_date': joined
             })
 
     initial_df = pd.DataFrame(contracts)
@@ -61,13 +61,13 @@ def get_it_msp_integration(vendor_id, ehr):
     return 1  # default partial
 
 
-def get_rcm_integration(tier, ehr):
+def get_rcm_integration(tier, ehr, rng=np.random):
     """Return probabilistic integration for RCM."""
     major_ehrs = ['Dentrix', 'OpenDental', 'Eaglesoft', 'Denticon']
 
     # tier 1 with major ehrs
     if tier == 1 and ehr in major_ehrs:
-        rand = np.random.random()
+        rand = rng.random()
         if rand < 0.80:
             return 2
         elif rand < 0.95:
@@ -75,7 +75,7 @@ def get_rcm_integration(tier, ehr):
         return 0
 
     # other cases
-    rand = np.random.random()
+    rand = rng.random()
     if rand < 0.40:
         return 2
     elif rand < 0.70:
@@ -99,7 +99,7 @@ def get_clearinghouse_integration(vendor_id, ehr):
     return 1
 
 
-def assign_integration_quality(category, vendor_id, tier, ehr):
+def assign_integration_quality(category, vendor_id, tier, ehr, rng=np.random):
     """Determine integration quality for a site-vendor pair."""
 
     # check fixed patterns first
@@ -112,7 +112,7 @@ def assign_integration_quality(category, vendor_id, tier, ehr):
         return get_it_msp_integration(vendor_id, ehr)
 
     if category == 'RCM':
-        return get_rcm_integration(tier, ehr)
+        return get_rcm_integration(tier, ehr, rng)
 
     if category == 'Clearinghouse':
         return get_clearinghouse_integration(vendor_id, ehr)
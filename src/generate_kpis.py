@@ -5,11 +5,84 @@ Author: Gregory Schwartz
 Date: December 2025
 """
 
+import sys
+import zlib
+from pathlib import Path
+
 import numpy as np
 import pandas as pd
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 
+# run as a script: import the rest of src as a package, not as top-level modules
+if not __package__:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    __package__ = Path(__file__).resolve().parent.name
+
+from .encode_tables import join_months
+
+
+# integration bonus factor by quality (api reduces friction)
+INTEGRATION_BONUS_FACTORS = {0: 0.0, 1: -0.2, 2: -0.5}
+
+# same rule for kpis where higher is better
+INTEGRATION_GAIN_FACTORS = {q: -factor for q, factor in INTEGRATION_BONUS_FACTORS.items()}
+
+
+def tier_effect(scale, category_scale=None):
+    """Return a vendor effect rule: scale * (2 - tier), scaled up for some categories."""
+    category_scale = category_scale or {}
+
+    def effect(tier, category):
+        return (2 - tier) * scale * category_scale.get(category, 1.0)
+
+    return effect
+
+
+# registered kpis: vendor effect rule and draw noise, integration bonus by
+# quality, site baseline range, seasonal amplitude, monthly noise and clamp
+KPI_REGISTRY = {}
+
+
+def register_kpi(name, effect, effect_noise, baseline, seasonality, noise, bounds,
+                 integration_bonus=None):
+    """Add a KPI to the registry (evaluated by every engine)."""
+    KPI_REGISTRY[name] = {
+        'effect': effect,
+        'effect_noise': effect_noise,
+        'integration_bonus': INTEGRATION_BONUS_FACTORS if integration_bonus is None else integration_bonus,
+        'baseline': baseline,
+        'seasonality': seasonality,
+        'noise': noise,
+        'bounds': bounds,
+    }
+
+
+register_kpi('days_ar', tier_effect(3.0, {'RCM': 1.5}), 0.5,
+             baseline=(30, 40), seasonality=2.0, noise=1.5, bounds=(15, 60))
+register_kpi('denial_rate', tier_effect(0.5, {'RCM': 1.5}), 0.1,
+             baseline=(5, 9), seasonality=0.3, noise=0.3, bounds=(0, 20))
+register_kpi('collections_rate', tier_effect(-0.8, {'RCM': 2.0, 'Clearinghouse': 1.5}), 0.2,
+             baseline=(89, 94), seasonality=0.5, noise=0.5, bounds=(70, 100),
+             integration_bonus=INTEGRATION_GAIN_FACTORS)
+register_kpi('production_per_chair', tier_effect(-0.6, {'Scheduling': 2.0, 'Lab': 1.5}), 0.2,
+             baseline=(35, 50), seasonality=2.5, noise=2.0, bounds=(10, 90),
+             integration_bonus=INTEGRATION_GAIN_FACTORS)
+register_kpi('no_show_rate', tier_effect(0.5, {'Scheduling': 2.0, 'Telephony': 2.0}), 0.1,
+             baseline=(8, 14), seasonality=1.0, noise=0.8, bounds=(0, 40))
+
+# the original kpis: their draws come from the global stream, every other
+# kpi draws from its own stream (see kpi_rng)
+LEGACY_KPIS = ['days_ar', 'denial_rate']
+
+# entries of a contributions dict that are not kpi matrices
+CONTRIBUTION_METADATA = ('site_ids', 'vendor_ids', 'seed', 'quality_checksum', 'upgrades_checksum')
+
+
+def kpi_rng(seed, name, purpose):
+    """Return the generator for one added KPI's effect, baseline or noise draws."""
+    return np.random.default_rng([seed, zlib.crc32(f'{name}/{purpose}'.encode())])
+
 
 def assign_vendor_effects(vendors_df, seed=42):
     """Assign KPI effects to each vendor based on tier."""
@@ -22,25 +95,21 @@ def assign_vendor_effects(vendors_df, seed=42):
         category = vendor['category']
         tier = vendor['tier']
 
-        # tier effect: tier3=-1, tier2=0, tier1=+1
-        tier_effect = 2 - tier  # simple formula
-
-        # rcm has larger impact
-        if category == 'RCM':
-            days_ar = tier_effect * 3.0 * 1.5
-            denial = tier_effect * 0.5 * 1.5
-        else:
-            days_ar = tier_effect * 3.0
-            denial = tier_effect * 0.5
-
-        # add noise
-        days_ar += np.random.normal(0, 0.5)
-        denial += np.random.normal(0, 0.1)
-
-        effects[vendor_id] = {
-            'days_ar_effect': days_ar,
-            'denial_rate_effect': denial
-        }
+        # tier effect (tier3=-1, tier2=0, tier1=+1) plus noise
+        effects[vendor_id] = {}
+        for kpi in LEGACY_KPIS:
+            spec = KPI_REGISTRY[kpi]
+            value = spec['effect'](tier, category)
+            value += np.random.normal(0, spec['effect_noise'])
+            effects[vendor_id][f'{kpi}_effect'] = value
+
+    for kpi, spec in KPI_REGISTRY.items():
+        if kpi in LEGACY_KPIS:
+            continue
+        noise = kpi_rng(seed, kpi, 'effects').normal(0, spec['effect_noise'], size=len(vendors_df))
+        for vendor_id, category, tier, draw in zip(vendors_df['vendor_id'], vendors_df['category'],
+                                                   vendors_df['tier'], noise):
+            effects[vendor_id][f'{kpi}_effect'] = spec['effect'](tier, category) + draw
 
     return effects
 
@@ -55,10 +124,17 @@ def assign_site_baselines(sites_df, seed=42):
         site_id = site['site_id']
 
         baselines[site_id] = {
-            'baseline_days_ar': np.random.uniform(30, 40),
-            'baseline_denial_rate': np.random.uniform(5, 9)
+            f'baseline_{kpi}': np.random.uniform(*KPI_REGISTRY[kpi]['baseline'])
+            for kpi in LEGACY_KPIS
         }
 
+    for kpi, spec in KPI_REGISTRY.items():
+        if kpi in LEGACY_KPIS:
+            continue
+        draws = kpi_rng(seed, kpi, 'baselines').uniform(*spec['baseline'], size=len(sites_df))
+        for site_id, value in zip(sites_df['site_id'], draws):
+            baselines[site_id][f'baseline_{kpi}'] = value
+
     return baselines
 
 
@@ -100,12 +176,7 @@ def calculate_integration_bonus(vendor_id, site_id, integration_df, vendor_effec
     effects = vendor_effects[vendor_id]
 
     # bonus factor based on quality
-    if quality == 2:
-        factor = -0.5  # api reduces friction
-    elif quality == 1:
-        factor = -0.2
-    else:
-        factor = 0.0
+    factor = INTEGRATION_BONUS_FACTORS.get(quality, 0.0)
 
     days_bonus = factor * abs(effects['days_ar_effect'])
     denial_bonus = factor * abs(effects['denial_rate_effect'])
@@ -113,13 +184,147 @@ def calculate_integration_bonus(vendor_id, site_id, integration_df, vendor_effec
     return days_bonus, denial_bonus
 
 
+def contributions_from_quality(quality, vendor_ids, vendor_effects, kpis=None):
+    """Return kpi x site x vendor (effect + integration bonus) matrices as float32."""
+    kpis = list(KPI_REGISTRY) if kpis is None else kpis
+
+    stacked = np.empty((len(kpis),) + quality.shape, dtype=np.float32)
+    for k, kpi in enumerate(kpis):
+        effect = np.array([vendor_effects[v][f'{kpi}_effect'] for v in vendor_ids])
+
+        factor = np.zeros(quality.shape)
+        for q, value in KPI_REGISTRY[kpi]['integration_bonus'].items():
+            factor[quality == q] = value
+
+        stacked[k] = effect[None, :] + factor * np.abs(effect)[None, :]
+    return stacked
+
+
+def pair_quality(integration_df, site_ids, vendor_ids):
+    """Return the site x vendor integration quality matrix (0 for missing pairs)."""
+    # missing pairs have no bonus, like calculate_integration_bonus
+    quality = integration_df.pivot(index='site_id', columns='vendor_id', values='integration_quality')
+    return quality.reindex(index=site_ids, columns=vendor_ids).fillna(0).to_numpy()
+
+
+def quality_checksum(quality):
+    """Return a crc32 of a site x vendor quality matrix, to tell cached contributions apart."""
+    return zlib.crc32(np.ascontiguousarray(quality, dtype=np.int8).tobytes())
+
+
+def upgrades_checksum(upgrades_df):
+    """Return a crc32 of an upgrade delta log (0 without one), to tell cached contributions apart."""
+    if upgrades_df is None:
+        return 0
+    rows = upgrades_df[['site_id', 'vendor_id', 'effective_date', 'integration_quality']]
+    return zlib.crc32(rows.to_csv(index=False).encode())
+
+
+def build_kpi_contributions(sites_df, vendors_df, integration_df, vendor_effects, kpis=None,
+                            upgrades_df=None, seed=None):
+    """Precompute each site-vendor pair's contribution to every registered KPI.
+
+    The vendor effect plus integration bonus depends only on (site, vendor),
+    so it is computed once here instead of per site-month. With an upgrade
+    delta log (integration_upgrades.py) the matrices stay at the base
+    quality and each upgraded cell's new contribution is stored alongside
+    (upgrade_date, upgrade_site, upgrade_vendor, upgrade_<kpi>). seed (the
+    one vendor_effects came from), quality_checksum and upgrades_checksum
+    are kept so a cache is reused only for the same world and upgrades.
+    """
+    kpis = list(KPI_REGISTRY) if kpis is None else kpis
+    site_ids = sites_df['site_id'].to_numpy()
+    vendor_ids = vendors_df['vendor_id'].to_numpy()
+    quality = pair_quality(integration_df, site_ids, vendor_ids)
+
+    stacked = contributions_from_quality(quality, vendor_ids, vendor_effects, kpis)
+
+    contributions = {
+        'site_ids': site_ids,
+        'vendor_ids': vendor_ids,
+        'quality_checksum': quality_checksum(quality),
+        'upgrades_checksum': upgrades_checksum(upgrades_df),
+    }
+    if seed is not None:
+        contributions['seed'] = seed
+    contributions.update(zip(kpis, stacked))
+
+    if upgrades_df is not None:
+        sites = pd.Index(site_ids).get_indexer(upgrades_df['site_id'])
+        vendors = pd.Index(vendor_ids).get_indexer(upgrades_df['vendor_id'])
+        upgraded = contributions_from_quality(
+            upgrades_df['integration_quality'].to_numpy()[None, :], vendor_ids[vendors], vendor_effects, kpis
+        )
+
+        contributions['upgrade_date'] = upgrades_df['effective_date'].to_numpy().astype(str)
+        contributions['upgrade_site'] = sites
+        contributions['upgrade_vendor'] = vendors
+        contributions.update({f'upgrade_{kpi}': values[0] for kpi, values in zip(kpis, upgraded)})
+
+    return contributions
+
+
+def contribution_stack(contributions, kpis=None):
+    """Stack cached per-KPI matrices into one kpi x site x vendor array."""
+    kpis = list(KPI_REGISTRY) if kpis is None else kpis
+
+    missing = [kpi for kpi in kpis if kpi not in contributions]
+    if missing:
+        raise ValueError(f'KPI contributions missing for: {", ".join(missing)}')
+
+    return np.stack([contributions[kpi] for kpi in kpis])
+
+
+def save_kpi_contributions(contributions, output_path='data/generated/kpi_contributions.npz'):
+    """Cache contribution matrices next to the integration matrix."""
+    matrices = {name: value for name, value in contributions.items() if name not in CONTRIBUTION_METADATA}
+    metadata = {name: contributions[name] for name in CONTRIBUTION_METADATA[2:] if name in contributions}
+    np.savez(
+        output_path,
+        site_ids=contributions['site_ids'].astype(str),
+        vendor_ids=contributions['vendor_ids'].astype(str),
+        **metadata,
+        **matrices
+    )
+    n_kpis = len([name for name in matrices if not name.startswith('upgrade_')])
+    print(f'Saved {n_kpis} x {contributions["days_ar"].shape} KPI contribution matrices to {output_path}')
+
+
+def load_kpi_contributions(input_path='data/generated/kpi_contributions.npz'):
+    """Load cached contribution matrices."""
+    with np.load(input_path) as cached:
+        contributions = {name: cached[name] for name in cached.files}
+    return contributions
+
+
 def generate_kpis(sites_df, vendors_df, integration_df, contracts_df,
-                  start_date='2019-01-01', end_date='2024-12-31', seed=42):
-    """Generate monthly KPIs for all sites."""
+                  start_date='2019-01-01', end_date='2024-12-31', seed=42,
+                  contributions=None, integration_upgrades=None):
+    """Generate every registered KPI monthly for all sites.
+
+    This is the reference loop, with the same columns as the array engines.
+    The LEGACY_KPIS noise comes from the global stream, every other kpi's
+    from its own (kpi_rng). contributions (see build_kpi_contributions)
+    can be passed in to reuse cached matrices; then seed only drives site
+    baselines and noise. Upgrades come with the contributions, or from the
+    integration_upgrades delta log when they are built here.
+    """
     np.random.seed(seed)
 
-    vendor_effects = assign_vendor_effects(vendors_df, seed)
+    kpis = list(KPI_REGISTRY)
+    if contributions is None:
+        vendor_effects = assign_vendor_effects(vendors_df, seed)
+        contributions = build_kpi_contributions(sites_df, vendors_df, integration_df, vendor_effects,
+                                                kpis, integration_upgrades)
+
+    if (list(contributions['site_ids']) != list(sites_df['site_id']) or
+            list(contributions['vendor_ids']) != list(vendors_df['vendor_id'])):
+        raise ValueError('KPI contributions do not match sites/vendors')
+
     site_baselines = assign_site_baselines(sites_df, seed)
+    stacked = contribution_stack(contributions, kpis)
+    noise_sources = [np.random if kpi in LEGACY_KPIS else kpi_rng(seed, kpi, 'noise') for kpi in kpis]
+    vendor_column = {vendor_id: j for j, vendor_id in enumerate(contributions['vendor_ids'])}
 
     sim_start = datetime.strptime(start_date, '%Y-%m-%d')
     sim_end = datetime.strptime(end_date, '%Y-%m-%d')
@@ -132,14 +337,33 @@ def generate_kpis(sites_df, vendors_df, integration_df, contracts_df,
         current = current + relativedelta(months=1)
 
     categories = vendors_df['category'].unique()
+    join_month = join_months(sites_df, months)
     records = []
 
-    for site_id in sites_df['site_id']:
+    # upgraded cells per site, in effective-date order
+    upgrade_site = contributions.get('upgrade_site', np.array([], dtype=np.int64))
+    order = np.argsort(contributions.get('upgrade_date', np.array([], dtype=str)), kind='stable')
+
+    for site_idx, site_id in enumerate(sites_df['site_id']):
         baseline = site_baselines[site_id]
-        baseline_ar = baseline['baseline_days_ar']
-        baseline_denial = baseline['baseline_denial_rate']
 
-        for month in months:
+        # kpi x vendor contributions of this site
+        site_contributions = stacked[:, site_idx]
+
+        site_upgrades = list(order[upgrade_site[order] == site_idx])
+        if site_upgrades:
+            site_contributions = site_contributions.copy()
+
+        # months from the site's onboarding on
+        for month in months[join_month[site_idx]:]:
+            # upgrades taking effect by this month
+            month_str = month.strftime('%Y-%m-%d')
+            while site_upgrades and contributions['upgrade_date'][site_upgrades[0]] <= month_str:
+                row = site_upgrades.pop(0)
+                column = contributions['upgrade_vendor'][row]
+                for k, kpi in enumerate(kpis):
+                    site_contributions[k, column] = contributions[f'upgrade_{kpi}'][row]
+
             # find active vendors
             active_vendors = {}
             for category in categories:
@@ -147,51 +371,24 @@ def generate_kpis(sites_df, vendors_df, integration_df, contracts_df,
                 if vendor_id:
                     active_vendors[category] = vendor_id
 
-            # sum vendor effects
-            total_ar_effect = 0.0
-            total_denial_effect = 0.0
-
-            for category, vendor_id in active_vendors.items():
-                effects = vendor_effects[vendor_id]
-                total_ar_effect += effects['days_ar_effect']
-                total_denial_effect += effects['denial_rate_effect']
-
-            # sum integration bonuses
-            total_ar_bonus = 0.0
-            total_denial_bonus = 0.0
-
-            for category, vendor_id in active_vendors.items():
-                ar_bonus, denial_bonus = calculate_integration_bonus(
-                    vendor_id, site_id, integration_df, vendor_effects
-                )
-                total_ar_bonus += ar_bonus
-                total_denial_bonus += denial_bonus
-
-            # seasonality
-            month_num = month.month
-            season_ar = 2.0 * np.sin(2 * np.pi * month_num / 12)
-            season_denial = 0.3 * np.sin(2 * np.pi * month_num / 12)
-
-            # noise
-            noise_ar = np.random.normal(0, 1.5)
-            noise_denial = np.random.normal(0, 0.3)
-
-            # final values
-            days_ar = (baseline_ar + total_ar_effect + total_ar_bonus +
-                       season_ar + noise_ar)
-            denial_rate = (baseline_denial + total_denial_effect + total_denial_bonus +
-                           season_denial + noise_denial)
-
-            # clamp to realistic
-            days_ar = max(15, min(60, days_ar))
-            denial_rate = max(0, min(20, denial_rate))
-
-            records.append({
-                'site_id': site_id,
-                'month': month.strftime('%Y-%m-%d'),
-                'days_ar': round(days_ar, 2),
-                'denial_rate': round(denial_rate, 2)
-            })
+            # sum vendor effects and integration bonuses (precomputed)
+            columns = [vendor_column[vendor_id] for vendor_id in active_vendors.values()]
+            record = {'site_id': site_id, 'month': month_str}
+
+            for k, kpi in enumerate(kpis):
+                spec = KPI_REGISTRY[kpi]
+                total = float(site_contributions[k, columns].sum(dtype=np.float64))
+
+                # seasonality and noise
+                season = spec['seasonality'] * np.sin(2 * np.pi * month.month / 12)
+                noise = noise_sources[k].normal(0, spec['noise'])
+
+                # final value, clamped to realistic
+                value = baseline[f'baseline_{kpi}'] + total + season + noise
+                value = max(spec['bounds'][0], min(spec['bounds'][1], value))
+                record[kpi] = round(value, 2)
+
+            records.append(record)
 
     kpis_df = pd.DataFrame(records)
     return kpis_df
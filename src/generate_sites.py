@@ -10,7 +10,15 @@ import pandas as pd
 from datetime import datetime, timedelta
 
 
-def generate_sites(n_sites=100, seed=42):
+# share of sites joining in each year: everyone onboarded during 2019, or
+# an acquisition roll-up adding practices at a growing pace
+ONBOARDING_SCENARIOS = {
+    'baseline': {2019: 1.0},
+    'growth': {2019: 0.10, 2020: 0.12, 2021: 0.15, 2022: 0.18, 2023: 0.20, 2024: 0.25},
+}
+
+
+def generate_sites(n_sites=100, seed=42, onboarding='baseline'):
     """Generate n_sites synthetic dental practices."""
     np.random.seed(seed)
 
@@ -31,12 +39,15 @@ def generate_sites(n_sites=100, seed=42):
         p=[0.35, 0.25, 0.20, 0.10, 0.10]
     )
 
-    # dates joined throughout 2019
-    start_date = datetime(2019, 1, 1)
+    # dates joined throughout the scenario's years (2019 by default)
+    join_years = list(ONBOARDING_SCENARIOS[onboarding])
+    year_shares = np.array(list(ONBOARDING_SCENARIOS[onboarding].values()))
     days_in_year = 364  # maybe use 365?
 
     dates_joined = []
     for i in range(n_sites):
+        year = join_years[0] if len(join_years) == 1 else np.random.choice(join_years, p=year_shares)
+        start_date = datetime(year, 1, 1)
         random_days = int(np.random.uniform(0, days_in_year))
         join_date = start_date + timedelta(days=random_days)
         dates_joined.append(join_date.strftime('%Y-%m-%d'))
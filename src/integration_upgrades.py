@@ -0,0 +1,176 @@
+"""
+integration_upgrades.py -- dated integration upgrades as a delta log
+
+Author: Gregory Schwartz
+Date: December 2025
+
+Vendors ship new EHR integrations mid-horizon (a clearinghouse adding a
+Dentrix API, say). An upgrade event names a vendor, an EHR and the quality
+it reaches from a date. Expanded over the sites running that EHR it becomes
+a delta log: one row per (site, vendor) cell whose quality rises, sorted by
+effective date. The base integration matrix stays as generated; quality
+in any month is the base with the log rows up to that month applied.
+
+An event takes effect from the first simulated month on or after its date.
+Events only raise quality, so a cell already at or above the event's
+quality gets no row.
+
+The engines never rebuild the matrix per month. They keep one working
+copy and apply each month's rows when the simulation reaches them
+(upgrade_rows), and KPI contributions change only for the upgraded cells.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .encode_tables import encode_tables
+
+
+# default upgrade events (vendor ships a full api for one ehr)
+UPGRADE_EVENTS = [
+    # tech4dentists certifies its managed it stack on curve
+    {'date': '2020-10-01', 'vendor_id': 'V018', 'ehr_system': 'Curve', 'integration_quality': 2},
+    # dentalxchange ships a dentrix api
+    {'date': '2021-07-01', 'vendor_id': 'V014', 'ehr_system': 'Dentrix', 'integration_quality': 2},
+    # nea fastattach adds claims for open dental
+    {'date': '2022-04-01', 'vendor_id': 'V015', 'ehr_system': 'OpenDental', 'integration_quality': 2},
+    # dental billing solutions certifies on eaglesoft
+    {'date': '2023-01-01', 'vendor_id': 'V007', 'ehr_system': 'Eaglesoft', 'integration_quality': 2},
+]
+
+
+def load_upgrade_events(input_path):
+    """Read upgrade events (date, vendor_id, ehr_system, integration_quality) from csv."""
+    events_df = pd.read_csv(input_path, dtype={'date': str})
+    return events_df.to_dict('records')
+
+
+def upgrade_events_arg(value):
+    """Resolve an --upgrades value: None (off), 'default' or an events csv path."""
+    if value is None:
+        return None
+    if value == 'default':
+        return UPGRADE_EVENTS
+    return load_upgrade_events(value)
+
+
+def generate_integration_upgrades(sites_df, vendors_df, integration_df, events=None):
+    """Expand upgrade events into the per-cell delta log.
+
+    Returns one row per upgraded (site, vendor) with the quality before and
+    after, sorted by effective_date.
+    """
+    events = UPGRADE_EVENTS if events is None else events
+    tables = encode_tables(sites_df, vendors_df, integration_df)
+    vendor_index = pd.Index(tables['vendor_ids'])
+    ehr = sites_df['ehr_system'].to_numpy()
+
+    # working copy so a later event sees earlier upgrades
+    quality = tables['quality'].copy()
+
+    columns = {'site': [], 'vendor': [], 'date': [], 'previous': [], 'quality': []}
+    for event in sorted(events, key=lambda e: e['date']):
+        vendor = vendor_index.get_loc(event['vendor_id'])
+        sites = np.flatnonzero(ehr == event['ehr_system'])
+
+        previous = quality[sites, vendor]
+        raised = previous < event['integration_quality']
+        sites = sites[raised]
+
+        columns['site'].append(sites)
+        columns['vendor'].append(np.full(len(sites), vendor))
+        columns['date'].append(np.full(len(sites), event['date'], dtype=object))
+        columns['previous'].append(previous[raised])
+        columns['quality'].append(np.full(len(sites), event['integration_quality']))
+
+        quality[sites, vendor] = event['integration_quality']
+
+    columns = {name: np.concatenate(parts) if parts else np.array([], dtype=np.int64)
+               for name, parts in columns.items()}
+
+    upgrades_df = pd.DataFrame({
+        'site_id': tables['site_ids'][columns['site'].astype(np.int64)],
+        'vendor_id': tables['vendor_ids'][columns['vendor'].astype(np.int64)],
+        'effective_date': columns['date'].astype(str),
+        'previous_quality': columns['previous'].astype(np.int64),
+        'integration_quality': columns['quality'].astype(np.int64),
+    })
+    return upgrades_df
+
+
+def save_integration_upgrades(upgrades_df, output_path='data/generated/integration_upgrades.csv'):
+    """Save the upgrade delta log to csv."""
+    upgrades_df.to_csv(output_path, index=False)
+    print(f'Saved {len(upgrades_df)} integration upgrades to {output_path}')
+
+
+def encode_upgrades(upgrades_df, tables, months):
+    """Encode the delta log as arrays sorted by effective month index.
+
+    Rows dated after the last month are dropped; rows dated before the first
+    month apply from month 0.
+    """
+    month_strs = np.array([m.strftime('%Y-%m-%d') for m in months])
+    t = np.searchsorted(month_strs, upgrades_df['effective_date'].to_numpy().astype(str), side='left')
+
+    order = np.argsort(t, kind='stable')
+    order = order[t[order] < len(months)]
+
+    log = {
+        't': t[order],
+        'site': pd.Index(tables['site_ids']).get_indexer(upgrades_df['site_id'])[order],
+        'vendor': pd.Index(tables['vendor_ids']).get_indexer(upgrades_df['vendor_id'])[order],
+        'previous': upgrades_df['previous_quality'].to_numpy().astype(np.int8)[order],
+        'quality': upgrades_df['integration_quality'].to_numpy().astype(np.int8)[order],
+    }
+    return log
+
+
+def upgrade_rows(log, t):
+    """Return the slice of log rows taking effect exactly in month t."""
+    return slice(*np.searchsorted(log['t'], [t, t + 1], side='left'))
+
+
+def quality_as_of(quality, log, t):
+    """Return the site x vendor quality matrix in effect in month t."""
+    n_rows = np.searchsorted(log['t'], t, side='right')
+    current = quality.copy()
+
+    # upgrades only raise quality, so the max is the latest row per cell
+    np.maximum.at(current, (log['site'][:n_rows], log['vendor'][:n_rows]), log['quality'][:n_rows])
+    return current
+
+
+def quality_at(quality, log, t, site, vendor):
+    """Return the quality of (site, vendor) cells in months t (broadcast arrays)."""
+    t, site, vendor = np.broadcast_arrays(np.asarray(t), np.asarray(site), np.asarray(vendor))
+    n_vendors = quality.shape[1]
+    horizon = max(int(log['t'].max(initial=0)), int(t.max(initial=0))) + 1
+
+    # rows sorted by (cell, month): the last key <= the query is the answer
+    cell = log['site'].astype(np.int64) * n_vendors + log['vendor']
+    key = cell * horizon + log['t']
+    order = np.argsort(key, kind='stable')
+    key, cell = key[order], cell[order]
+
+    query_cell = site.astype(np.int64) * n_vendors + vendor
+    row = np.searchsorted(key, query_cell * horizon + t, side='right') - 1
+    hit = (row >= 0) & (cell[np.maximum(row, 0)] == query_cell)
+
+    return np.where(hit, log['quality'][order][np.maximum(row, 0)], quality[site, vendor])
+
+
+def quality_snapshots(quality, log, periods):
+    """Return the quality matrix for each period as a (period, site, vendor) array.
+
+    periods are sorted month indices. Each change month writes its rows into
+    every period from that month on, in one assignment.
+    """
+    periods = np.asarray(periods)
+    snapshots = np.repeat(quality[None], len(periods), axis=0)
+
+    for t in np.unique(log['t']):
+        rows = upgrade_rows(log, t)
+        first = np.searchsorted(periods, t, side='left')
+        snapshots[first:, log['site'][rows], log['vendor'][rows]] = log['quality'][rows]
+    return snapshots
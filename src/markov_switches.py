@@ -0,0 +1,305 @@
+"""
+markov_switches.py -- analytic expected switches via per-site-type Markov chains
+
+Author: Gregory Schwartz
+Date: December 2025
+
+The monthly hazard in calculate_switch_probability depends only on the
+current vendor's integration quality and the fatigue bucket, and the
+replacement vendor follows the softmax in select_new_vendor. So each
+(site, category) is a Markov chain over (current vendor, months since last
+change), with months capped at 24 where the fatigue bucket stops changing.
+
+Sites with the same quality row over a category's vendors (EHR plus the
+RCM draws) share one chain, so the cost depends on the number of distinct
+site types, not on n_sites. Expected switch counts and vendor shares are
+exact for the mechanism; no sampling is involved.
+
+With staggered onboarding the join month is part of the site type: a
+chain holds no mass until its sites join, and rates are per active
+contract-year. With dated integration upgrades, so is the site's upgrade
+trajectory over the category's vendors; each chain's quality, hazard and
+replacement weights change in the months its upgrades take effect.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .encode_tables import selection_weights
+from .vectorized_engine import default_mechanism, FATIGUE_EDGES
+
+
+# months-since-change states 0..24, the last one meaning "24 or more"
+MAX_MONTHS_TRACKED = FATIGUE_EDGES[-1]
+
+
+def replacement_transition(weights):
+    """Return (group, from slot, to slot) replacement probabilities from slot weights."""
+    n_slots = weights.shape[1]
+
+    # replacement choice excludes the current vendor
+    transition = np.repeat(weights[:, None, :], n_slots, axis=1)
+    transition[:, np.arange(n_slots), np.arange(n_slots)] = 0.0
+    totals = transition.sum(axis=2, keepdims=True)
+    return np.divide(transition, totals, out=np.zeros_like(transition), where=totals > 0)
+
+
+def upgrade_trajectories(upgrades, members, n_sites):
+    """Return a trajectory id per site and each id's (month, slot, quality) changes.
+
+    Only upgrade rows for the given category members count; id 0 is the
+    empty trajectory.
+    """
+    slot_of = {vendor: slot for slot, vendor in enumerate(members)}
+    changes = [[] for _ in range(n_sites)]
+    for row in np.flatnonzero(np.isin(upgrades['vendor'], members)):
+        changes[upgrades['site'][row]].append(
+            (int(upgrades['t'][row]), slot_of[upgrades['vendor'][row]], int(upgrades['quality'][row])))
+
+    ids = {(): 0}
+    site_ids = np.array([ids.setdefault(tuple(c), len(ids)) for c in changes], dtype=np.int64)
+    return site_ids, list(ids)
+
+
+def build_switch_chains(tables, initial_vendors=None, join_month=None, upgrades=None):
+    """Group (site, category) pairs into distinct Markov chains.
+
+    Without initial_vendors the starting vendor follows the softmax used by
+    generate_initial_state; with a site x category array of vendor indices
+    the realized initial state is used instead. join_month (per site, see
+    encode_tables.join_months) starts each chain when its sites join;
+    None means every site is active from month 0. upgrades is an encoded
+    delta log (integration_upgrades.encode_upgrades).
+    """
+    quality = tables['quality']
+    slot_vendors = tables['category_vendors']
+    n_slots = slot_vendors.shape[1]
+    weights = selection_weights(tables)
+    n_sites = len(tables['site_ids'])
+    if join_month is None:
+        join_month = np.zeros(n_sites, dtype=np.int64)
+
+    group_category = []
+    group_count = []
+    group_quality = []
+    group_weights = []
+    group_initial = []
+    group_join = []
+    group_tier = []
+    group_changes = []
+
+    for c in range(len(tables['categories'])):
+        members = slot_vendors[c][slot_vendors[c] >= 0]
+        n_members = len(members)
+
+        if initial_vendors is None:
+            key = quality[:, members]
+        else:
+            # realized start vendor becomes part of the site type
+            start_slot = (initial_vendors[:, c][:, None] == members[None, :]).argmax(axis=1)
+            key = np.column_stack([quality[:, members], start_slot])
+
+        trajectory, trajectories = np.zeros(n_sites, dtype=np.int64), [()]
+        if upgrades is not None:
+            trajectory, trajectories = upgrade_trajectories(upgrades, members, n_sites)
+        key = np.column_stack([key, trajectory, join_month])
+
+        patterns, first, inverse, counts = np.unique(
+            key, axis=0, return_index=True, return_inverse=True, return_counts=True
+        )
+
+        for g in range(len(patterns)):
+            site = first[g]
+
+            q = np.zeros(n_slots, dtype=np.int64)
+            q[:n_members] = quality[site, members]
+
+            w = np.zeros(n_slots)
+            w[:n_members] = weights[site, members]
+
+            start = np.zeros(n_slots)
+            if initial_vendors is None:
+                start[:n_members] = w[:n_members] / w[:n_members].sum()
+            else:
+                start[start_slot[site]] = 1.0
+
+            tier = np.zeros(n_slots)
+            tier[:n_members] = tables['vendor_tier'][members]
+
+            group_category.append(c)
+            group_count.append(counts[g])
+            group_quality.append(q)
+            group_weights.append(w)
+            group_initial.append(start)
+            group_join.append(join_month[site])
+            group_tier.append(tier)
+            group_changes.extend((t, len(group_category) - 1, slot, q)
+                                 for t, slot, q in trajectories[trajectory[site]])
+
+    group_weights = np.array(group_weights)
+    transition = replacement_transition(group_weights)
+
+    # every group's upgrades as (month, group, slot, quality) rows in month order
+    changes = np.array(sorted(group_changes), dtype=np.int64).reshape(-1, 4)
+
+    chains = {
+        'category': np.array(group_category),
+        'count': np.array(group_count, dtype=np.float64),
+        'quality': np.array(group_quality),
+        'initial': np.array(group_initial),
+        'join': np.array(group_join, dtype=np.int64),
+        'weights': group_weights,
+        'tier': np.array(group_tier),
+        'transition': transition,
+        'has_alternative': transition.sum(axis=2) > 0,
+        'upgrades': {'t': changes[:, 0], 'group': changes[:, 1], 'slot': changes[:, 2], 'quality': changes[:, 3]},
+        'n_sites': len(tables['site_ids']),
+        'n_categories': len(tables['categories']),
+        'slot_vendors': slot_vendors,
+        'n_vendors': len(tables['vendor_ids']),
+    }
+    return chains
+
+
+def expected_switches(chains, n_months, base_annual=0.05, integration_mult=None,
+                      fatigue_mult=None, n_sites=None):
+    """Propagate every chain over the horizon and return expected outcomes.
+
+    n_sites rescales totals to a portfolio of that size with the same mix
+    of site types (defaults to the number of encoded sites).
+    """
+    ref_base, ref_integration, ref_fatigue = default_mechanism()
+    integration_mult = ref_integration[0] if integration_mult is None else np.asarray(integration_mult)
+    fatigue_mult = ref_fatigue[0] if fatigue_mult is None else np.asarray(fatigue_mult)
+    n_sites = chains['n_sites'] if n_sites is None else n_sites
+
+    base_monthly = 1 - (1 - base_annual) ** (1 / 12)
+    n_states = MAX_MONTHS_TRACKED + 1
+
+    # hazard for (group, slot, months since change after advancing)
+    fatigue = fatigue_mult[np.digitize(np.arange(n_states), FATIGUE_EDGES)]
+
+    def chain_hazard(quality, groups=slice(None)):
+        hazard = base_monthly * integration_mult[quality[groups]][:, :, None] * fatigue[None, None, :]
+        return np.minimum(hazard, 1.0) * chains['has_alternative'][groups][:, :, None]
+
+    # upgrades change quality, hazard and replacement weights in place
+    quality = chains['quality'].copy()
+    weights = chains['weights'].copy()
+    transition = chains['transition'].copy()
+    hazard = chain_hazard(quality)
+    upgrades = chains['upgrades']
+    next_upgrade = 0
+
+    # chains hold mass from their join month on
+    state = np.zeros(chains['initial'].shape + (n_states,))
+    state[:, :, 0] = chains['initial'] * (chains['join'] == 0)[:, None]
+
+    scale = chains['count'] * (n_sites / chains['n_sites'])
+    n_vendors = chains['n_vendors']
+    flat_vendor = chains['slot_vendors'][chains['category']]
+
+    switches_by_month = np.zeros(n_months)
+    switches_by_quality = np.zeros(3)
+    vendor_shares = np.zeros((n_months, n_vendors))
+
+    def record_shares(t):
+        occupancy = state.sum(axis=2) * scale[:, None]
+        valid = flat_vendor >= 0
+        vendor_shares[t] = np.bincount(flat_vendor[valid], weights=occupancy[valid], minlength=n_vendors)
+
+        # shares within each vendor's category, over the sites active so far
+        active_sites = scale[chains['join'] <= t].sum() / chains['n_categories']
+        if active_sites > 0:
+            vendor_shares[t] /= active_sites
+
+    record_shares(0)
+
+    for t in range(1, n_months):
+        # upgrades dated month 0 or earlier take effect at month 1, as in the simulation
+        stop = np.searchsorted(upgrades['t'], t, side='right')
+        if stop > next_upgrade:
+            rows = slice(next_upgrade, stop)
+            group, slot = upgrades['group'][rows], upgrades['slot'][rows]
+            quality[group, slot] = upgrades['quality'][rows]
+            weights[group, slot] = np.exp(0.5 * quality[group, slot] + 0.3 * chains['tier'][group, slot])
+
+            changed = np.unique(group)
+            hazard[changed] = chain_hazard(quality, changed)
+            transition[changed] = replacement_transition(weights[changed])
+            next_upgrade = stop
+
+        # one more month since last change, 24+ is absorbing
+        advanced = np.zeros_like(state)
+        advanced[:, :, 1:] = state[:, :, :-1]
+        advanced[:, :, -1] += state[:, :, -1]
+
+        leaving = advanced * hazard
+        switch_mass = leaving.sum(axis=2)
+
+        state = advanced - leaving
+        state[:, :, 0] += np.einsum('gj,gjk->gk', switch_mass, transition)
+        state[:, :, 0] += chains['initial'] * (chains['join'] == t)[:, None]
+
+        weighted = switch_mass * scale[:, None]
+        switches_by_month[t] = weighted.sum()
+        switches_by_quality += np.bincount(quality.ravel(), weights=weighted.ravel(), minlength=3)[:3]
+
+        record_shares(t)
+
+    # exposure: contract-months from each chain's join month to the end
+    total = switches_by_month.sum()
+    contract_months = (scale * np.maximum(n_months - chains['join'], 0)).sum()
+
+    result = {
+        'expected_switches': total,
+        'annual_switch_rate': total / (contract_months / 12),
+        'switches_by_month': switches_by_month,
+        'switches_by_quality': switches_by_quality,
+        'vendor_shares': vendor_shares,
+        'n_sites': n_sites,
+    }
+    return result
+
+
+def calibrate_base_annual(chains, n_months, target_rate, integration_mult=None,
+                          fatigue_mult=None, tol=1e-7, max_iter=100):
+    """Solve for the base_annual that gives the target annual switch rate."""
+
+    def rate(base_annual):
+        return expected_switches(
+            chains, n_months, base_annual, integration_mult, fatigue_mult
+        )['annual_switch_rate']
+
+    # expected rate increases monotonically with base_annual
+    low, high = 0.0, 0.999
+    if not rate(low) <= target_rate <= rate(high):
+        raise ValueError(f'Target switch rate {target_rate} is not reachable')
+
+    for _ in range(max_iter):
+        mid = (low + high) / 2
+        if rate(mid) < target_rate:
+            low = mid
+        else:
+            high = mid
+        if high - low < tol:
+            break
+
+    return (low + high) / 2
+
+
+def vendor_share_frame(result, tables, months):
+    """Return expected vendor shares as a month x vendor dataframe."""
+    shares_df = pd.DataFrame(
+        result['vendor_shares'],
+        columns=tables['vendor_ids'],
+        index=[m.strftime('%Y-%m-%d') for m in months]
+    )
+    shares_df.index.name = 'month'
+    return shares_df
+
+
+def save_vendor_shares(shares_df, output_path='data/generated/expected_vendor_shares.csv'):
+    """Save expected vendor share trajectories to csv."""
+    shares_df.to_csv(output_path)
+    print(f'Saved {len(shares_df)} months of expected vendor shares to {output_path}')
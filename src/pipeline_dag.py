@@ -0,0 +1,192 @@
+"""
+pipeline_dag.py -- dependency-graph scheduler for pipeline stages
+
+Author: Gregory Schwartz
+Date: December 2025
+
+A stage is a dict naming its inputs and outputs:
+
+    {'name': 'integration', 'inputs': ['sites', 'vendors'],
+     'outputs': ['integration_matrix'], 'run': fn, 'global_rng': True,
+     'writes': {'integration_matrix': save_fn}}
+
+run receives the input values in order and returns the outputs (a tuple
+when there are several). A stage starts as soon as every input exists, on
+a thread pool, so independent stages overlap. Each output listed in writes
+is handed to a separate writer pool as soon as it is produced, so saving
+one table overlaps computing the next.
+
+The reference generators reseed and draw from the global np.random state,
+so stages marked global_rng hold one lock while they run. Each of them
+seeds itself on entry, which keeps the output identical to a sequential
+run whatever order the scheduler picks.
+
+What a stage or write prints is buffered on its pool thread and printed
+by the scheduler when that node finishes, so lines from concurrent
+writers never run into each other.
+"""
+
+import io
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import nullcontext, redirect_stdout
+
+import pandas as pd
+
+
+def stage_dependencies(stages, context=None):
+    """Map each stage name to the stages producing its inputs."""
+    context = context or {}
+
+    producers = {}
+    for stage in stages:
+        for output in stage['outputs']:
+            if output in producers:
+                raise ValueError(f'Output {output} produced by both {producers[output]} and {stage["name"]}')
+            producers[output] = stage['name']
+
+    dependencies = {}
+    for stage in stages:
+        missing = [name for name in stage['inputs'] if name not in producers and name not in context]
+        if missing:
+            raise ValueError(f'Stage {stage["name"]} has no producer for: {", ".join(missing)}')
+        dependencies[stage['name']] = sorted({producers[name] for name in stage['inputs'] if name in producers})
+
+    return dependencies
+
+
+class ThreadOutput:
+    """Stand-in for sys.stdout that buffers prints made inside capture per thread."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        buffer = getattr(self.local, 'buffer', None)
+        return (self.stream if buffer is None else buffer).write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def capture(self, fn, *args):
+        """Call fn, returning its result and what it printed."""
+        self.local.buffer = io.StringIO()
+        try:
+            return fn(*args), self.local.buffer.getvalue()
+        except BaseException:
+            self.stream.write(self.local.buffer.getvalue())
+            raise
+        finally:
+            self.local.buffer = None
+
+
+def run_dag(stages, n_workers=4, n_writers=2, context=None):
+    """Run stages as their inputs become available.
+
+    Returns (context, timings): every produced value by name, and one
+    timing row per stage and per write (seconds from the start of the run).
+    """
+    context = dict(context or {})
+    dependencies = stage_dependencies(stages, context)
+    rng_lock = threading.Lock()
+    run_start = time.perf_counter()
+
+    timings = []
+    stdout = ThreadOutput(sys.stdout)
+
+    def execute(stage):
+        lock = rng_lock if stage.get('global_rng') else nullcontext()
+        with lock:
+            start = time.perf_counter()
+            values, printed = stdout.capture(stage['run'], *[context[name] for name in stage['inputs']])
+            end = time.perf_counter()
+
+        if len(stage['outputs']) == 1:
+            values = (values,)
+        return dict(zip(stage['outputs'], values)), start, end, printed
+
+    def write(save, value):
+        start = time.perf_counter()
+        _, printed = stdout.capture(save, value)
+        return start, time.perf_counter(), printed
+
+    pending = {stage['name']: stage for stage in stages}
+    done = set()
+    running = {}
+    writing = {}
+
+    with redirect_stdout(stdout), ThreadPoolExecutor(max_workers=n_workers) as compute_pool, \
+            ThreadPoolExecutor(max_workers=n_writers) as write_pool:
+
+        while pending or running or writing:
+            # submit every stage whose inputs exist
+            for name in [n for n, s in pending.items() if all(d in done for d in dependencies[n])]:
+                stage = pending.pop(name)
+                running[compute_pool.submit(execute, stage)] = stage
+
+            if not running and not writing:
+                raise ValueError(f'Dependency cycle among stages: {", ".join(pending)}')
+
+            finished, _ = wait(list(running) + list(writing), return_when=FIRST_COMPLETED)
+            for future in finished:
+                if future in writing:
+                    stage_name, output = writing.pop(future)
+                    start, end, printed = future.result()
+                    stdout.stream.write(printed)
+                    timings.append({
+                        'node': f'write:{output}', 'kind': 'write', 'depends_on': stage_name,
+                        'start': start - run_start, 'end': end - run_start,
+                    })
+                    continue
+
+                stage = running.pop(future)
+                values, start, end, printed = future.result()
+                stdout.stream.write(printed)
+                context.update(values)
+                done.add(stage['name'])
+                timings.append({
+                    'node': stage['name'], 'kind': 'stage',
+                    'depends_on': ','.join(dependencies[stage['name']]),
+                    'start': start - run_start, 'end': end - run_start,
+                })
+
+                for output, save in stage.get('writes', {}).items():
+                    writing[write_pool.submit(write, save, values[output])] = (stage['name'], output)
+
+    timings_df = pd.DataFrame(timings).sort_values('start', ignore_index=True)
+    timings_df['duration'] = timings_df['end'] - timings_df['start']
+    timings_df['critical'] = timings_df['node'].isin(critical_path(timings_df))
+    return context, timings_df
+
+
+def critical_path(timings_df):
+    """Return the chain of nodes that determined the total run time.
+
+    Starts from the node that finished last and repeatedly steps to the
+    dependency that finished last.
+    """
+    end = dict(zip(timings_df['node'], timings_df['end']))
+    depends_on = {node: [d for d in deps.split(',') if d]
+                  for node, deps in zip(timings_df['node'], timings_df['depends_on'])}
+
+    path = [timings_df.loc[timings_df['end'].idxmax(), 'node']]
+    while depends_on[path[-1]]:
+        path.append(max(depends_on[path[-1]], key=end.get))
+    return path[::-1]
+
+
+def print_timings(timings_df):
+    """Print per-node timings and the critical-path summary."""
+    print(f'\n{"node":<32} {"start":>8} {"end":>8} {"seconds":>8}')
+    for row in timings_df.itertuples(index=False):
+        marker = '*' if row.critical else ' '
+        print(f'{marker}{row.node:<31} {row.start:8.3f} {row.end:8.3f} {row.duration:8.3f}')
+
+    path = timings_df[timings_df['critical']].sort_values('start')
+    wall = timings_df['end'].max()
+    print(f'\nCritical path (*): {" -> ".join(path["node"])}')
+    print(f'  {path["duration"].sum():.3f}s on the path, {wall:.3f}s wall, '
+          f'{timings_df["duration"].sum():.3f}s of work')
@@ -0,0 +1,170 @@
+"""
+portfolio_spend.py -- monthly portfolio spend from contract intervals
+
+Author: Gregory Schwartz
+Date: December 2025
+
+Every contract bills its vendor's monthly_price_per_site for each month
+from its start up to (not including) its end month, so in a switch month
+only the new vendor is billed. Open contracts run to the end of the
+horizon.
+
+Spend is never expanded to one row per contract-month. Each contract adds
+its price at its start month and subtracts it at its end month in a
+difference array over the integer month axis (one row per vendor, category
+or region), and a cumulative sum along months turns that into the monthly
+series. Active contract counts come from the same pass with unit weights.
+
+Consolidation savings price every category's active contract-months at its
+cheapest vendor, i.e. what the portfolio would pay with one vendor per
+category. Integration quality and switching costs are not counted.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# run as a script: import the rest of src as a package, not as top-level modules
+if not __package__:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    __package__ = Path(__file__).resolve().parent.name
+
+from .encode_tables import get_months
+
+
+# grouping levels: the contract column each level aggregates by
+SPEND_LEVELS = {'vendor': 'vendor_id', 'category': 'category', 'region': 'region'}
+
+
+def contract_intervals(contracts_df, months):
+    """Return (start, end) month indices of each contract, end exclusive.
+
+    Open contracts and contracts ending after the horizon end at
+    len(months); contracts starting after it are empty intervals.
+    """
+    month_strs = np.array([m.strftime('%Y-%m-%d') for m in months])
+    start = np.searchsorted(month_strs, contracts_df['contract_start_date'].to_numpy().astype(str), side='left')
+
+    end_dates = contracts_df['contract_end_date']
+    end = np.full(len(contracts_df), len(months), dtype=np.int64)
+    closed = end_dates.notna().to_numpy()
+    end[closed] = np.searchsorted(month_strs, end_dates[closed].to_numpy().astype(str), side='left')
+
+    return start, np.maximum(end, start)
+
+
+def interval_totals(start, end, group, n_groups, n_months, weights=None):
+    """Sum weights over [start, end) intervals into a group x month array.
+
+    Each interval adds its weight at start and removes it at end in a
+    difference array; the cumulative sum over months gives the totals.
+    """
+    weights = np.ones(len(start)) if weights is None else weights
+    width = n_months + 1
+
+    diff = np.bincount(group * width + start, weights=weights, minlength=n_groups * width)
+    diff -= np.bincount(group * width + end, weights=weights, minlength=n_groups * width)
+    return np.cumsum(diff.reshape(n_groups, width), axis=1)[:, :n_months]
+
+
+def generate_portfolio_spend(sites_df, vendors_df, contracts_df, start_date='2019-01-01', end_date='2024-12-31'):
+    """Return monthly spend per vendor, category and region.
+
+    One row per (level, key, month) with the active contract count and
+    spend, where level is a SPEND_LEVELS name and key the vendor_id,
+    category or region.
+    """
+    months = get_months(start_date, end_date)
+    month_strs = np.array([m.strftime('%Y-%m-%d') for m in months])
+    start, end = contract_intervals(contracts_df, months)
+
+    price = vendors_df.set_index('vendor_id')['monthly_price_per_site']
+    contracts = contracts_df.assign(
+        region=contracts_df['site_id'].map(sites_df.set_index('site_id')['region']),
+        price=contracts_df['vendor_id'].map(price).to_numpy().astype(np.float64),
+    )
+    level_keys = {
+        'vendor': vendors_df['vendor_id'].to_numpy(),
+        'category': vendors_df['category'].unique(),
+        'region': np.sort(sites_df['region'].unique()),
+    }
+
+    frames = []
+    for level, column in SPEND_LEVELS.items():
+        keys = level_keys[level]
+        group = pd.Index(keys).get_indexer(contracts[column])
+
+        active = interval_totals(start, end, group, len(keys), len(months))
+        spend = interval_totals(start, end, group, len(keys), len(months), contracts['price'].to_numpy())
+
+        frames.append(pd.DataFrame({
+            'level': level,
+            'key': np.repeat(keys, len(months)),
+            'month': np.tile(month_strs, len(keys)),
+            'active_contracts': np.rint(active).astype(np.int64).ravel(),
+            'spend': spend.ravel(),
+        }))
+
+    spend_df = pd.concat(frames, ignore_index=True)
+    return spend_df
+
+
+def consolidation_savings(spend_df, vendors_df):
+    """Return per-category savings from moving every contract to its cheapest vendor.
+
+    Uses the category series of spend_df: consolidated spend is the active
+    contract-months times the cheapest price in the category.
+    """
+    by_category = spend_df[spend_df['level'] == 'category'].groupby('key', sort=False)
+    totals = by_category[['active_contracts', 'spend']].sum()
+
+    cheapest = vendors_df.loc[vendors_df.groupby('category')['monthly_price_per_site'].idxmin()]
+    cheapest = cheapest.set_index('category').reindex(totals.index)
+
+    consolidated = totals['active_contracts'] * cheapest['monthly_price_per_site']
+    savings_df = pd.DataFrame({
+        'category': totals.index,
+        'contract_months': totals['active_contracts'].to_numpy(),
+        'current_spend': totals['spend'].to_numpy(),
+        'consolidated_vendor_id': cheapest['vendor_id'].to_numpy(),
+        'consolidated_price': cheapest['monthly_price_per_site'].to_numpy(),
+        'consolidated_spend': consolidated.to_numpy(),
+    })
+    savings_df['savings'] = savings_df['current_spend'] - savings_df['consolidated_spend']
+    savings_df['savings_pct'] = 100 * savings_df['savings'] / savings_df['current_spend'].where(
+        savings_df['current_spend'] > 0)
+
+    return savings_df
+
+
+def save_portfolio_spend(spend_df, output_path='data/generated/portfolio_spend.csv'):
+    """Save the monthly spend series to csv."""
+    spend_df.to_csv(output_path, index=False, float_format='%.2f')
+    print(f'Saved {len(spend_df)} portfolio spend rows to {output_path}')
+
+
+def save_consolidation_savings(savings_df, output_path='data/generated/consolidation_savings.csv'):
+    """Save per-category consolidation savings to csv."""
+    savings_df.to_csv(output_path, index=False, float_format='%.2f')
+    print(f'Saved consolidation savings for {len(savings_df)} categories to {output_path}')
+
+
+if __name__ == '__main__':
+    sites = pd.read_csv('data/generated/sites.csv')
+    vendors = pd.read_csv('data/generated/vendors.csv')
+    contracts = pd.read_csv('data/generated/contracts_2019_2024.csv')
+
+    print('=== Computing Portfolio Spend ===')
+    spend = generate_portfolio_spend(sites, vendors, contracts)
+    savings = consolidation_savings(spend, vendors)
+
+    by_vendor = spend[spend['level'] == 'vendor'].groupby('key')['spend'].sum()
+    print(f'Total spend: ${by_vendor.sum():,.0f}')
+    print('\nConsolidation onto one vendor per category:')
+    print(savings[['category', 'consolidated_vendor_id', 'current_spend', 'savings', 'savings_pct']].to_string(
+        index=False))
+
+    save_portfolio_spend(spend)
+    save_consolidation_savings(savings)
@@ -0,0 +1,192 @@
+"""
+shared_tables.py -- zero-copy hand-off of static tables to worker processes
+
+Author: Gregory Schwartz
+Date: December 2025
+
+Process pools pickle their initargs into every worker, so each worker
+pays for (and holds) its own copy of the integration matrix, the random
+draws and the rest of the static inputs. Here the parent copies each array
+once into a multiprocessing.shared_memory block, or into an .npy file when
+a directory is given, and passes workers only a small handle: block name,
+shape and dtype per array. Workers map the blocks and get read-only NumPy
+views, so startup time and memory stay flat as workers are added.
+
+Inputs may be nested dicts of arrays (like the encode_tables dict); the
+handle keeps the nesting. String id arrays are stored as fixed-width
+unicode. Values that are not arrays travel in the handle as they are.
+
+static_tables bundles what parallel drivers hand their workers: the
+encoded integration matrix and vendor attributes, site EHR and region
+codes, vendor prices and the per-category selection probabilities.
+
+The parent owns the blocks (or files): share_tables is a context manager
+that unlinks the blocks and removes the files on exit, so keep the pool
+inside it. A process that attaches more than once (rather than a worker
+that exits) drops its views and calls detach_tables to close the blocks
+it mapped.
+"""
+
+import multiprocessing
+import os
+import sys
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# run as a script: import the rest of src as a package, not as top-level modules
+if not __package__:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    __package__ = Path(__file__).resolve().parent.name
+
+from .encode_tables import encode_tables, selection_weights
+
+
+# blocks mapped by this process, kept open while their views are in use
+_ATTACHED_BLOCKS = []
+
+
+def static_tables(sites_df, vendors_df, integration_df):
+    """Return the static arrays workers need: encoded tables, site codes, prices, selection probabilities.
+
+    selection_probs is the site x vendor probability of choosing each
+    vendor within its category (rows of one category sum to 1).
+    """
+    tables = encode_tables(sites_df, vendors_df, integration_df)
+
+    site_ehr, ehr_systems = pd.factorize(sites_df['ehr_system'], sort=True)
+    site_region, regions = pd.factorize(sites_df['region'], sort=True)
+
+    weights = selection_weights(tables)
+    category_totals = np.zeros((len(tables['site_ids']), len(tables['categories'])))
+    np.add.at(category_totals.T, tables['vendor_category'], weights.T)
+
+    tables.update({
+        'site_ehr': site_ehr.astype(np.int8),
+        'ehr_systems': np.asarray(ehr_systems, dtype=str),
+        'site_region': site_region.astype(np.int8),
+        'regions': np.asarray(regions, dtype=str),
+        'vendor_price': vendors_df['monthly_price_per_site'].to_numpy().astype(np.float64),
+        'selection_probs': weights / category_totals[:, tables['vendor_category']],
+    })
+    return tables
+
+
+def _as_shareable(values):
+    """Return values as an array with a fixed-size dtype."""
+    array = np.asarray(values)
+    if array.dtype == object:
+        array = array.astype(str)
+    return np.ascontiguousarray(array)
+
+
+def publish_tables(tables, directory=None):
+    """Copy every array in tables into shared memory (or .npy files in directory).
+
+    Returns (handle, blocks): the picklable handle workers attach with, and
+    what the caller must release: SharedMemory blocks, or the .npy paths
+    (and the directory when it was created here).
+    """
+    blocks = []
+
+    def publish(value, key):
+        if isinstance(value, dict):
+            return {'dict': {name: publish(item, f'{key}.{name}') for name, item in value.items()}}
+        if not isinstance(value, (np.ndarray, pd.Index, pd.api.extensions.ExtensionArray)):
+            return {'value': value}
+
+        array = _as_shareable(value)
+        if directory is not None:
+            path = os.path.join(directory, f'{key}.npy')
+            np.save(path, array)
+            blocks.append(path)
+            return {'file': path}
+
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        blocks.append(block)
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        return {'block': block.name, 'shape': array.shape, 'dtype': array.dtype.str, 'owner': os.getpid()}
+
+    if directory is not None and not os.path.isdir(directory):
+        os.makedirs(directory)
+        blocks.append(directory)
+    handle = publish(tables, 'tables')
+    return handle, blocks
+
+
+def _attach_block(name, owner):
+    """Map an existing block without leaving it to this process's resource tracker."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+
+    # before 3.13 attaching registers the block. Pool workers share the
+    # owner's tracker, where that is a no-op; a separate process has its own
+    # tracker, which would unlink the block when that process exits
+    block = shared_memory.SharedMemory(name=name)
+    if multiprocessing.parent_process() is None and os.getpid() != owner:
+        resource_tracker.unregister(block._name, 'shared_memory')
+    return block
+
+
+def attach_tables(handle):
+    """Rebuild the tables from a handle as read-only views of the shared arrays."""
+    if 'dict' in handle:
+        return {name: attach_tables(item) for name, item in handle['dict'].items()}
+    if 'value' in handle:
+        return handle['value']
+    if 'file' in handle:
+        return np.load(handle['file'], mmap_mode='r')
+
+    block = _attach_block(handle['block'], handle['owner'])
+    _ATTACHED_BLOCKS.append(block)
+    view = np.ndarray(handle['shape'], dtype=np.dtype(handle['dtype']), buffer=block.buf)
+    view.flags.writeable = False
+    return view
+
+
+def detach_tables():
+    """Close every block this process attached; its views must be dropped first."""
+    while _ATTACHED_BLOCKS:
+        _ATTACHED_BLOCKS.pop().close()
+
+
+def release_blocks(blocks):
+    """Close and unlink blocks created by publish_tables, or remove its files."""
+    # the directory was listed before its files
+    for block in reversed(blocks):
+        if isinstance(block, shared_memory.SharedMemory):
+            block.close()
+            block.unlink()
+        elif os.path.isdir(block):
+            os.rmdir(block)
+        else:
+            os.remove(block)
+
+
+@contextmanager
+def share_tables(tables, directory=None):
+    """Publish tables for the duration of a with block and yield the handle."""
+    handle, blocks = publish_tables(tables, directory)
+    try:
+        yield handle
+    finally:
+        release_blocks(blocks)
+
+
+if __name__ == '__main__':
+    sites = pd.read_csv('data/generated/sites.csv')
+    vendors = pd.read_csv('data/generated/vendors.csv')
+    integration_matrix = pd.read_csv('data/generated/integration_matrix.csv')
+
+    print('=== Publishing Static Tables ===')
+    static = static_tables(sites, vendors, integration_matrix)
+    with share_tables(static) as table_handle:
+        shared = attach_tables(table_handle)
+        print('\n'.join(f'{name}: {table.dtype} {table.shape}' for name, table in shared.items()))
+
+        # views first, then the blocks behind them
+        shared = None
+        detach_tables()
@@ -5,18 +5,48 @@ Author: Gregory Schwartz
 Date: December 2025
 """
 
+import sys
+from pathlib import Path
+
 import numpy as np
 import pandas as pd
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 
+# run as a script: import the rest of src as a package, not as top-level modules
+if not __package__:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    __package__ = Path(__file__).resolve().parent.name
+
+from .encode_tables import join_months
+
 
 # mechanism multipliers
 INTEGRATION_MULTIPLIERS = {0: 2.0, 1: 1.3, 2: 0.7}
 
+# fatigue multipliers by bucket: <12, 12-24, 24+ months since last change
+FATIGUE_MULTIPLIERS = {0: 0.3, 1: 0.7, 2: 1.0}
+
+# months a switch keeps influencing neighbouring sites (optional contagion)
+CONTAGION_WINDOW = 6
+
+
+def get_fatigue_bucket(months_since_change):
+    """Return fatigue bucket for months since last change."""
+    if months_since_change < 12:
+        return 0  # too soon again
+    elif months_since_change < 24:
+        return 1
+    return 2  # ok to switch
+
+
+def calculate_switch_probability(integration_quality, months_since_change, base_annual=0.05,
+                                 neighbour_share=0.0, contagion=0.0):
+    """Calculate monthly switch probability using causal mechanisms.
 
-def calculate_switch_probability(integration_quality, months_since_change, base_annual=0.05):
-    """Calculate monthly switch probability using causal mechanisms."""
+    neighbour_share is the share of neighbouring sites that switched this
+    category recently; contagion scales its effect (0 = off).
+    """
 
     # convert annual to monthly
     base_monthly = 1 - (1 - base_annual) ** (1 / 12)
@@ -25,14 +55,14 @@ def calculate_switch_probability(integration_quality, months_since_change, base_
     integration_mult = INTEGRATION_MULTIPLIERS.get(integration_quality, 1.0)
 
     # fatigue multiplier
-    if months_since_change < 12:
-        fatigue_mult = 0.3  # too soon again
-    elif months_since_change < 24:
-        fatigue_mult = 0.7
-    else:
-        fatigue_mult = 1.0  # ok to switch
+    fatigue_mult = FATIGUE_MULTIPLIERS[get_fatigue_bucket(months_since_change)]
 
     prob = base_monthly * integration_mult * fatigue_mult
+
+    # neighbours copy each other's switches
+    if contagion:
+        prob *= 1 + contagion * neighbour_share
+
     return min(prob, 1.0)
 
 
@@ -77,9 +107,41 @@ def select_new_vendor(site_id, category, current_vendor, vendors_df, integration
     return vendor_ids[selected_idx]
 
 
+def recent_neighbour_share(site_idx, category, month_idx, adjacency, last_switch):
+    """Weighted share of a site's neighbours that switched a category in the window."""
+    start, end = adjacency.indptr[site_idx], adjacency.indptr[site_idx + 1]
+
+    share = 0.0
+    for neighbour, weight in zip(adjacency.indices[start:end], adjacency.data[start:end]):
+        switched = last_switch.get((neighbour, category))
+        if switched is not None and 1 <= month_idx - switched <= CONTAGION_WINDOW:
+            share += weight
+    return share
+
+
 def simulate_switches(sites_df, vendors_df, integration_df, initial_state_df,
-                      start_date='2019-01-01', end_date='2024-12-31', seed=42):
-    """Simulate vendor switches over time period."""
+                      start_date='2019-01-01', end_date='2024-12-31', seed=42,
+                      base_annual=0.05, contagion=0.0, adjacency=None, integration_upgrades=None):
+    """Simulate vendor switches over time period.
+
+    With contagion > 0, adjacency (spatial_contagion.neighbour_graph) gives
+    each site's neighbours, whose recent switches raise its hazard.
+    integration_upgrades is a delta log (integration_upgrades.py); its rows
+    are written into a working copy of integration_df as their month arrives.
+    """
+    if contagion and adjacency is None:
+        raise ValueError('contagion needs a neighbour adjacency')
+
+    # upgrade rows in date order with their integration_df row positions
+    pending_upgrades = []
+    if integration_upgrades is not None and len(integration_upgrades):
+        integration_df = integration_df.reset_index(drop=True).copy()
+        cells = pd.MultiIndex.from_frame(integration_df[['site_id', 'vendor_id']])
+        positions = cells.get_indexer(pd.MultiIndex.from_frame(integration_upgrades[['site_id', 'vendor_id']]))
+        pending_upgrades = sorted(zip(integration_upgrades['effective_date'], positions,
+                                      integration_upgrades['integration_quality']), key=lambda row: row[0])
+        quality_column = integration_df.columns.get_loc('integration_quality')
+
     np.random.seed(seed)
 
     sim_start = datetime.strptime(start_date, '%Y-%m-%d')
@@ -105,9 +167,11 @@ def simulate_switches(sites_df, vendors_df, integration_df, initial_state_df,
     # contract history
     contracts = []
 
-    # add initial contracts
+    # add initial contracts (sites joining after the horizon have none)
     for key, state in current_state.items():
         site_id, category = key
+        if state['start_date'] > sim_end:
+            continue
         contracts.append({
             'site_id': site_id,
             'category': category,
@@ -116,14 +180,28 @@ def simulate_switches(sites_df, vendors_df, integration_df, initial_state_df,
             'contract_end_date': None
         })
 
+    # month index of each (site index, category)'s latest switch
+    last_switch = {}
+
     # simulate each month
     categories = vendors_df['category'].unique()
+    site_ids = sites_df['site_id'].to_numpy()
+    join_month = join_months(sites_df, months)
 
     for month_idx, month in enumerate(months):
         if month_idx == 0:
             continue  # skip first month
 
-        for site_id in sites_df['site_id']:
+        # apply upgrades effective by this month
+        month_str = month.strftime('%Y-%m-%d')
+        while pending_upgrades and pending_upgrades[0][0] <= month_str:
+            _, position, quality = pending_upgrades.pop(0)
+            if position >= 0:
+                integration_df.iloc[position, quality_column] = quality
+
+        # sites can switch from the month after they joined
+        for site_idx in np.flatnonzero(join_month < month_idx):
+            site_id = site_ids[site_idx]
             for category in categories:
                 key = (site_id, category)
                 state = current_state[key]
@@ -139,7 +217,10 @@ def simulate_switches(sites_df, vendors_df, integration_df, initial_state_df,
                 months_since += month.month - last_change.month
 
                 # calculate switch probability
-                prob = calculate_switch_probability(quality, months_since)
+                share = 0.0
+                if contagion:
+                    share = recent_neighbour_share(site_idx, category, month_idx, adjacency, last_switch)
+                prob = calculate_switch_probability(quality, months_since, base_annual, share, contagion)
 
                 # decide if switch happens
                 if np.random.random() < prob:
@@ -174,6 +255,7 @@ def simulate_switches(sites_df, vendors_df, integration_df, initial_state_df,
                         'start_date': month,
                         'last_change': month
                     }
+                    last_switch[(site_idx, category)] = month_idx
 
     # build output dataframe
     contracts_df = pd.DataFrame(contracts)
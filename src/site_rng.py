@@ -0,0 +1,342 @@
+"""
+site_rng.py -- per-site counter-based random streams
+
+Author: Gregory Schwartz
+Date: December 2025
+
+The reference generators draw everything from one global stream, so
+changing n_sites reshuffles every site. Here each (root seed, stage, site)
+gets its own Philox generator: the stage is hashed into the first key word
+and the site index is the second. A site's draws never depend on how many
+other sites exist, which allows:
+
+- growing a dataset by appending sites without touching existing rows
+- generating one site's full history in O(1) with respect to n_sites
+
+Vendor effects are drawn per vendor (generate_kpis.assign_vendor_effects)
+and stay shared across sites. Contracts are ordered by site with per-site
+ids (S001-C01, ...) for the same reason.
+"""
+
+import os
+import zlib
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from .encode_tables import (
+    encode_tables, encode_assignments, get_months, selection_weights, onboarding_dates, join_months,
+)
+from .generate_integration_matrix import assign_integration_quality
+from .generate_kpis import (
+    KPI_REGISTRY, LEGACY_KPIS, assign_vendor_effects, build_kpi_contributions, contribution_stack,
+)
+from .generate_sites import ONBOARDING_SCENARIOS
+from .generate_vendors import generate_vendors
+from .integration_upgrades import encode_upgrades, generate_integration_upgrades
+from .vectorized_engine import (
+    default_mechanism, simulate_switch_batch, contracts_from_history,
+    active_vendor_history, contribution_upgrades, generate_kpi_batch, kpi_frame,
+)
+
+
+# pipeline stages computed over the whole dataset, rerun after it grows
+DERIVED_STAGES = ['upgrades', 'vendor_effects', 'kpi_contributions', 'switch_samples', 'spend', 'consolidation']
+
+# stage identifiers mixed into the stream key
+RNG_STAGES = {
+    'sites': 1,
+    'integration': 2,
+    'initial_state': 3,
+    'switches': 4,
+    'kpis': 5,
+}
+
+
+def stage_key(seed, stage):
+    """Return the 64-bit key word for a (root seed, stage) pair."""
+    sequence = np.random.SeedSequence([seed, RNG_STAGES[stage]])
+    return int(sequence.generate_state(1, dtype=np.uint64)[0])
+
+
+def site_generator(seed, stage, site_index):
+    """Return the Philox generator for one site in one stage."""
+    key = [stage_key(seed, stage), site_index]
+    return np.random.Generator(np.random.Philox(key=key))
+
+
+def kpi_site_generator(seed, kpi, site_index):
+    """Return the Philox generator for one added KPI at one site."""
+    sequence = np.random.SeedSequence([seed, RNG_STAGES['kpis'], zlib.crc32(kpi.encode())])
+    key = [int(sequence.generate_state(1, dtype=np.uint64)[0]), site_index]
+    return np.random.Generator(np.random.Philox(key=key))
+
+
+def site_number(site_id):
+    """Return the zero-based site index encoded in a site_id (S001 -> 0)."""
+    return int(site_id[1:]) - 1
+
+
+def generate_sites_keyed(n_sites=100, seed=42, first_site=0, onboarding='baseline'):
+    """Generate sites first_site .. first_site + n_sites - 1 from per-site streams."""
+    regions = ['Northeast', 'South', 'West', 'Midwest']
+    ehr_systems = ['Dentrix', 'OpenDental', 'Eaglesoft', 'Curve', 'Other']
+    join_years = list(ONBOARDING_SCENARIOS[onboarding])
+    year_shares = list(ONBOARDING_SCENARIOS[onboarding].values())
+
+    records = []
+    for i in range(first_site, first_site + n_sites):
+        rng = site_generator(seed, 'sites', i)
+
+        region = regions[rng.choice(4, p=[0.25, 0.35, 0.20, 0.20])]
+        ehr = ehr_systems[rng.choice(5, p=[0.35, 0.25, 0.20, 0.10, 0.10])]
+        year = join_years[0] if len(join_years) == 1 else join_years[rng.choice(len(join_years), p=year_shares)]
+        join_date = datetime(year, 1, 1) + timedelta(days=int(rng.uniform(0, 364)))
+        revenue = int(round(rng.lognormal(mean=14.5, sigma=0.3), -3))
+
+        records.append({
+            'site_id': f'S{i + 1:03d}',
+            'region': region,
+            'ehr_system': ehr,
+            'date_joined': join_date.strftime('%Y-%m-%d'),
+            'annual_revenue': revenue
+        })
+
+    return pd.DataFrame(records)
+
+
+def generate_integration_keyed(sites_df, vendors_df, seed=42):
+    """Generate integration quality with each site's RCM draws from its own stream."""
+    vendors = list(vendors_df[['vendor_id', 'category', 'tier']].itertuples(index=False))
+
+    records = []
+    for site_id, ehr in zip(sites_df['site_id'], sites_df['ehr_system']):
+        rng = site_generator(seed, 'integration', site_number(site_id))
+
+        for vendor_id, category, tier in vendors:
+            quality = assign_integration_quality(category, vendor_id, tier, ehr, rng)
+            records.append({
+                'site_id': site_id,
+                'vendor_id': vendor_id,
+                'integration_quality': quality
+            })
+
+    return pd.DataFrame(records)
+
+
+def generate_initial_state_keyed(sites_df, vendors_df, integration_df, seed=42, start_date='2019-01-01'):
+    """Select initial vendors (softmax) from each site's own stream."""
+    tables = encode_tables(sites_df, vendors_df, integration_df)
+    weights = selection_weights(tables)
+    slot_vendors = tables['category_vendors']
+    joined = onboarding_dates(sites_df, start_date)
+
+    contracts = []
+    for s, site_id in enumerate(tables['site_ids']):
+        rng = site_generator(seed, 'initial_state', site_number(site_id))
+
+        for c, category in enumerate(tables['categories']):
+            members = slot_vendors[c][slot_vendors[c] >= 0]
+            probs = weights[s, members] / weights[s, members].sum()
+            vendor = members[rng.choice(len(members), p=probs)]
+
+            contracts.append({
+                'site_id': site_id,
+                'category': category,
+                'vendor_id': tables['vendor_ids'][vendor],
+                'contract_start_date': joined[s]
+            })
+
+    return pd.DataFrame(contracts)
+
+
+def simulate_switches_keyed(sites_df, vendors_df, integration_df, initial_state_df,
+                            start_date='2019-01-01', end_date='2024-12-31', seed=42,
+                            base_annual=0.05, contagion=0.0, adjacency=None, integration_upgrades=None):
+    """Simulate switches with hazard/choice uniforms from each site's stream.
+
+    With contagion the neighbour graph spans every site passed in, so
+    appended sites can change existing sites' switches.
+    """
+    tables = encode_tables(sites_df, vendors_df, integration_df)
+    initial_vendors = encode_assignments(initial_state_df, tables)
+    months = get_months(start_date, end_date)
+    n_months = len(months)
+    n_sites, n_categories = initial_vendors.shape
+
+    hazard_u = np.empty((n_months, n_sites, n_categories))
+    choice_u = np.empty((n_months, n_sites, n_categories))
+    for s, site_id in enumerate(tables['site_ids']):
+        rng = site_generator(seed, 'switches', site_number(site_id))
+        hazard_u[:, s], choice_u[:, s] = rng.random((2, n_months, n_categories))
+
+    upgrades = None
+    if integration_upgrades is not None:
+        upgrades = encode_upgrades(integration_upgrades, tables, months)
+
+    _, integration_mult, fatigue_mult = default_mechanism()
+    sim = simulate_switch_batch(
+        tables, initial_vendors, hazard_u, choice_u,
+        [base_annual], integration_mult, fatigue_mult, contagion, adjacency, upgrades,
+        join_months(sites_df, months)
+    )
+
+    return contracts_from_history(sim['vendor_history'][0], tables, months, order='site')
+
+
+def generate_kpis_keyed(sites_df, vendors_df, integration_df, contracts_df,
+                        start_date='2019-01-01', end_date='2024-12-31', seed=42,
+                        contributions=None, integration_upgrades=None):
+    """Generate every registered KPI with baselines and noise from each site's stream."""
+    tables = encode_tables(sites_df, vendors_df, integration_df)
+    months = get_months(start_date, end_date)
+    n_months, n_sites = len(months), len(tables['site_ids'])
+    kpis = list(KPI_REGISTRY)
+
+    if contributions is None:
+        contributions = build_kpi_contributions(
+            sites_df, vendors_df, integration_df, assign_vendor_effects(vendors_df, seed),
+            upgrades_df=integration_upgrades
+        )
+    stacked = contribution_stack(contributions)
+    history = active_vendor_history(contracts_df, tables, months)
+
+    baselines = np.empty((len(kpis), n_sites))
+    noise = np.empty((len(kpis), n_months, n_sites))
+    legacy = [kpis.index(kpi) for kpi in LEGACY_KPIS]
+    for s, site_id in enumerate(tables['site_ids']):
+        i = site_number(site_id)
+
+        # original kpis: baselines then noise from the site's stream
+        rng = site_generator(seed, 'kpis', i)
+        for k in legacy:
+            baselines[k, s] = rng.uniform(*KPI_REGISTRY[kpis[k]]['baseline'])
+        for k in legacy:
+            noise[k, :, s] = rng.normal(0, KPI_REGISTRY[kpis[k]]['noise'], size=n_months)
+
+        # added kpis: one stream each
+        for k, kpi in enumerate(kpis):
+            if kpi in LEGACY_KPIS:
+                continue
+            kpi_stream = kpi_site_generator(seed, kpi, i)
+            baselines[k, s] = kpi_stream.uniform(*KPI_REGISTRY[kpi]['baseline'])
+            noise[k, :, s] = kpi_stream.normal(0, KPI_REGISTRY[kpi]['noise'], size=n_months)
+
+    values = generate_kpi_batch(history[None], stacked, baselines, [m.month for m in months], noise,
+                                upgrades=contribution_upgrades(contributions, tables, months))
+
+    return kpi_frame(values[:, 0], tables, months, join_month=join_months(sites_df, months))
+
+
+def generate_sites_history(first_site, n_sites, seed=42,
+                           start_date='2019-01-01', end_date='2024-12-31', onboarding='baseline',
+                           base_annual=0.05, upgrade_events=None):
+    """Generate every table for a contiguous block of sites.
+
+    onboarding, base_annual and upgrade_events must match the dataset the
+    sites belong to: they change each site's join year, switches and KPIs.
+    With upgrade_events the block's integration_upgrades log is included.
+    """
+    sites = generate_sites_keyed(n_sites=n_sites, seed=seed, first_site=first_site, onboarding=onboarding)
+    vendors = generate_vendors(seed=seed)
+    integration_matrix = generate_integration_keyed(sites, vendors, seed=seed)
+    initial_state = generate_initial_state_keyed(sites, vendors, integration_matrix, seed=seed,
+                                                 start_date=start_date)
+
+    upgrades = None
+    if upgrade_events is not None:
+        upgrades = generate_integration_upgrades(sites, vendors, integration_matrix, upgrade_events)
+
+    contracts = simulate_switches_keyed(
+        sites, vendors, integration_matrix, initial_state,
+        start_date=start_date, end_date=end_date, seed=seed, base_annual=base_annual,
+        integration_upgrades=upgrades
+    )
+    kpis = generate_kpis_keyed(
+        sites, vendors, integration_matrix, contracts,
+        start_date=start_date, end_date=end_date, seed=seed, integration_upgrades=upgrades
+    )
+
+    world = {
+        'sites': sites,
+        'vendors': vendors,
+        'integration_matrix': integration_matrix,
+        'initial_state_2019': initial_state,
+        'contracts_2019_2024': contracts,
+        'kpis': kpis,
+    }
+    if upgrades is not None:
+        world['integration_upgrades'] = upgrades
+    return world
+
+
+def generate_site_history(site_id, seed=42, onboarding='baseline'):
+    """Generate one site's full history without generating any other site."""
+    return generate_sites_history(site_number(site_id), 1, seed=seed, onboarding=onboarding)
+
+
+def append_sites(output_dir, n_new, seed=None, onboarding=None):
+    """Append n_new sites to a per-site-stream dataset in output_dir.
+
+    The new sites replay the options the dataset was generated with
+    (generate_all_data.GENERATION_FILE): seed, horizon, onboarding, the
+    base_annual used and integration upgrades. seed and onboarding, when
+    given, must match them. Datasets from another engine, or with contagion
+    (the neighbour graph couples every site's switches), are refused.
+    Outputs computed over the whole dataset (DERIVED_STAGES: upgrade log,
+    KPI contributions, switch samples, spend, savings) are regenerated.
+    """
+    from .generate_all_data import (
+        GENERATION_FILE, load_generation_options, save_generation_options, pipeline_generators, pipeline_stages,
+    )
+    from .pipeline_dag import run_dag
+
+    options_path = f'{output_dir}/{GENERATION_FILE}'
+    if not os.path.exists(options_path):
+        raise ValueError(f'No {options_path}: only datasets written by the pipeline can grow')
+    options = load_generation_options(options_path)
+    if options['engine'] != 'per_site':
+        raise ValueError(f'{output_dir} was generated with --engine {options["engine"]}; '
+                         'only per_site datasets keep existing sites unchanged when grown')
+    if options['contagion']:
+        raise ValueError(f'{output_dir} was generated with contagion, where new sites change existing '
+                         'switches; regenerate it instead')
+    for name, value in [('seed', seed), ('onboarding', onboarding)]:
+        if value is not None and value != options[name]:
+            raise ValueError(f'{output_dir} was generated with {name}={options[name]!r}, not {value!r}')
+
+    existing = pd.read_csv(f'{output_dir}/sites.csv')
+    first_site = max(site_number(s) for s in existing['site_id']) + 1 if len(existing) else 0
+
+    dates = {'start_date': options['start_date'], 'end_date': options['end_date']}
+    world = generate_sites_history(
+        first_site, n_new, seed=options['seed'], onboarding=options['onboarding'],
+        base_annual=options['base_annual'], upgrade_events=options['upgrade_events'], **dates
+    )
+
+    for name, new_df in world.items():
+        if name in ('vendors', 'integration_upgrades'):
+            continue  # shared catalog, and a log regenerated below
+        path = f'{output_dir}/{name}.csv'
+        write_header = not os.path.exists(path)
+        new_df.to_csv(path, mode='a', header=write_header, index=False)
+        print(f'Appended {len(new_df)} rows to {path}')
+
+    # rerun the stages that read every site, from the grown tables
+    tables = {
+        'sites': 'sites', 'vendors': 'vendors', 'integration_matrix': 'integration_matrix',
+        'contracts': 'contracts_2019_2024',
+    }
+    context = {name: pd.read_csv(f'{output_dir}/{file_name}.csv') for name, file_name in tables.items()}
+    options['n_sites'] = len(context['sites'])
+
+    stages = pipeline_stages(
+        pipeline_generators('per_site'), options['seed'], options['n_sites'], output_dir,
+        upgrade_events=options['upgrade_events'], n_hard=options['n_hard'], n_random=options['n_random'],
+        onboarding=options['onboarding'], **dates
+    )
+    run_dag([stage for stage in stages if stage['name'] in DERIVED_STAGES], n_workers=1, context=context)
+    save_generation_options(options, options_path)
+
+    return world
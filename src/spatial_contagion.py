@@ -0,0 +1,77 @@
+"""
+spatial_contagion.py -- site neighbour graph for regional switching contagion
+
+Author: Gregory Schwartz
+Date: December 2025
+
+Switches cluster geographically: practices copy vendors from practices
+nearby. Each site gets synthetic coordinates around its region's centre,
+and its neighbours are its nearest sites within a radius in the same
+region. A k-d tree answers the nearest-neighbour queries, so nothing is
+O(n^2) and the graph stays sparse (at most MAX_NEIGHBOURS per site).
+
+The adjacency is row-normalised. Each month the engines multiply it by the
+site x category indicator of switches in the last CONTAGION_WINDOW months
+(simulate_switches.py). That gives every site the share of its neighbours
+that switched recently, and the hazard is scaled by (1 + contagion * share).
+
+Contagion couples sites, so the per-site-type chains in markov_switches.py
+do not cover it. Under contagion, adding sites also changes existing
+sites' neighbours.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix, diags
+from scipy.spatial import cKDTree
+
+
+# rough region centres (latitude, longitude)
+REGION_CENTERS = {
+    'Northeast': (42.0, -74.0),
+    'South': (33.0, -86.0),
+    'West': (38.0, -119.0),
+    'Midwest': (41.5, -89.0),
+}
+
+# scatter of sites around their centre, in degrees
+REGION_SPREAD = 2.5
+
+# neighbour search radius (degrees) and cap per site
+NEIGHBOUR_RADIUS = 1.5
+MAX_NEIGHBOURS = 8
+
+
+def site_coordinates(sites_df, seed=42):
+    """Return synthetic (latitude, longitude) per site around its region centre."""
+    rng = np.random.default_rng(seed + 3)
+    centers = np.array([REGION_CENTERS[region] for region in sites_df['region']], dtype=np.float64)
+    return centers + rng.normal(0, REGION_SPREAD, size=(len(sites_df), 2))
+
+
+def neighbour_graph(sites_df, seed=42, radius=NEIGHBOUR_RADIUS, max_neighbours=MAX_NEIGHBOURS):
+    """Return the row-normalised site x site neighbour matrix (scipy csr)."""
+    n_sites = len(sites_df)
+    coords = site_coordinates(sites_df, seed)
+    region = pd.factorize(sites_df['region'])[0]
+
+    # k nearest within the radius; misses come back with index n_sites
+    k = min(max_neighbours + 1, n_sites)
+    _, idx = cKDTree(coords).query(coords, k=k, distance_upper_bound=radius)
+    idx = idx.reshape(n_sites, k)
+
+    rows = np.repeat(np.arange(n_sites), k)
+    cols = idx.ravel()
+    keep = (cols < n_sites) & (cols != rows)
+    rows, cols = rows[keep], cols[keep]
+
+    # neighbours must share the region
+    same_region = region[rows] == region[cols]
+    rows, cols = rows[same_region], cols[same_region]
+
+    adjacency = csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n_sites, n_sites))
+
+    # each row sums to one (or zero for isolated sites)
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    scale = np.divide(1.0, degree, out=np.zeros(n_sites), where=degree > 0)
+    return (diags(scale) @ adjacency).tocsr()
@@ -0,0 +1,208 @@
+"""
+sweep_parameters.py -- batched parameter sweeps of the switching mechanism
+
+Author: Gregory Schwartz
+Date: December 2025
+
+Evaluates many settings of base_annual, INTEGRATION_MULTIPLIERS and the
+fatigue multipliers against one world: every configuration shares the same
+sites, integration matrix, initial state, random draws and KPI noise, so
+differences between rows come from the parameters alone.
+
+With several workers the shared world is published once to shared memory
+(shared_tables) and each worker attaches read-only views, rather than
+unpickling its own copy of the draws and tables.
+"""
+
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .encode_tables import encode_assignments, get_months, join_months
+from .generate_kpis import KPI_REGISTRY, assign_vendor_effects, assign_site_baselines
+from .shared_tables import static_tables, share_tables, attach_tables
+from .simulate_switches import INTEGRATION_MULTIPLIERS, FATIGUE_MULTIPLIERS
+from .vectorized_engine import (
+    draw_switch_uniforms, simulate_switch_batch, kpi_contribution_matrices,
+    site_baseline_matrix, draw_kpi_noise, generate_kpi_batch,
+)
+
+
+# sweepable parameters and their reference values
+SWEEP_PARAMETERS = {
+    'base_annual': 0.05,
+    'integration_mult_0': INTEGRATION_MULTIPLIERS[0],
+    'integration_mult_1': INTEGRATION_MULTIPLIERS[1],
+    'integration_mult_2': INTEGRATION_MULTIPLIERS[2],
+    'fatigue_mult_0': FATIGUE_MULTIPLIERS[0],
+    'fatigue_mult_1': FATIGUE_MULTIPLIERS[1],
+    'fatigue_mult_2': FATIGUE_MULTIPLIERS[2],
+}
+
+# inputs shared by every configuration, attached once per worker process
+_WORKER_INPUTS = {}
+
+# memory one chunk of configurations may take in a worker (chunks are cut to fit)
+CHUNK_MEMORY_BYTES = 2 * 1024 ** 3
+
+
+def build_grid(grid):
+    """Build the full cartesian grid of configurations.
+
+    grid maps parameter name to a list of values; parameters not in the grid
+    keep their reference value.
+    """
+    for name in grid:
+        if name not in SWEEP_PARAMETERS:
+            raise ValueError(f'Unknown sweep parameter: {name}')
+
+    names = list(grid)
+    records = []
+    for values in itertools.product(*[grid[name] for name in names]):
+        config = dict(SWEEP_PARAMETERS)
+        config.update(zip(names, values))
+        records.append(config)
+
+    return pd.DataFrame(records, columns=list(SWEEP_PARAMETERS))
+
+
+def sample_configs(ranges, n_samples, seed=42):
+    """Sample configurations uniformly within (low, high) ranges."""
+    for name in ranges:
+        if name not in SWEEP_PARAMETERS:
+            raise ValueError(f'Unknown sweep parameter: {name}')
+
+    rng = np.random.default_rng(seed)
+
+    configs = pd.DataFrame({name: np.full(n_samples, value)
+                            for name, value in SWEEP_PARAMETERS.items()})
+    for name, (low, high) in ranges.items():
+        configs[name] = rng.uniform(low, high, size=n_samples)
+
+    return configs
+
+
+def config_arrays(configs_df):
+    """Split a configurations table into engine parameter arrays."""
+    base_annual = configs_df['base_annual'].to_numpy(dtype=np.float64)
+    integration_mult = configs_df[[f'integration_mult_{q}' for q in range(3)]].to_numpy(dtype=np.float64)
+    fatigue_mult = configs_df[[f'fatigue_mult_{b}' for b in range(3)]].to_numpy(dtype=np.float64)
+    return base_annual, integration_mult, fatigue_mult
+
+
+def prepare_sweep_inputs(sites_df, vendors_df, integration_df, initial_state_df,
+                         start_date='2019-01-01', end_date='2024-12-31', seed=42):
+    """Build the shared world (static tables, draws, KPI terms) for a sweep."""
+    tables = static_tables(sites_df, vendors_df, integration_df)
+    initial_vendors = encode_assignments(initial_state_df, tables)
+
+    months = get_months(start_date, end_date)
+    n_months = len(months)
+    n_sites, n_categories = initial_vendors.shape
+
+    hazard_u, choice_u = draw_switch_uniforms(n_months, n_sites, n_categories, seed)
+
+    # kpi terms use the same effects/baselines as generate_kpis
+    vendor_effects = assign_vendor_effects(vendors_df, seed)
+    site_baselines = assign_site_baselines(sites_df, seed)
+
+    inputs = {
+        'tables': tables,
+        'initial_vendors': initial_vendors,
+        'hazard_u': hazard_u,
+        'choice_u': choice_u,
+        'kpi_contrib': kpi_contribution_matrices(tables, vendor_effects),
+        'kpi_baselines': site_baseline_matrix(site_baselines, tables['site_ids']),
+        'month_nums': np.array([m.month for m in months]),
+        'join_month': join_months(sites_df, months),
+        'kpi_noise': draw_kpi_noise(n_months, n_sites, seed + 2),
+    }
+    return inputs
+
+
+def evaluate_configs(inputs, configs_df):
+    """Run the batched simulation for a block of configurations."""
+    base_annual, integration_mult, fatigue_mult = config_arrays(configs_df)
+
+    sim = simulate_switch_batch(
+        inputs['tables'], inputs['initial_vendors'], inputs['hazard_u'], inputs['choice_u'],
+        base_annual, integration_mult, fatigue_mult, join_month=inputs['join_month']
+    )
+
+    kpi_values = generate_kpi_batch(
+        sim['vendor_history'], inputs['kpi_contrib'], inputs['kpi_baselines'],
+        inputs['month_nums'], inputs['kpi_noise']
+    )
+
+    # site-months from each site's onboarding on, as in the kpis table
+    active = np.arange(len(inputs['month_nums']))[:, None] >= inputs['join_month'][None, :]
+    contract_years = active.sum() * inputs['initial_vendors'].shape[1] / 12
+    switches = sim['switches_by_quality'].sum(axis=1)
+
+    results = configs_df.reset_index(drop=True).copy()
+    results['switches'] = switches
+    results['annual_switch_rate'] = switches / contract_years
+    for q in range(3):
+        results[f'switches_quality_{q}'] = sim['switches_by_quality'][:, q]
+    for kpi, values in zip(KPI_REGISTRY, kpi_values):
+        results[f'{kpi}_mean'] = values[:, active].mean(axis=1)
+
+    return results
+
+
+def config_bytes(inputs):
+    """Peak bytes one configuration adds to a chunk.
+
+    Its int16 vendor history, float32 KPI totals and float64 KPI values are
+    held over the whole horizon; the vendor gather is one month at a time.
+    """
+    n_months, n_sites, n_categories = inputs['hazard_u'].shape
+    n_kpis = len(inputs['kpi_contrib'])
+    horizon = n_months * n_sites * (2 * n_categories + (4 + 8) * n_kpis)
+    month = n_sites * n_categories * (8 + 4 * n_kpis)
+    return horizon + month
+
+
+def _init_worker(handle):
+    """Attach the shared inputs in a worker process."""
+    _WORKER_INPUTS.update(attach_tables(handle))
+
+
+def _evaluate_chunk(configs_df):
+    """Evaluate one block of configurations inside a worker."""
+    return evaluate_configs(_WORKER_INPUTS, configs_df)
+
+
+def run_sweep(sites_df, vendors_df, integration_df, initial_state_df, configs_df,
+              start_date='2019-01-01', end_date='2024-12-31', seed=42,
+              n_workers=1, chunk_size=16, chunk_bytes=CHUNK_MEMORY_BYTES):
+    """Evaluate every configuration and return one result row per config.
+
+    chunk_size is lowered when that many configurations would not fit in
+    chunk_bytes (per worker) for this world.
+    """
+    inputs = prepare_sweep_inputs(
+        sites_df, vendors_df, integration_df, initial_state_df,
+        start_date=start_date, end_date=end_date, seed=seed
+    )
+    chunk_size = max(1, min(chunk_size, chunk_bytes // config_bytes(inputs)))
+
+    chunks = [configs_df.iloc[i:i + chunk_size] for i in range(0, len(configs_df), chunk_size)]
+
+    if n_workers <= 1:
+        results = [evaluate_configs(inputs, chunk) for chunk in chunks]
+    else:
+        with share_tables(inputs) as handle, ProcessPoolExecutor(
+                max_workers=n_workers, initializer=_init_worker, initargs=(handle,)) as pool:
+            results = list(pool.map(_evaluate_chunk, chunks))
+
+    results_df = pd.concat(results, ignore_index=True)
+    return results_df
+
+
+def save_sweep(results_df, output_path='data/generated/sweep_results.csv'):
+    """Save sweep results to csv."""
+    results_df.to_csv(output_path, index=False)
+    print(f'Saved {len(results_df)} sweep configurations to {output_path}')
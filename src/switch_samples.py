@@ -0,0 +1,238 @@
+"""
+switch_samples.py -- labelled switch events for link-prediction training
+
+Author: Gregory Schwartz
+Date: December 2025
+
+The downstream R-GCN predicts (site, vendor, month) switch links. Every
+switch in the contracts table is a positive: the site, the vendor it moved
+to and the month the new contract starts. Each positive gets negatives
+from the same category in the same month:
+
+- hard: same site, another vendor of the category, drawn without
+  replacement in proportion to the selection softmax (integration quality
+  as of that month, tier) over the vendors select_new_vendor could have
+  picked, i.e. neither the new nor the outgoing vendor
+- random: a site drawn uniformly among those onboarded before that month,
+  and a uniformly drawn vendor of the category
+
+Keeping negatives in their positive's month means a temporal split never
+mixes months across train/val/test. All draws are batched over the whole
+positive set.
+"""
+
+import sys
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# run as a script: import the rest of src as a package, not as top-level modules
+if not __package__:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    __package__ = Path(__file__).resolve().parent.name
+
+from .encode_tables import encode_tables, get_months, join_months
+from .integration_upgrades import encode_upgrades, quality_at
+
+
+# negatives per positive by kind
+NEGATIVES_PER_POSITIVE = {'hard': 2, 'random': 3}
+
+# sample kinds stored with every row
+SAMPLE_KINDS = {'positive': 0, 'hard': 1, 'random': 2}
+
+# temporal splits: months before val are train, from test on are test
+SPLIT_DATES = {'val': '2023-01-01', 'test': '2024-01-01'}
+
+# redraws of random negatives that hit a positive before giving up
+MAX_REDRAWS = 10
+
+
+def switch_events(contracts_df, tables, months):
+    """Return (site, vendor, category, month, previous) index arrays of every switch.
+
+    A contract is a switch when an earlier contract exists for its site and
+    category; the first one per pair is the site's initial vendor. previous
+    is the vendor the site switched away from.
+    """
+    site = pd.Index(tables['site_ids']).get_indexer(contracts_df['site_id'])
+    vendor = pd.Index(tables['vendor_ids']).get_indexer(contracts_df['vendor_id'])
+    category = pd.Index(tables['categories']).get_indexer(contracts_df['category'])
+    month = pd.Index([m.strftime('%Y-%m-%d') for m in months]).get_indexer(contracts_df['contract_start_date'])
+
+    order = np.lexsort((month, category, site))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (site[order][1:] != site[order][:-1]) | (category[order][1:] != category[order][:-1])
+
+    switch = order[~first]
+    previous = vendor[order[np.flatnonzero(~first) - 1]]
+
+    chronological = np.lexsort((site[switch], month[switch]))
+    switch, previous = switch[chronological], previous[chronological]
+    return site[switch], vendor[switch], category[switch], month[switch], previous
+
+
+def hard_negatives(tables, site, vendor, category, month, previous, n_hard, rng, upgrades=None):
+    """Draw up to n_hard distinct candidate vendors per positive from the selection softmax.
+
+    Candidates exclude the new and the previous vendor. Sampling without
+    replacement takes the n_hard smallest exponential race keys E / weight;
+    positives with fewer candidates get all of them.
+    """
+    slot_vendors = tables['category_vendors'][category]
+    candidates = np.maximum(slot_vendors, 0)
+
+    if upgrades is None:
+        quality = tables['quality'][site[:, None], candidates]
+    else:
+        quality = quality_at(tables['quality'], upgrades, month[:, None], site[:, None], candidates)
+    weights = np.exp(0.5 * quality + 0.3 * tables['vendor_tier'][candidates])
+    excluded = (slot_vendors < 0) | (slot_vendors == vendor[:, None]) | (slot_vendors == previous[:, None])
+    weights[excluded] = 0.0
+
+    with np.errstate(divide='ignore'):
+        keys = rng.standard_exponential(weights.shape) / weights
+    slots = np.argsort(keys, axis=1)[:, :n_hard]
+
+    rows = np.repeat(np.arange(len(site)), slots.shape[1])
+    slot = slots.ravel()
+    drawn = np.isfinite(keys[rows, slot])
+    rows, slot = rows[drawn], slot[drawn]
+    return site[rows], slot_vendors[rows, slot], category[rows], month[rows]
+
+
+def random_negatives(tables, site, vendor, category, month, n_random, rng, join_month=None):
+    """Draw n_random (site, vendor) pairs per positive from its category and month.
+
+    Sites are drawn among those joined before that month (join_month, all
+    sites when None); draws that coincide with a real switch are redrawn.
+    """
+    counts = (tables['category_vendors'] >= 0).sum(axis=1)
+    n_sites, n_vendors = len(tables['site_ids']), len(tables['vendor_ids'])
+
+    # sites in join order: the first n_joined[t] are active in month t
+    if join_month is None:
+        join_month = np.zeros(n_sites, dtype=np.int64)
+    join_order = np.argsort(join_month, kind='stable')
+    n_joined = np.searchsorted(join_month[join_order], month, side='left')
+
+    rows = np.repeat(np.arange(len(site)), n_random)
+    neg_category, neg_month, neg_joined = category[rows], month[rows], n_joined[rows]
+    neg_site = np.empty(len(rows), dtype=np.int64)
+    neg_vendor = np.empty(len(rows), dtype=np.int64)
+
+    # sorted switch keys: membership is one binary search per draw
+    positive_keys = np.sort((month.astype(np.int64) * n_sites + site) * n_vendors + vendor)
+    redraw = np.arange(len(rows))
+    for _ in range(MAX_REDRAWS):
+        neg_site[redraw] = join_order[(rng.random(len(redraw)) * neg_joined[redraw]).astype(np.int64)]
+        slot = (rng.random(len(redraw)) * counts[neg_category[redraw]]).astype(np.int64)
+        neg_vendor[redraw] = tables['category_vendors'][neg_category[redraw], slot]
+
+        keys = (neg_month[redraw].astype(np.int64) * n_sites + neg_site[redraw]) * n_vendors + neg_vendor[redraw]
+        found = np.minimum(np.searchsorted(positive_keys, keys), len(positive_keys) - 1)
+        redraw = redraw[positive_keys[found] == keys]
+        if len(redraw) == 0:
+            break
+
+    keep = np.ones(len(rows), dtype=bool)
+    keep[redraw] = False
+    return neg_site[keep], neg_vendor[keep], neg_category[keep], neg_month[keep]
+
+
+def generate_switch_samples(sites_df, vendors_df, integration_df, contracts_df,
+                            start_date='2019-01-01', end_date='2024-12-31', seed=42,
+                            n_hard=NEGATIVES_PER_POSITIVE['hard'], n_random=NEGATIVES_PER_POSITIVE['random'],
+                            split_dates=None, integration_upgrades=None):
+    """Build positive and negative (site, vendor, month) samples with temporal splits.
+
+    Returns a dict of arrays per split ('train', 'val', 'test'), each with
+    site, vendor, category, month (indices), label and kind, plus the
+    site_ids, vendor_ids, categories and months needed to decode them.
+    """
+    split_dates = SPLIT_DATES if split_dates is None else split_dates
+    tables = encode_tables(sites_df, vendors_df, integration_df)
+    months = get_months(start_date, end_date)
+    rng = np.random.default_rng([seed, zlib.crc32(b'switch_samples')])
+
+    upgrades = None
+    if integration_upgrades is not None:
+        upgrades = encode_upgrades(integration_upgrades, tables, months)
+
+    *positives, previous = switch_events(contracts_df, tables, months)
+    parts = [
+        (positives, SAMPLE_KINDS['positive']),
+        (hard_negatives(tables, *positives, previous, n_hard, rng, upgrades), SAMPLE_KINDS['hard']),
+        (random_negatives(tables, *positives, n_random, rng, join_months(sites_df, months)),
+         SAMPLE_KINDS['random']),
+    ]
+
+    columns = {
+        name: np.concatenate([part[i] for part, _ in parts]).astype(np.int32)
+        for i, name in enumerate(['site', 'vendor', 'category', 'month'])
+    }
+    columns['kind'] = np.concatenate([np.full(len(part[0]), kind, dtype=np.int8) for part, kind in parts])
+    columns['label'] = (columns['kind'] == SAMPLE_KINDS['positive']).astype(np.int8)
+
+    # month order within each split, positives first within a month
+    order = np.lexsort((columns['kind'], columns['month']))
+    columns = {name: values[order] for name, values in columns.items()}
+
+    month_strs = np.array([m.strftime('%Y-%m-%d') for m in months])
+    val_start, test_start = np.searchsorted(month_strs, [split_dates['val'], split_dates['test']])
+    bounds = np.searchsorted(columns['month'], [val_start, test_start])
+
+    samples = {
+        'site_ids': np.asarray(tables['site_ids'], dtype=str),
+        'vendor_ids': np.asarray(tables['vendor_ids'], dtype=str),
+        'categories': np.asarray(tables['categories'], dtype=str),
+        'months': month_strs,
+    }
+    for split, rows in zip(['train', 'val', 'test'], np.split(np.arange(len(order)), bounds)):
+        samples[split] = {name: values[rows] for name, values in columns.items()}
+    return samples
+
+
+def save_switch_samples(samples, output_path='data/generated/switch_samples.npz'):
+    """Save samples as flat arrays (train_site, train_label, ..., site_ids, months)."""
+    arrays = {}
+    for name, value in samples.items():
+        if isinstance(value, dict):
+            arrays.update({f'{name}_{field}': values for field, values in value.items()})
+        else:
+            arrays[name] = value
+    np.savez(output_path, **arrays)
+
+    counts = ', '.join(f'{split} {len(samples[split]["label"])}' for split in ['train', 'val', 'test'])
+    print(f'Saved switch samples ({counts}) to {output_path}')
+
+
+def load_switch_samples(input_path='data/generated/switch_samples.npz'):
+    """Load saved samples back into per-split dicts."""
+    samples = {}
+    with np.load(input_path) as cached:
+        for name in cached.files:
+            split, _, field = name.partition('_')
+            if split in ('train', 'val', 'test'):
+                samples.setdefault(split, {})[field] = cached[name]
+            else:
+                samples[name] = cached[name]
+    return samples
+
+
+if __name__ == '__main__':
+    sites = pd.read_csv('data/generated/sites.csv')
+    vendors = pd.read_csv('data/generated/vendors.csv')
+    integration_matrix = pd.read_csv('data/generated/integration_matrix.csv')
+    contracts = pd.read_csv('data/generated/contracts_2019_2024.csv')
+
+    print('=== Building Switch Samples ===')
+    samples = generate_switch_samples(sites, vendors, integration_matrix, contracts, seed=42)
+
+    for split in ['train', 'val', 'test']:
+        labels = samples[split]['label']
+        print(f'{split}: {len(labels)} samples, {labels.sum()} positives')
+
+    save_switch_samples(samples)
@@ -0,0 +1,494 @@
+"""
+vectorized_engine.py -- array implementations of the switching and KPI mechanisms
+
+Author: Gregory Schwartz
+Date: December 2025
+
+Same causal mechanisms as simulate_switches.py and generate_kpis.py, but
+evaluated on integer-coded arrays (see encode_tables.py) for all sites and
+categories at once. The switch simulation is batched over K parameter
+configurations that share the same initial state and random draws.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .encode_tables import (
+    encode_tables, encode_assignments, get_months, selection_weights, onboarding_dates, join_months,
+)
+from .generate_kpis import (
+    KPI_REGISTRY, LEGACY_KPIS, kpi_rng, assign_vendor_effects, assign_site_baselines,
+    build_kpi_contributions, contribution_stack, contributions_from_quality,
+)
+from .simulate_switches import INTEGRATION_MULTIPLIERS, FATIGUE_MULTIPLIERS, CONTAGION_WINDOW
+from .integration_upgrades import encode_upgrades, upgrade_rows
+
+
+# fatigue bucket edges in months since last change
+FATIGUE_EDGES = [12, 24]
+
+
+def default_mechanism():
+    """Return the reference mechanism parameters as arrays."""
+    base_annual = np.array([0.05])
+    integration_mult = np.array([[INTEGRATION_MULTIPLIERS[q] for q in range(3)]])
+    fatigue_mult = np.array([[FATIGUE_MULTIPLIERS[b] for b in range(3)]])
+    return base_annual, integration_mult, fatigue_mult
+
+
+def draw_switch_uniforms(n_months, n_sites, n_categories, seed=42):
+    """Draw the hazard and vendor-choice uniforms for every site-category-month."""
+    rng = np.random.default_rng(seed)
+    hazard_u = rng.random((n_months, n_sites, n_categories))
+    choice_u = rng.random((n_months, n_sites, n_categories))
+    return hazard_u, choice_u
+
+
+def category_slot_weights(tables):
+    """Return site x category x slot selection weights (0 for padding)."""
+    slot_vendors = tables['category_vendors']
+    weights = selection_weights(tables)
+    return np.where(slot_vendors >= 0, weights[:, np.maximum(slot_vendors, 0)], 0.0)
+
+
+def sample_from_weights(weights, u):
+    """Inverse-CDF sample one column per row; returns (index, has_candidates)."""
+    cum = np.cumsum(weights, axis=1)
+    total = cum[:, -1]
+    picked = (cum <= (u * total)[:, None]).sum(axis=1)
+    return np.minimum(picked, weights.shape[1] - 1), total > 0
+
+
+def vendor_slots(tables):
+    """Return each vendor's slot within its category (column of category_vendors)."""
+    slot_vendors = tables['category_vendors']
+    n_vendors = len(tables['vendor_ids'])
+    return np.argmax(slot_vendors[tables['vendor_category']] == np.arange(n_vendors)[:, None], axis=1)
+
+
+def simulate_switch_batch(tables, initial_vendors, hazard_u, choice_u,
+                          base_annual, integration_mult, fatigue_mult,
+                          contagion=0.0, adjacency=None, upgrades=None, join_month=None):
+    """Simulate monthly switching for K parameter configurations at once.
+
+    initial_vendors is a site x category array of vendor indices, hazard_u and
+    choice_u are month x site x category uniforms shared by every config.
+    base_annual has shape (K,), integration_mult and fatigue_mult (K, 3).
+    contagion (scalar or (K,)) scales the share of neighbours in the sparse
+    site x site adjacency that switched the category recently. upgrades is
+    an encoded delta log (integration_upgrades.encode_upgrades); its rows
+    update a working quality matrix and the selection weights in place.
+    join_month (encode_tables.join_months) holds each site's onboarding
+    month: a site has no vendor before it and can switch only after it, and
+    each month's hazard is evaluated for the active sites only.
+    """
+    base_annual = np.atleast_1d(np.asarray(base_annual, dtype=np.float64))
+    integration_mult = np.atleast_2d(np.asarray(integration_mult, dtype=np.float64))
+    fatigue_mult = np.atleast_2d(np.asarray(fatigue_mult, dtype=np.float64))
+
+    n_configs = len(base_annual)
+    n_months, n_sites, n_categories = hazard_u.shape
+    contagion = np.broadcast_to(np.asarray(contagion, dtype=np.float64), (n_configs,))
+    use_contagion = bool(contagion.any())
+    if use_contagion and adjacency is None:
+        raise ValueError('contagion needs a neighbour adjacency')
+    quality_matrix = tables['quality']
+
+    slot_vendors = tables['category_vendors']
+    slot_weights = category_slot_weights(tables)
+
+    if upgrades is not None:
+        quality_matrix = quality_matrix.copy()
+        upgrade_category = tables['vendor_category'][upgrades['vendor']]
+        upgrade_slot = vendor_slots(tables)[upgrades['vendor']]
+        upgrade_weight = np.exp(0.5 * upgrades['quality'] + 0.3 * tables['vendor_tier'][upgrades['vendor']])
+
+    base_monthly = 1 - (1 - base_annual) ** (1 / 12)
+
+    join_month = np.zeros(n_sites, dtype=np.int64) if join_month is None else np.asarray(join_month)
+    join_sorted = np.sort(join_month)
+    active = np.array([], dtype=np.int64)
+
+    current = np.broadcast_to(initial_vendors, (n_configs, n_sites, n_categories)).copy()
+    last_change = np.broadcast_to(join_month[None, :, None], current.shape).copy()
+
+    history = np.empty((n_configs, n_months, n_sites, n_categories), dtype=np.int16)
+    history[:, 0] = current
+
+    switches_by_quality = np.zeros((n_configs, 3), dtype=np.int64)
+    switches_by_fatigue = np.zeros((n_configs, 3), dtype=np.int64)
+
+    config_idx = np.arange(n_configs)[:, None, None]
+
+    for t in range(1, n_months):
+        if upgrades is not None:
+            # rows effective by this month (month 0 rows land at t=1)
+            rows = upgrade_rows(upgrades, t) if t > 1 else slice(0, upgrade_rows(upgrades, 1).stop)
+            s, v = upgrades['site'][rows], upgrades['vendor'][rows]
+            quality_matrix[s, v] = upgrades['quality'][rows]
+            slot_weights[s, upgrade_category[rows], upgrade_slot[rows]] = upgrade_weight[rows]
+
+        # sites that joined before this month (the set only grows)
+        if np.searchsorted(join_sorted, t) != len(active):
+            active = np.flatnonzero(join_month < t)
+        if len(active) == 0:
+            history[:, t] = current
+            continue
+
+        live = current[:, active]
+        quality = quality_matrix[active[None, :, None], live]
+        bucket = np.digitize(t - last_change[:, active], FATIGUE_EDGES)
+
+        prob = (base_monthly[:, None, None] *
+                integration_mult[config_idx, quality] *
+                fatigue_mult[config_idx, bucket])
+
+        if use_contagion:
+            # share of neighbours that switched this category in the window
+            switched = last_change > join_month[None, :, None]
+            recent = (switched & (t - last_change <= CONTAGION_WINDOW)).astype(np.float64)
+            share = adjacency @ recent.transpose(1, 0, 2).reshape(n_sites, -1)
+            share = share.reshape(n_sites, n_configs, n_categories).transpose(1, 0, 2)
+            prob = prob * (1 + contagion[:, None, None] * share[:, active])
+
+        prob = np.minimum(prob, 1.0)
+
+        k, a, c = np.nonzero(hazard_u[t, active][None] < prob)
+        if len(k) > 0:
+            s = active[a]
+
+            # candidates exclude the current vendor
+            w = slot_weights[s, c]
+            w[slot_vendors[c] == live[k, a, c][:, None]] = 0.0
+
+            slot, has_candidates = sample_from_weights(w, choice_u[t, s, c])
+            k, a, s, c, slot = (k[has_candidates], a[has_candidates], s[has_candidates],
+                                c[has_candidates], slot[has_candidates])
+
+            np.add.at(switches_by_quality, (k, quality[k, a, c]), 1)
+            np.add.at(switches_by_fatigue, (k, bucket[k, a, c]), 1)
+
+            current[k, s, c] = slot_vendors[c, slot]
+            last_change[k, s, c] = t
+
+        history[:, t] = current
+
+    # no vendor before a site joins
+    history[:, np.arange(n_months)[:, None] < join_month[None, :]] = -1
+
+    result = {
+        'vendor_history': history,
+        'switches_by_quality': switches_by_quality,
+        'switches_by_fatigue': switches_by_fatigue,
+    }
+    return result
+
+
+def select_initial_vendors(tables, u):
+    """Pick each site's starting vendor per category (softmax) from site x category uniforms."""
+    slot_vendors = tables['category_vendors']
+    slot_weights = category_slot_weights(tables)
+    n_sites, n_categories, n_slots = slot_weights.shape
+
+    slot, _ = sample_from_weights(slot_weights.reshape(-1, n_slots), u.ravel())
+    category = np.tile(np.arange(n_categories), n_sites)
+    return slot_vendors[category, slot].reshape(n_sites, n_categories)
+
+
+def kpi_contribution_matrices(tables, vendor_effects, kpis=None):
+    """Return kpi x site x vendor contributions (effect + bonus)."""
+    return contributions_from_quality(tables['quality'], tables['vendor_ids'], vendor_effects, kpis)
+
+
+def site_baseline_matrix(site_baselines, site_ids, kpis=None):
+    """Return the kpi x site baseline array from assign_site_baselines output."""
+    kpis = list(KPI_REGISTRY) if kpis is None else kpis
+    return np.array([[site_baselines[s][f'baseline_{kpi}'] for s in site_ids] for kpi in kpis])
+
+
+def draw_kpi_noise(n_months, n_sites, seed=42, kpis=None):
+    """Draw kpi x month x site noise.
+
+    The original KPIs share one stream in registry order, every added KPI
+    has its own, so registering a KPI leaves the others' noise unchanged.
+    """
+    kpis = list(KPI_REGISTRY) if kpis is None else kpis
+    rng = np.random.default_rng(seed)
+
+    noise = np.empty((len(kpis), n_months, n_sites))
+    for k, kpi in enumerate(kpis):
+        source = rng if kpi in LEGACY_KPIS else kpi_rng(seed, kpi, 'noise')
+        noise[k] = source.normal(0, KPI_REGISTRY[kpi]['noise'], size=(n_months, n_sites))
+    return noise
+
+
+def contribution_upgrades(contributions, tables, months, kpis=None):
+    """Encode the upgrade rows of versioned contributions for generate_kpi_batch.
+
+    Returns None without upgrades, else month index, site, vendor, category
+    and the kpi x row change in contribution against the value in effect
+    just before (the base matrix or the cell's previous upgrade).
+    """
+    if 'upgrade_date' not in contributions or len(contributions['upgrade_date']) == 0:
+        return None
+    kpis = list(KPI_REGISTRY) if kpis is None else kpis
+
+    month_strs = np.array([m.strftime('%Y-%m-%d') for m in months])
+    t = np.searchsorted(month_strs, contributions['upgrade_date'], side='left')
+    site, vendor = contributions['upgrade_site'], contributions['upgrade_vendor']
+    new = np.stack([contributions[f'upgrade_{kpi}'] for kpi in kpis])
+
+    # previous value: the cell's earlier row if any, else the base matrix
+    order = np.lexsort((t, vendor, site))
+    same_cell = np.zeros(len(order), dtype=bool)
+    same_cell[1:] = (site[order][1:] == site[order][:-1]) & (vendor[order][1:] == vendor[order][:-1])
+    previous = np.stack([contributions[kpi][site, vendor] for kpi in kpis])
+    previous[:, order[1:][same_cell[1:]]] = new[:, order[:-1][same_cell[1:]]]
+
+    keep = np.flatnonzero(t < len(months))
+    keep = keep[np.argsort(t[keep], kind='stable')]
+    upgrades = {
+        't': t[keep],
+        'site': site[keep],
+        'vendor': vendor[keep],
+        'category': tables['vendor_category'][vendor[keep]],
+        'delta': (new - previous)[:, keep],
+    }
+    return upgrades
+
+
+def generate_kpi_batch(vendor_history, contributions, baselines, month_nums, noise, kpis=None,
+                       upgrades=None):
+    """Return clamped KPI values of shape (kpi, K, month, site).
+
+    vendor_history is (K, month, site, category) with -1 for no contract,
+    contributions is kpi x site x vendor, baselines kpi x site, month_nums
+    are calendar months (1-12) and noise is kpi x month x site. All KPIs
+    share one gather of the active vendors, reduced over categories one
+    month at a time so only the (kpi, K, month, site) result is held in
+    full. upgrades (contribution_upgrades) adds each upgraded cell's change
+    from its month on, wherever that vendor is active, so the contribution
+    matrices are never rebuilt.
+    """
+    kpis = list(KPI_REGISTRY) if kpis is None else kpis
+    n_kpis, n_sites, n_vendors = contributions.shape
+    n_configs, n_months = vendor_history.shape[:2]
+
+    # zero column for pairs without a contract
+    padded = np.zeros((n_kpis, n_sites, n_vendors + 1), dtype=contributions.dtype)
+    padded[:, :, :n_vendors] = contributions
+    padded = padded.reshape(n_kpis, -1)
+    site_offset = np.arange(n_sites)[None, :, None] * (n_vendors + 1)
+
+    totals = np.empty((n_kpis, n_configs, n_months, n_sites), dtype=contributions.dtype)
+    for t in range(n_months):
+        vendor = vendor_history[:, t]
+        flat = site_offset + np.where(vendor >= 0, vendor, n_vendors)
+        totals[:, :, t] = padded[:, flat].sum(axis=-1)
+
+    if upgrades is not None:
+        for t in np.unique(upgrades['t']):
+            rows = upgrade_rows(upgrades, t)
+            site = upgrades['site'][rows]
+            active = vendor_history[:, t:, site, upgrades['category'][rows]] == upgrades['vendor'][rows]
+            for k in range(n_kpis):
+                np.add.at(totals[k], (slice(None), slice(t, None), site), active * upgrades['delta'][k, rows])
+
+    # seasonality
+    amplitude = np.array([KPI_REGISTRY[kpi]['seasonality'] for kpi in kpis])
+    phase = np.sin(2 * np.pi * np.asarray(month_nums) / 12)
+    season = amplitude[:, None, None, None] * phase[None, None, :, None]
+
+    # in place: no full-size temporaries besides the result
+    values = np.add(baselines[:, None, None, :], totals)
+    del totals
+    values += season
+    values += noise[:, None]
+
+    # clamp to realistic
+    low, high = np.array([KPI_REGISTRY[kpi]['bounds'] for kpi in kpis]).T
+    return np.clip(values, low[:, None, None, None], high[:, None, None, None], out=values)
+
+
+def contracts_from_history(vendor_history, tables, months, order='chronological'):
+    """Convert a month x site x category vendor history into contract records.
+
+    order='chronological' matches simulate_switches (initial contracts, then
+    switches by month, ids C00001...). order='site' groups each site's
+    contracts together with per-site ids (S001-C01...), so adding sites
+    never renumbers existing contracts.
+    """
+    month_strs = np.array([m.strftime('%Y-%m-%d') for m in months], dtype=object)
+
+    # contract starts: each pair's first month with a vendor (-1 before a
+    # site joins), then every change
+    held = vendor_history >= 0
+    starts = held.copy()
+    starts[1:] &= vendor_history[1:] != vendor_history[:-1]
+    start_t, site, category = np.nonzero(starts)
+    vendor = vendor_history[start_t, site, category]
+    initial = (start_t == 0) | ~held[np.maximum(start_t - 1, 0), site, category]
+
+    # each contract ends when the next one for the same pair starts
+    by_pair = np.lexsort((start_t, category, site))
+    end_t = np.full(len(start_t), -1, dtype=np.int64)
+    same_pair = ((site[by_pair][1:] == site[by_pair][:-1]) &
+                 (category[by_pair][1:] == category[by_pair][:-1]))
+    end_t[by_pair[:-1][same_pair]] = start_t[by_pair[1:][same_pair]]
+
+    if order == 'site':
+        rows = np.lexsort((category, start_t, site))
+    else:
+        rows = np.lexsort((category, site, start_t, ~initial))
+
+    site_ids = tables['site_ids'][site[rows]]
+    end_dates = np.where(end_t[rows] >= 0, month_strs[np.maximum(end_t[rows], 0)], None)
+
+    contracts_df = pd.DataFrame({
+        'site_id': site_ids,
+        'category': tables['categories'][category[rows]],
+        'vendor_id': tables['vendor_ids'][vendor[rows]],
+        'contract_start_date': month_strs[start_t[rows]],
+        'contract_end_date': end_dates,
+    })
+
+    if order == 'site':
+        number = contracts_df.groupby('site_id').cumcount() + 1
+        contract_ids = [f'{site_id}-C{k:02d}' for site_id, k in zip(site_ids, number)]
+    else:
+        contract_ids = [f'C{i + 1:05d}' for i in range(len(contracts_df))]
+    contracts_df.insert(0, 'contract_id', contract_ids)
+
+    return contracts_df
+
+
+def kpi_frame(values, tables, months, kpis=None, join_month=None):
+    """Return kpi x month x site arrays as site-major rows like generate_kpis.
+
+    With join_month, months before each site joined are left out.
+    """
+    kpis = list(KPI_REGISTRY) if kpis is None else kpis
+    n_months, n_sites = values.shape[1:]
+
+    kpis_df = pd.DataFrame({
+        'site_id': np.repeat(tables['site_ids'], n_months),
+        'month': np.tile([m.strftime('%Y-%m-%d') for m in months], n_sites),
+    })
+    for k, kpi in enumerate(kpis):
+        kpis_df[kpi] = np.round(values[k].T.ravel(), 2)
+
+    if join_month is not None:
+        active = np.arange(n_months)[None, :] >= np.asarray(join_month)[:, None]
+        kpis_df = kpis_df[active.ravel()].reset_index(drop=True)
+    return kpis_df
+
+
+def active_vendor_history(contracts_df, tables, months, lag_switch_month=True):
+    """Return the month x site x category vendor that generate_kpis sees.
+
+    Mirrors get_active_vendor: contracts cover [start, end] inclusive and the
+    earliest match wins, so a switch shows up from the month after it starts
+    (a site's first contract counts from its start month). With
+    lag_switch_month=False the new vendor counts from its start month, which
+    is the state simulate_switches holds.
+    """
+    site_index = pd.Index(tables['site_ids'])
+    vendor_index = pd.Index(tables['vendor_ids'])
+    category_index = pd.Index(tables['categories'])
+    month_index = pd.Index([m.strftime('%Y-%m-%d') for m in months])
+
+    n_months = len(months)
+    n_sites, n_categories = len(site_index), len(category_index)
+
+    site = site_index.get_indexer(contracts_df['site_id'])
+    category = category_index.get_indexer(contracts_df['category'])
+    vendor = vendor_index.get_indexer(contracts_df['vendor_id'])
+    start_t = month_index.get_indexer(contracts_df['contract_start_date'])
+
+    # a switch takes over the month after its start, a first contract at once
+    by_pair = np.lexsort((start_t, category, site))
+    first = np.ones(len(by_pair), dtype=bool)
+    first[by_pair[1:]] = ((site[by_pair][1:] != site[by_pair][:-1]) |
+                          (category[by_pair][1:] != category[by_pair][:-1]))
+    effective_t = np.where(first, start_t, start_t + int(lag_switch_month))
+    keep = (site >= 0) & (start_t >= 0) & (effective_t < n_months)
+
+    # forward-fill contract rank over time, later starts rank higher
+    rank = np.full((n_months, n_sites, n_categories), -1, dtype=np.int64)
+    order = np.flatnonzero(keep)[np.argsort(start_t[keep], kind='stable')]
+    rank[effective_t[order], site[order], category[order]] = np.arange(len(order))
+    rank = np.maximum.accumulate(rank, axis=0)
+
+    ranked_vendor = vendor[order]
+    history = np.where(rank >= 0, ranked_vendor[np.maximum(rank, 0)], -1)
+    return history
+
+
+def generate_initial_state_vectorized(sites_df, vendors_df, integration_df, seed=42, start_date='2019-01-01'):
+    """Array version of generate_initial_state."""
+    tables = encode_tables(sites_df, vendors_df, integration_df)
+    rng = np.random.default_rng(seed)
+
+    initial_vendors = select_initial_vendors(tables, rng.random((len(tables['site_ids']), len(tables['categories']))))
+
+    initial_df = pd.DataFrame({
+        'site_id': np.repeat(tables['site_ids'], len(tables['categories'])),
+        'category': np.tile(tables['categories'], len(tables['site_ids'])),
+        'vendor_id': tables['vendor_ids'][initial_vendors.ravel()],
+        'contract_start_date': np.repeat(onboarding_dates(sites_df, start_date), len(tables['categories'])),
+    })
+    return initial_df
+
+
+def simulate_switches_vectorized(sites_df, vendors_df, integration_df, initial_state_df,
+                                 start_date='2019-01-01', end_date='2024-12-31', seed=42,
+                                 base_annual=0.05, contagion=0.0, adjacency=None,
+                                 integration_upgrades=None):
+    """Array version of simulate_switches (same contract layout)."""
+    tables = encode_tables(sites_df, vendors_df, integration_df)
+    initial_vendors = encode_assignments(initial_state_df, tables)
+    months = get_months(start_date, end_date)
+
+    upgrades = None
+    if integration_upgrades is not None:
+        upgrades = encode_upgrades(integration_upgrades, tables, months)
+
+    hazard_u, choice_u = draw_switch_uniforms(len(months), *initial_vendors.shape, seed=seed)
+
+    _, integration_mult, fatigue_mult = default_mechanism()
+    sim = simulate_switch_batch(
+        tables, initial_vendors, hazard_u, choice_u,
+        [base_annual], integration_mult, fatigue_mult, contagion, adjacency, upgrades,
+        join_months(sites_df, months)
+    )
+
+    return contracts_from_history(sim['vendor_history'][0], tables, months)
+
+
+def generate_kpis_vectorized(sites_df, vendors_df, integration_df, contracts_df,
+                             start_date='2019-01-01', end_date='2024-12-31', seed=42,
+                             contributions=None, integration_upgrades=None):
+    """Array version of generate_kpis for every registered KPI.
+
+    Same baselines and effects as the reference loop, own noise stream.
+    """
+    tables = encode_tables(sites_df, vendors_df, integration_df)
+    months = get_months(start_date, end_date)
+    n_months, n_sites = len(months), len(tables['site_ids'])
+
+    if contributions is None:
+        contributions = build_kpi_contributions(
+            sites_df, vendors_df, integration_df, assign_vendor_effects(vendors_df, seed),
+            upgrades_df=integration_upgrades
+        )
+
+    baselines = site_baseline_matrix(assign_site_baselines(sites_df, seed), tables['site_ids'])
+    noise = draw_kpi_noise(n_months, n_sites, seed)
+
+    history = active_vendor_history(contracts_df, tables, months)
+    values = generate_kpi_batch(
+        history[None], contribution_stack(contributions), baselines,
+        [m.month for m in months], noise, upgrades=contribution_upgrades(contributions, tables, months)
+    )
+
+    return kpi_frame(values[:, 0], tables, months, join_month=join_months(sites_df, months))